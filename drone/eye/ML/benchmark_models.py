@@ -0,0 +1,196 @@
+"""
+Headless benchmark of the model exports. Every combination of the given models
+and settings runs on the OAK for a while, and the steady state NN fps, the
+latency from capture to host (from the device timestamps) and the host CPU load
+are written to a CSV and a JSON file. When no OAK is attached, the IR of every
+model is benchmarked on the CPU instead.
+
+Usage:
+    python benchmark_models.py results/conversion_result_17 results/conversion_result_27 --fps 15 30 --threads 1 2
+"""
+
+from pathlib import Path
+from itertools import product
+from typing import Dict, List
+import argparse
+import csv
+import json
+import os
+import statistics
+import sys
+import time
+import depthai as dai
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parents[2].joinpath("main", "src")))
+from models import ModelSpec # type: ignore
+
+def summarize(model: ModelSpec, settings: Dict, latencies: List[float], frames: int, seconds: float, cpuSeconds: float) -> Dict:
+    return {
+        "model": model.name,
+        **settings,
+        "nn_fps": frames / seconds if seconds > 0 else 0.0,
+        "latency_mean_ms": statistics.mean(latencies) * 1000 if len(latencies) > 0 else None,
+        "latency_p95_ms": float(np.percentile(latencies, 95)) * 1000 if len(latencies) > 0 else None,
+        "host_cpu_percent": 100.0 * cpuSeconds / seconds if seconds > 0 else 0.0,
+        "load_average": os.getloadavg()[0]
+    }
+
+def benchmarkDevice(model: ModelSpec, fps: float, threads: int, preview: int, usb2: bool, warmup: float, seconds: float) -> Dict:
+    (inputWidth, inputHeight) = model.inputSize
+
+    pipeline = dai.Pipeline()
+    camRgb = pipeline.create(dai.node.ColorCamera)
+    detectionNetwork = pipeline.create(dai.node.YoloDetectionNetwork)
+    nnOut = pipeline.create(dai.node.XLinkOut)
+    nnOut.setStreamName("nn")
+
+    camRgb.setPreviewKeepAspectRatio(False)
+    camRgb.setPreviewSize(preview, preview)
+    camRgb.setResolution(dai.ColorCameraProperties.SensorResolution.THE_1080_P)
+    camRgb.setInterleaved(False)
+    camRgb.setColorOrder(dai.ColorCameraProperties.ColorOrder.BGR)
+    camRgb.setFps(fps)
+
+    model.configure(detectionNetwork)
+    detectionNetwork.setNumInferenceThreads(threads)
+    detectionNetwork.input.setBlocking(False)
+
+    if (preview, preview) != (inputWidth, inputHeight):
+        # The NN input size is fixed, so bigger previews are scaled down on the device
+        manip = pipeline.create(dai.node.ImageManip)
+        manip.initialConfig.setResize(inputWidth, inputHeight)
+        manip.initialConfig.setKeepAspectRatio(False)
+        camRgb.preview.link(manip.inputImage)
+        manip.out.link(detectionNetwork.input)
+    else:
+        camRgb.preview.link(detectionNetwork.input)
+    detectionNetwork.out.link(nnOut.input)
+
+    latencies: List[float] = []
+    frames = 0
+    with dai.Device(pipeline, usb2Mode=usb2) as device:
+        qDet = device.getOutputQueue(name="nn", maxSize=4, blocking=False)
+
+        # Let the pipeline settle before measuring. Never blocks on the queue,
+        # a pipeline that stalls can't hang the benchmark past its deadline.
+        warmupEnd = time.monotonic() + warmup
+        warmedUp = False
+        while time.monotonic() < warmupEnd:
+            if qDet.tryGet() is None:
+                time.sleep(0.001)
+            else:
+                warmedUp = True
+        if not warmedUp:
+            raise TimeoutError("No NN results during the warmup")
+
+        startTime = time.monotonic()
+        startCpu = time.process_time()
+        while time.monotonic() - startTime < seconds:
+            inDet = qDet.tryGet()
+            if inDet is None:
+                time.sleep(0.001)
+                continue
+            latencies.append((dai.Clock.now() - inDet.getTimestamp()).total_seconds())
+            frames += 1
+        elapsed = time.monotonic() - startTime
+        cpuSeconds = time.process_time() - startCpu
+
+    settings = { "backend": "oak", "fps": fps, "threads": threads, "preview": preview, "usb2": usb2 }
+    return summarize(model, settings, latencies, frames, elapsed, cpuSeconds)
+
+def benchmarkCpu(model: ModelSpec, jobs: int, batchSize: int, warmup: float, seconds: float) -> Dict:
+    from cpu_optics import CpuDetector, decodeYolo, intoPixelDetections # type: ignore
+
+    detector = CpuDetector(model, batchSize=batchSize, jobs=jobs)
+    (width, height) = model.inputSize
+    batch = detector.makeBatch([np.random.randint(0, 255, (height, width, 3), np.uint8)] * batchSize)
+
+    latencies: List[float] = []
+    frames = 0
+    measuring = False
+
+    def done(request, submitted: float) -> None:
+        nonlocal frames
+        for outputs in detector.outputsOf(request, batchSize):
+            intoPixelDetections(*decodeYolo(outputs, model), model)
+        if measuring:
+            latencies.append(time.monotonic() - submitted)
+            frames += batchSize
+
+    detector.inferQueue.set_callback(done)
+    warmupEnd = time.monotonic() + warmup
+    while time.monotonic() < warmupEnd:
+        detector.inferQueue.start_async(batch, time.monotonic())
+    detector.inferQueue.wait_all()
+
+    measuring = True
+    startTime = time.monotonic()
+    startCpu = time.process_time()
+    while time.monotonic() - startTime < seconds:
+        detector.inferQueue.start_async(batch, time.monotonic())
+    detector.inferQueue.wait_all()
+    elapsed = time.monotonic() - startTime
+    cpuSeconds = time.process_time() - startCpu
+
+    settings = { "backend": "cpu", "jobs": jobs, "batch": batchSize }
+    return summarize(model, settings, latencies, frames, elapsed, cpuSeconds)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("models", type=Path, nargs="+", help="Model export directories, holding a best.json")
+    parser.add_argument("--fps", type=float, nargs="+", default=[15], help="Camera fps")
+    parser.add_argument("--threads", type=int, nargs="+", default=[2], help="NN inference threads on the OAK, or inference jobs on the CPU")
+    parser.add_argument("--preview", type=int, nargs="+", default=[416], help="Square preview sizes")
+    parser.add_argument("--usb2", choices=["on", "off", "both"], default="on", help="USB2 mode")
+    parser.add_argument("--batch", type=int, nargs="+", default=[1], help="Batch sizes, CPU only")
+    parser.add_argument("--warmup", type=float, default=5.0, help="Seconds before measuring")
+    parser.add_argument("--seconds", type=float, default=20.0, help="Seconds to measure for")
+    parser.add_argument("--cpu", action="store_true", help="Benchmark on the CPU even if an OAK is attached")
+    parser.add_argument("--out", type=Path, default=Path("benchmark"), help="Written as .csv and .json")
+    args = parser.parse_args()
+
+    useDevice = not args.cpu and len(dai.Device.getAllAvailableDevices()) > 0
+    if not useDevice:
+        print("Benchmarking on the CPU.")
+    usb2Modes = { "on": [True], "off": [False], "both": [True, False] }[args.usb2]
+
+    results: List[Dict] = []
+    for modelDir in args.models:
+        model = ModelSpec.load(modelDir)
+        if model.err() is not None:
+            print("Skipping " + str(modelDir) + ": " + str(model.err()))
+            continue
+        model = model.unwrap()
+        if useDevice:
+            runs = [
+                (lambda f=f, t=t, p=p, u=u: benchmarkDevice(model, f, t, p, u, args.warmup, args.seconds))
+                for (f, t, p, u) in product(args.fps, args.threads, args.preview, usb2Modes)
+            ]
+        else:
+            runs = [
+                (lambda t=t, b=b: benchmarkCpu(model, t, b, args.warmup, args.seconds))
+                for (t, b) in product(args.threads, args.batch)
+            ]
+        for run in runs:
+            try:
+                result = run()
+            except Exception as e:
+                print("Failed benchmarking " + str(modelDir) + ": " + str(e.args))
+                continue
+            print(json.dumps(result))
+            results.append(result)
+
+    if len(results) == 0:
+        return
+    args.out.with_suffix(".json").write_text(json.dumps(results, indent=4))
+    fields: List[str] = []
+    for result in results:
+        fields += [key for key in result if key not in fields]
+    with args.out.with_suffix(".csv").open("w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(results)
+
+if __name__ == "__main__":
+    main()
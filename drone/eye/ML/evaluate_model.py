@@ -0,0 +1,325 @@
+"""
+Evaluates model exports against a labelled validation set, on the CPU through
+their IR (best.xml). The set is in the YOLO format (an `images` folder next to
+a `labels` folder of `class cx cy w h` lines), and may be split by altitude
+into folders named like `5m`, `12.5m`. For every model, the precision, recall
+and AP of each pad type, the error of the box centres in pixels at every
+altitude and the time spent in each stage (image decoding, preprocessing,
+inference, YOLO decoding + NMS) are written to a CSV, along with a summary
+ranking the models by mAP per millisecond of inference.
+
+Usage:
+    python evaluate_model.py results/conversion_result_17 results/conversion_result_27 --data /path/to/valid
+"""
+
+from pathlib import Path
+from functools import partial
+from multiprocessing import Pool
+from typing import Dict, List, Tuple
+import argparse
+import csv
+import os
+import re
+import sys
+import time
+import cv2
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parents[2].joinpath("main", "src")))
+from cpu_optics import CpuDetector, decodeYolo, nms, preprocess, IMAGE_SUFFIXES # type: ignore
+from models import ModelSpec # type: ignore
+from optics import PadType # type: ignore
+
+# The IoU thresholds mAP is averaged over, COCO style
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+
+ALTITUDE_PATTERN = re.compile(r"^(\d+(?:\.\d+)?)m$")
+
+class Sample:
+    """
+    A labelled image of the validation set. `boxes` are normalized
+    (xmin, ymin, xmax, ymax) and `classes` index into the label names of the set.
+    """
+
+    imagePath: Path
+    altitude: str
+    boxes: np.ndarray
+    classes: np.ndarray
+
+    def __init__(self, imagePath: Path, altitude: str, boxes: np.ndarray, classes: np.ndarray) -> None:
+        self.imagePath = imagePath
+        self.altitude = altitude
+        self.boxes = boxes
+        self.classes = classes
+
+def readLabels(labelPath: Path) -> Tuple[np.ndarray, np.ndarray]:
+    if not labelPath.exists():
+        # An image without labels has no pads in it
+        return (np.zeros((0, 4), np.float32), np.zeros(0, np.int64))
+    rows = np.loadtxt(labelPath, dtype=np.float32, ndmin=2)
+    if rows.size == 0:
+        return (np.zeros((0, 4), np.float32), np.zeros(0, np.int64))
+    (cx, cy, w, h) = rows[:, 1], rows[:, 2], rows[:, 3], rows[:, 4]
+    boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+    return (boxes, rows[:, 0].astype(np.int64))
+
+def findSamples(root: Path) -> List[Sample]:
+    """
+    Finds every image under `root` that sits in an `images` folder, along with
+    its labels and the altitude folder it's in (or "all").
+    """
+    samples: List[Sample] = []
+    for imagePath in sorted(root.rglob("*")):
+        if imagePath.suffix.lower() not in IMAGE_SUFFIXES or imagePath.parent.name != "images":
+            continue
+        labelPath = imagePath.parent.parent.joinpath("labels", imagePath.stem + ".txt")
+        altitude = "all"
+        for part in imagePath.relative_to(root).parts:
+            if ALTITUDE_PATTERN.match(part):
+                altitude = part
+                break
+        samples.append(Sample(imagePath, altitude, *readLabels(labelPath)))
+    return samples
+
+def loadSample(imagePath: Path, inputSize: Tuple[int, int]) -> Tuple[np.ndarray | None, Tuple[int, int], float, float]:
+    """
+    Runs in the loader processes. Returns the NN input of an image, the size
+    of the image, and the seconds spent decoding and preprocessing it.
+    """
+    startTime = time.perf_counter()
+    frame = cv2.imread(str(imagePath), cv2.IMREAD_COLOR)
+    decoded = time.perf_counter()
+    if frame is None:
+        return (None, (0, 0), decoded - startTime, 0.0)
+    nnInput = preprocess(frame, inputSize)
+    return (nnInput, (frame.shape[1], frame.shape[0]), decoded - startTime, time.perf_counter() - decoded)
+
+def boxIou(box: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+    xmin = np.maximum(box[0], boxes[:, 0])
+    ymin = np.maximum(box[1], boxes[:, 1])
+    xmax = np.minimum(box[2], boxes[:, 2])
+    ymax = np.minimum(box[3], boxes[:, 3])
+    intersection = np.clip(xmax - xmin, 0, None) * np.clip(ymax - ymin, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return intersection / np.maximum(area + areas - intersection, 1e-12)
+
+def averagePrecision(truePositives: np.ndarray, scores: np.ndarray, groundTruths: int) -> float:
+    """
+    The area under the precision/recall curve of a class, with the precision
+    made monotonic (all points interpolation).
+    """
+    if groundTruths == 0:
+        return float("nan")
+    if len(scores) == 0:
+        return 0.0
+    order = scores.argsort()[::-1]
+    hits = np.cumsum(truePositives[order])
+    recall = np.concatenate([[0.0], hits / groundTruths, [1.0]])
+    precision = np.concatenate([[1.0], hits / np.arange(1, len(hits) + 1), [0.0]])
+    precision = np.maximum.accumulate(precision[::-1])[::-1]
+    return float(np.sum((recall[1:] - recall[:-1]) * precision[1:]))
+
+class Matches:
+    """
+    Every detection of one pad type over the set, matched against the ground
+    truth at every IoU threshold.
+    """
+
+    scores: List[float]
+    truePositives: List[np.ndarray]
+    centreErrors: Dict[str, List[float]]
+    groundTruths: Dict[str, int]
+    found: Dict[str, int]
+
+    def __init__(self) -> None:
+        self.scores = []
+        self.truePositives = []
+        self.centreErrors = {}
+        self.groundTruths = {}
+        self.found = {}
+
+def matchImage(
+        matches: Dict[PadType, Matches],
+        sample: Sample,
+        imageSize: Tuple[int, int],
+        names: List[PadType],
+        padTypes: List[PadType],
+        boxes: np.ndarray,
+        scores: np.ndarray
+    ) -> None:
+    """
+    Greedily matches the detections of an image to its labels, best score
+    first, once per IoU threshold. Centre errors are taken at IoU 0.5, in
+    pixels of the original image.
+    """
+    truthTypes = [names[c] for c in sample.classes]
+    scale = np.array(imageSize, np.float32)
+    for padType in set(padTypes) | set(truthTypes):
+        stats = matches.setdefault(padType, Matches())
+        truths = sample.boxes[[t == padType for t in truthTypes]]
+        stats.groundTruths[sample.altitude] = stats.groundTruths.get(sample.altitude, 0) + len(truths)
+        stats.centreErrors.setdefault(sample.altitude, [])
+
+        mine = np.array([i for (i, p) in enumerate(padTypes) if p == padType], np.int64)
+        mine = mine[scores[mine].argsort()[::-1]] if len(mine) > 0 else mine
+        taken = np.zeros((len(IOU_THRESHOLDS), len(truths)), bool)
+        for i in mine:
+            hit = np.zeros(len(IOU_THRESHOLDS), bool)
+            if len(truths) > 0:
+                ious = boxIou(boxes[i], truths)
+                for (t, threshold) in enumerate(IOU_THRESHOLDS):
+                    candidates = np.where((ious >= threshold) & ~taken[t], ious, -1.0)
+                    best = int(candidates.argmax())
+                    if candidates[best] >= 0:
+                        taken[t, best] = True
+                        hit[t] = True
+                        if t == 0:
+                            detected = (boxes[i, :2] + boxes[i, 2:]) / 2 * scale
+                            truth = (truths[best, :2] + truths[best, 2:]) / 2 * scale
+                            stats.centreErrors[sample.altitude].append(float(np.linalg.norm(detected - truth)))
+            stats.scores.append(float(scores[i]))
+            stats.truePositives.append(hit)
+        stats.found[sample.altitude] = stats.found.get(sample.altitude, 0) + int(taken[0].sum())
+
+def evaluate(model: ModelSpec, samples: List[Sample], names: List[PadType], workers: int) -> Tuple[List[Dict], Dict]:
+    """
+    Runs a model over the samples, with the images loaded by `workers`
+    processes while the model infers. Returns a row per pad type and altitude,
+    and the summary of the model.
+    """
+    detector = CpuDetector(model, batchSize=1, jobs=1)
+    request = detector.compiled.create_infer_request()
+    matches: Dict[PadType, Matches] = {}
+    timings = { "decode": 0.0, "preprocess": 0.0, "infer": 0.0, "nms": 0.0 }
+    images = 0
+
+    with Pool(workers) as pool:
+        loaded = pool.imap(partial(loadSample, inputSize=model.inputSize), [s.imagePath for s in samples], chunksize=4)
+        for (sample, (nnInput, imageSize, decodeSeconds, preprocessSeconds)) in zip(samples, loaded):
+            if nnInput is None:
+                print("Unable to read " + str(sample.imagePath))
+                continue
+            startTime = time.perf_counter()
+            request.infer({ 0: nnInput[None] })
+            inferred = time.perf_counter()
+            (outputs,) = detector.outputsOf(request, 1)
+            (boxes, scores, labels) = decodeYolo(outputs, model)
+            keep = [i for i in nms(boxes, scores, labels, model.iouThreshold) if model.intoPadType(int(labels[i])) is not None]
+            padTypes = [model.intoPadType(int(labels[i])) for i in keep]
+            suppressed = time.perf_counter()
+
+            timings["decode"] += decodeSeconds
+            timings["preprocess"] += preprocessSeconds
+            timings["infer"] += inferred - startTime
+            timings["nms"] += suppressed - inferred
+            images += 1
+            matchImage(matches, sample, imageSize, names, padTypes, boxes[keep], scores[keep])
+
+    msPerImage = { stage: 1000 * seconds / max(images, 1) for (stage, seconds) in timings.items() }
+    rows: List[Dict] = []
+    aps: List[float] = []
+    apsStrict: List[float] = []
+    for padType in sorted(matches, key=lambda p: p.value):
+        stats = matches[padType]
+        scores = np.array(stats.scores, np.float32)
+        truePositives = np.array(stats.truePositives, bool).reshape(-1, len(IOU_THRESHOLDS))
+        groundTruths = sum(stats.groundTruths.values())
+        perThreshold = [averagePrecision(truePositives[:, t], scores, groundTruths) for t in range(len(IOU_THRESHOLDS))]
+        if groundTruths > 0:
+            aps.append(perThreshold[0])
+            apsStrict.append(float(np.mean(perThreshold)))
+        hits = int(truePositives[:, 0].sum())
+
+        for altitude in ["all"] + sorted(a for a in stats.groundTruths if a != "all"):
+            if altitude == "all":
+                errors = [e for es in stats.centreErrors.values() for e in es]
+                truths = groundTruths
+                found = sum(stats.found.values())
+            else:
+                errors = stats.centreErrors[altitude]
+                truths = stats.groundTruths[altitude]
+                found = stats.found[altitude]
+            row = {
+                "model": model.name,
+                "pad": padType.value,
+                "altitude": altitude,
+                "labels": truths,
+                "recall": found / truths if truths > 0 else None,
+                "centre_error_mean_px": float(np.mean(errors)) if len(errors) > 0 else None,
+                "centre_error_p95_px": float(np.percentile(errors, 95)) if len(errors) > 0 else None
+            }
+            if altitude == "all":
+                # Which detections are false positives at a given altitude can't be told apart
+                row["precision"] = hits / len(scores) if len(scores) > 0 else None
+                row["ap50"] = perThreshold[0]
+                row["ap50_95"] = float(np.mean(perThreshold))
+            rows.append(row)
+
+    map50 = float(np.mean(aps)) if len(aps) > 0 else 0.0
+    # The OAK gets frames straight from the camera, so decoding isn't counted
+    deviceMs = msPerImage["preprocess"] + msPerImage["infer"] + msPerImage["nms"]
+    summary = {
+        "model": model.name,
+        "images": images,
+        "map50": map50,
+        "map50_95": float(np.mean(apsStrict)) if len(apsStrict) > 0 else 0.0,
+        **{ stage + "_ms": ms for (stage, ms) in msPerImage.items() },
+        "map50_per_ms": map50 / deviceMs if deviceMs > 0 else 0.0
+    }
+    return (rows, summary)
+
+def writeCsv(path: Path, rows: List[Dict]) -> None:
+    fields: List[str] = []
+    for row in rows:
+        fields += [key for key in row if key not in fields]
+    with path.open("w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("models", type=Path, nargs="+", help="Model export directories, holding a best.json and best.xml")
+    parser.add_argument("--data", type=Path, required=True, help="The validation set, in the YOLO format")
+    parser.add_argument("--names", nargs="+", help="The pad types the class ids of the set stand for, defaults to the labels of each model")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Image loader processes")
+    parser.add_argument("--out", type=Path, default=Path("evaluation"), help="Written as .csv, and _summary.csv")
+    args = parser.parse_args()
+
+    samples = findSamples(args.data)
+    if len(samples) == 0:
+        print("There are no labelled images in " + str(args.data))
+        return
+    altitudes = sorted(set(s.altitude for s in samples))
+    print("Evaluating on " + str(len(samples)) + " images at altitudes " + ", ".join(altitudes))
+
+    rows: List[Dict] = []
+    summaries: List[Dict] = []
+    for modelDir in args.models:
+        model = ModelSpec.load(modelDir)
+        if model.err() is not None:
+            print("Skipping " + str(modelDir) + ": " + str(model.err()))
+            continue
+        model = model.unwrap()
+        names = [PadType(n.replace("_", " ")) for n in args.names] if args.names is not None else model.labels
+        try:
+            (modelRows, summary) = evaluate(model, samples, names, args.workers)
+        except Exception as e:
+            print("Failed evaluating " + str(modelDir) + ": " + str(e.args))
+            continue
+        print("{}: mAP@0.5 {:.3f}, mAP@0.5:0.95 {:.3f}, {:.1f} ms inference".format(
+            model.name, summary["map50"], summary["map50_95"], summary["infer_ms"]
+        ))
+        rows += modelRows
+        summaries.append(summary)
+
+    if len(summaries) == 0:
+        return
+    summaries.sort(key=lambda s: s["map50_per_ms"], reverse=True)
+    writeCsv(args.out.with_suffix(".csv"), rows)
+    writeCsv(args.out.with_name(args.out.name + "_summary.csv"), summaries)
+    print("Best accuracy per millisecond: " + summaries[0]["model"])
+
+if __name__ == "__main__":
+    main()
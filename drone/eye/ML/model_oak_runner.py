@@ -5,16 +5,14 @@ import depthai as dai
 import numpy as np
 import time
 
-nnPath = "results\\conversion_result_17\\best_openvino_2022.1_6shave.blob"
+sys.path.append(str(Path(__file__).resolve().parents[2].joinpath("main", "src")))
+from models import ModelSpec # type: ignore
 
-labelMap = [
-    "bottle_dropoff",
-    "bottle_pickup",
-    "medkit_dropoff",
-    "medkit_pickup",
-    "smores_dropoff",
-    "smores_pickup",
-]
+# Any model export, as a directory or its blob, can be run by passing it in
+modelPath = Path(sys.argv[1]) if len(sys.argv) > 1 else Path(__file__).parent.joinpath("results", "conversion_result_17")
+model = ModelSpec.load(modelPath).unwrap()
+
+labelMap = [label.value for label in model.labels]
 
 syncNN = True
 
@@ -31,29 +29,14 @@ xoutRgb.setStreamName("rgb")
 nnOut.setStreamName("nn")
 
 # Properties
-camRgb.setPreviewSize(416, 416)
+camRgb.setPreviewSize(*model.inputSize)
 camRgb.setResolution(dai.ColorCameraProperties.SensorResolution.THE_1080_P)
 camRgb.setInterleaved(False)
 camRgb.setColorOrder(dai.ColorCameraProperties.ColorOrder.BGR)
 camRgb.setFps(40)
 
 # Network specific settings
-detectionNetwork.setConfidenceThreshold(0.5)
-detectionNetwork.setNumClasses(6)
-detectionNetwork.setCoordinateSize(4)
-detectionNetwork.setAnchors([
-    4.3203125, 51.78125, 56.59375, 4.80859375, 12.1171875, 43.625, 41.25, 19.46875, 25.203125, 34.4375, 25.953125, 76.625, 52.3125, 39.3125, 108.875, 55.4375, 70.1875, 100.875
-])
-detectionNetwork.setAnchorMasks(
-    {
-        "side52": [0, 1, 2], 
-        "side26": [3, 4, 5], 
-        "side13": [6, 7, 8]
-    }
-)
-#detectionNetwork.setAnchorMasks({"side26": [1, 2, 3], "side13": [3, 4, 5]})
-detectionNetwork.setIouThreshold(0.5)
-detectionNetwork.setBlobPath(nnPath)
+model.configure(detectionNetwork)
 detectionNetwork.setNumInferenceThreads(2)
 detectionNetwork.input.setBlocking(False)
 
@@ -0,0 +1,139 @@
+"""
+Re-runs detection over the camera tapes of recorded flights, so a new model can
+be compared against what flew. Every flight in the logs directory (a folder
+holding a `camera.h265`) is decoded and detected in its own process on the CPU,
+using an OpenVINO IR export. Detections are written next to the tape, and the
+per class statistics of every flight are summarized in the output directory.
+
+Usage:
+    python redetect_tapes.py /path/to/flight_logs --model results/conversion_result_27
+"""
+
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+sys.path.append(str(Path(__file__).resolve().parents[2].joinpath("main", "src")))
+from cpu_optics import CpuDetector, readFrames # type: ignore
+from models import ModelSpec # type: ignore
+from optics import PadType # type: ignore
+
+# How many frames go through the detector at once
+CHUNK_SIZE = 32
+
+detector = None
+
+def initWorker(model: ModelSpec) -> None:
+    global detector
+    # One inference thread per process, so the processes don't fight over cores
+    detector = CpuDetector(model, batchSize=1, jobs=1, threads=1)
+
+def redetectTape(tapePath: Path, sidecarName: str) -> Dict:
+    """
+    Detects every frame of a tape, writing one json line per frame into the
+    sidecar file next to it. Returns the statistics of the tape.
+    """
+    counts = { padType.value: 0 for padType in PadType }
+    confidences = { padType.value: 0.0 for padType in PadType }
+    frames = 0
+    startTime = time.monotonic()
+
+    with tapePath.parent.joinpath(sidecarName).open("w") as sidecar:
+        def flush(chunk) -> None:
+            nonlocal frames
+            for detections in detector.detect(chunk): # type: ignore
+                sidecar.write(json.dumps({
+                    "frame": frames,
+                    "detections": [
+                        {
+                            "pad": d.padType.value,
+                            "x": d.normalizedCoords.x,
+                            "y": d.normalizedCoords.y,
+                            "confidence": d.confidence
+                        } for d in detections
+                    ]
+                }) + "\n")
+                for d in detections:
+                    counts[d.padType.value] += 1
+                    confidences[d.padType.value] += d.confidence
+                frames += 1
+
+        chunk = []
+        for frame in readFrames(tapePath):
+            chunk.append(frame)
+            if len(chunk) == CHUNK_SIZE:
+                flush(chunk)
+                chunk = []
+        if len(chunk) > 0:
+            flush(chunk)
+
+    return {
+        "flight": tapePath.parent.name,
+        "frames": frames,
+        "seconds": time.monotonic() - startTime,
+        "classes": {
+            label: {
+                "rate": counts[label] / frames if frames > 0 else 0.0,
+                "mean_confidence": confidences[label] / counts[label] if counts[label] > 0 else 0.0
+            } for label in counts
+        }
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("logs", type=Path, help="The flight logs directory, holding a folder per flight")
+    parser.add_argument("--model", type=Path, required=True, help="A model export directory, or its best.xml")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="How many tapes are detected at once")
+    parser.add_argument("--out", type=Path, default=Path("redetections"), help="Where the summary is written")
+    args = parser.parse_args()
+
+    model = ModelSpec.load(args.model.resolve()).unwrap()
+    modelName = model.name
+    sidecarName = "detections_" + modelName + ".jsonl"
+    tapes = sorted(args.logs.glob("*/camera.h265"))
+    if len(tapes) == 0:
+        print("There are no tapes in " + str(args.logs))
+        return
+    print("Re-detecting " + str(len(tapes)) + " tapes with " + modelName + " on " + str(args.workers) + " workers...")
+
+    startTime = time.monotonic()
+    results: List[Dict] = []
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=initWorker, initargs=(model,)) as pool:
+        futures = { pool.submit(redetectTape, tape, sidecarName): tape for tape in tapes }
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                print("Failed re-detecting " + str(futures[future]) + ": " + str(e.args))
+                continue
+            print("Flight {}: {} frames at {:.1f} fps".format(
+                result["flight"], result["frames"], result["frames"] / max(result["seconds"], 1e-9)
+            ))
+            results.append(result)
+    elapsed = time.monotonic() - startTime
+
+    results.sort(key=lambda r: r["flight"])
+    totalFrames = sum(r["frames"] for r in results)
+    print("Done, {} frames in {:.1f} s ({:.1f} fps overall)".format(totalFrames, elapsed, totalFrames / max(elapsed, 1e-9)))
+
+    args.out.mkdir(parents=True, exist_ok=True)
+    args.out.joinpath(modelName + ".json").write_text(json.dumps({
+        "model": str(args.model),
+        "seconds": elapsed,
+        "flights": results
+    }, indent=4))
+    with args.out.joinpath(modelName + ".csv").open("w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["flight", "frames", "pad", "rate", "mean_confidence"])
+        for result in results:
+            for (label, stats) in result["classes"].items():
+                writer.writerow([result["flight"], result["frames"], label, stats["rate"], stats["mean_confidence"]])
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import cv2 as cv
+from marker_bank import MarkerBank
 
 markers = {
     "medkit": cv.imread("MedKit.png"),
@@ -6,10 +7,8 @@ markers = {
     "smores": cv.imread("Smores.png")
 }
 
-#feature detector object
-detector = cv.ORB_create()
-
-matcher = cv.BFMatcher(cv.NORM_HAMMING, crossCheck=True)
+# Marker features are computed once, and matched all at once
+bank = MarkerBank(markers)
 
 camera = cv.VideoCapture(0)
 
@@ -20,25 +19,12 @@ while True:
 
     most_similar_label = "unknown" 
     
-    max_similarity_score = 0
-    for label, image in markers.items():
-        # Get the descriptors from the marker
-        key_image, des_image = detector.detectAndCompute(image, None)
-
-        # Get the descriptors from the grayscale of the frame
-        key_gray, des_gray = detector.detectAndCompute(gray, None)
-
-        # Match the descriptors from the marker with the descriptors from the current frame
-        matches = matcher.match(des_image, des_gray)
+    best = bank.match(gray)[0]
+    if best.score > 0:
+        most_similar_label = best.label
+        location = (int(best.location[0]), int(best.location[1]))
+        cv.circle(frame, location, 10, (0, 255, 0), 4)
 
-        # Count the number of good matches
-        good_matches = len([m for m in matches if m.distance < 50])
-
-        if good_matches > max_similarity_score:
-            max_similarity_score = good_matches
-            most_similar_label = label
-
-    
     cv.putText(frame, most_similar_label, (50, 50), cv.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
     cv.imshow('Result', frame)
     if cv.waitKey(1) & 0xFF == ord('q'):
@@ -0,0 +1,63 @@
+"""
+Compares the trained PadDetector against building a new FLANN matcher on every
+frame, like pattern_detection_tick in main.py did, on the train*.png images
+scaled to the camera preview size. Describing the frame with SIFT is the same
+work for both and takes most of the time, so it is timed on its own, and the
+matching is timed on the descriptors of the frames.
+"""
+
+import statistics
+import time
+import cv2 as cv
+import numpy as np
+from pad_detector import PadDetector
+
+RUNS = 20
+width = 300
+height = 300
+
+templates = {
+    "bottle": cv.imread("Bottle.png", cv.IMREAD_GRAYSCALE),
+    "medkit": cv.imread("MedKit.png", cv.IMREAD_GRAYSCALE),
+    "smores": cv.imread("Smores.png", cv.IMREAD_GRAYSCALE)
+}
+frames = [cv.resize(cv.imread(name), (width, height)) for name in ["train1.png", "train2.png", "train3.png"]]
+
+def rebuild_per_frame(template_features, kp2, des2):
+    found = {}
+    for label, (kp1, des1) in template_features.items():
+        flann = cv.FlannBasedMatcher(dict(algorithm = 1, trees = 5), dict(checks = 50))
+        good = [m for m, n in flann.knnMatch(des1, des2, k=2) if m.distance < 0.7 * n.distance]
+        if len(good) > 10:
+            src_pts = np.float32([kp1[m.queryIdx].pt for m in good]).reshape(-1, 1, 2)
+            dst_pts = np.float32([kp2[m.trainIdx].pt for m in good]).reshape(-1, 1, 2)
+            found[label] = cv.findHomography(src_pts, dst_pts, cv.RANSAC, 5.0)[0]
+    return found
+
+def bench(name, detect, inputs):
+    """
+    The median time per frame over RUNS passes, in ms.
+    """
+    runs = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        for i in inputs:
+            detect(*i)
+        runs.append((time.perf_counter() - start) / len(inputs))
+    elapsed = statistics.median(runs) * 1000
+    print("{}: {:.1f} ms per frame".format(name, elapsed))
+    return elapsed
+
+detector = PadDetector(templates)
+sift = cv.SIFT_create()
+template_features = { label: sift.detectAndCompute(image, None) for label, image in templates.items() }
+described = [detector.describe(frame) for frame in frames]
+
+describe = bench("Describing the frame (both)", detector.describe, [(frame,) for frame in frames])
+rebuilt = bench("Matching, rebuilt matcher per frame", lambda kp, des: rebuild_per_frame(template_features, kp, des), described)
+trained = bench("Matching, trained PadDetector", detector.match, described)
+print("Matching is {:.1f}x faster, {:.1f} vs {:.1f} ms per frame in total".format(rebuilt / trained, describe + rebuilt, describe + trained))
+
+for name, frame in zip(["train1.png", "train2.png", "train3.png"], frames):
+    found = detector.detect(frame)
+    print(name, { label: (round(d.center[0], 1), round(d.center[1], 1)) for label, d in found.items() })
@@ -0,0 +1,67 @@
+import cv2 as cv
+import numpy as np
+
+# FLANN's LSH index, for binary descriptors like ORB's
+FLANN_INDEX_LSH = 6
+
+class MarkerMatch:
+    def __init__(self, label, score, location):
+        self.label = label
+        # How many frame features matched the marker
+        self.score = score
+        # The average position of those features in the frame, or None
+        self.location = location
+
+class MarkerBank:
+    """
+    Holds the ORB features of every marker image, computed once at a few scales,
+    in a single trained FLANN index. Matching a frame then takes one feature
+    extraction and one query, no matter how many markers there are.
+    """
+
+    def __init__(self, markers, scales=(1.0, 0.75, 0.5), max_distance=50, detector=None):
+        self.detector = detector if detector is not None else cv.ORB_create()
+        self.max_distance = max_distance
+        self.labels = list(markers.keys())
+        # The label of every image that went into the index
+        self.image_labels = []
+
+        self.matcher = cv.FlannBasedMatcher(
+            dict(algorithm = FLANN_INDEX_LSH, table_number = 6, key_size = 12, multi_probe_level = 1),
+            dict(checks = 50)
+        )
+        for label, image in markers.items():
+            if len(image.shape) == 3:
+                image = cv.cvtColor(image, cv.COLOR_BGR2GRAY)
+            for scale in scales:
+                scaled = cv.resize(image, None, fx=scale, fy=scale, interpolation=cv.INTER_AREA)
+                _, des = self.detector.detectAndCompute(scaled, None)
+                if des is None:
+                    continue
+                self.matcher.add([des])
+                self.image_labels.append(label)
+        self.matcher.train()
+
+    def match(self, gray):
+        """
+        Matches a grayscale frame against every marker. Returns a MarkerMatch
+        per marker, best first.
+        """
+        kp, des = self.detector.detectAndCompute(gray, None)
+        points = { label: [] for label in self.labels }
+        if des is not None and len(self.image_labels) > 0:
+            # LSH may return fewer than k neighbours for a descriptor
+            for neighbours in self.matcher.knnMatch(des, k=1):
+                if len(neighbours) == 0 or neighbours[0].distance >= self.max_distance:
+                    continue
+                m = neighbours[0]
+                points[self.image_labels[m.imgIdx]].append(kp[m.queryIdx].pt)
+
+        results = []
+        for label, pts in points.items():
+            location = None
+            if len(pts) > 0:
+                location = tuple(np.mean(np.float32(pts), axis=0))
+            results.append(MarkerMatch(label, len(pts), location))
+        results.sort(key=lambda r: r.score, reverse=True)
+        return results
@@ -0,0 +1,143 @@
+import threading
+import cv2 as cv
+import numpy as np
+
+FLANN_INDEX_KDTREE = 1
+
+class PadDetection:
+    def __init__(self, label, homography, corners, center, matches):
+        self.label = label
+        # Maps template pixels to frame pixels
+        self.homography = homography
+        # The template outline in the frame, (4, 1, 2)
+        self.corners = corners
+        # The template center in the frame, as floats
+        self.center = center
+        self.matches = matches
+
+class PadDetector:
+    """
+    Finds pad templates in frames with SIFT. The FLANN index is trained once over
+    the descriptors of every template, and reused for every frame, which only has
+    to be described and queried.
+    """
+
+    def __init__(self, templates, min_match_count=10, ratio=0.7):
+        self.min_match_count = min_match_count
+        self.ratio = ratio
+        self.sift = cv.SIFT_create()
+        self.labels = []
+        self.keypoints = []
+        # Corners and center of every template, transformed in one go
+        self.outlines = []
+
+        self.flann = cv.FlannBasedMatcher(dict(algorithm = FLANN_INDEX_KDTREE, trees = 5), dict(checks = 50))
+        for label, image in templates.items():
+            if len(image.shape) == 3:
+                image = cv.cvtColor(image, cv.COLOR_BGR2GRAY)
+            kp, des = self.sift.detectAndCompute(image, None)
+            if des is None:
+                continue
+            h, w = image.shape
+            self.labels.append(label)
+            self.keypoints.append(kp)
+            self.outlines.append(np.float32([[0, 0], [0, h - 1], [w - 1, h - 1], [w - 1, 0], [(w - 1) / 2, (h - 1) / 2]]).reshape(-1, 1, 2))
+            self.flann.add([des])
+        self.flann.train()
+
+    def detect(self, image):
+        """
+        Returns a PadDetection for every template found in a BGR or grayscale frame,
+        keyed by label.
+        """
+        kp, des = self.describe(image)
+        return self.match(kp, des)
+
+    def describe(self, image):
+        gray = cv.cvtColor(image, cv.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
+        return self.sift.detectAndCompute(gray, None)
+
+    def match(self, kp, des):
+        """
+        Like detect, on the SIFT keypoints and descriptors of a frame.
+        """
+        if des is None or len(des) < 2:
+            return {}
+
+        # One query for all templates, then Lowe's ratio test
+        good = [[] for _ in self.labels]
+        for pair in self.flann.knnMatch(des, k=2):
+            if len(pair) == 2 and pair[0].distance < self.ratio * pair[1].distance:
+                good[pair[0].imgIdx].append(pair[0])
+
+        results = {}
+        for i, matches in enumerate(good):
+            if len(matches) <= self.min_match_count:
+                continue
+            src_pts = np.float32([self.keypoints[i][m.trainIdx].pt for m in matches]).reshape(-1, 1, 2)
+            dst_pts = np.float32([kp[m.queryIdx].pt for m in matches]).reshape(-1, 1, 2)
+            M, mask = cv.findHomography(src_pts, dst_pts, cv.RANSAC, 5.0)
+            if M is None:
+                continue
+            outline = cv.perspectiveTransform(self.outlines[i], M)
+            results[self.labels[i]] = PadDetection(
+                self.labels[i],
+                M,
+                outline[:4],
+                (float(outline[4, 0, 0]), float(outline[4, 0, 1])),
+                int(mask.sum())
+            )
+        return results
+
+class AsyncPadDetector:
+    """
+    Runs a PadDetector on a worker thread. Submitting a frame never blocks: if the
+    worker is busy, the frame waiting for it is replaced by the newer one.
+    """
+
+    def __init__(self, detector):
+        self.detector = detector
+        self.condition = threading.Condition()
+        self.pending = None
+        self.results = {}
+        # The frame the results were found in
+        self.image = None
+        self.frame_id = -1
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, image, frame_id):
+        with self.condition:
+            self.pending = (image, frame_id)
+            self.condition.notify()
+
+    def latest(self):
+        """
+        Returns the id of the last detected frame, the frame itself, and its
+        results. The display has moved on since, so draw them on that frame.
+        """
+        with self.condition:
+            return self.frame_id, self.image, self.results
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.pending is None and self.running:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                image, frame_id = self.pending
+                self.pending = None
+
+            results = self.detector.detect(image)
+            with self.condition:
+                self.results = results
+                self.image = image
+                self.frame_id = frame_id
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.thread.join()
@@ -0,0 +1,100 @@
+import math
+
+class LatestFrameSource:
+    """
+    Hands out only the newest frame of a depthai output queue. It never spins on
+    the queue: `poll` drains it once, `wait` blocks inside depthai until a frame
+    arrives. Every frame that was skipped over, in the queue or on the device
+    (from gaps in the sequence numbers), is counted in `dropped`.
+    """
+
+    def __init__(self, queue):
+        self.queue = queue
+        self.dropped = 0
+        self.received = 0
+        self.last_sequence = None
+
+    def _newest(self, frames):
+        if len(frames) == 0:
+            return None
+        newest = frames[-1]
+        sequence = newest.getSequenceNum()
+        if self.last_sequence is not None and sequence > self.last_sequence:
+            self.dropped += sequence - self.last_sequence - 1
+        else:
+            self.dropped += len(frames) - 1
+        self.last_sequence = sequence
+        self.received += 1
+        return newest
+
+    def poll(self):
+        """
+        Returns the newest frame message, or None if none arrived since the last call.
+        """
+        return self._newest(self.queue.tryGetAll())
+
+    def wait(self):
+        """
+        Blocks until a frame arrives, and returns the newest one.
+        """
+        first = self.queue.get()
+        return self._newest([first] + self.queue.tryGetAll())
+
+class WindowedSmoother:
+    """
+    Averages the last `size` points, weighted by confidence, in O(1) per point by
+    keeping running sums over a ring buffer. A point further than `outlier_distance`
+    from the current average is rejected, unless `max_rejections` points in a row
+    were, in which case the target really moved and the window starts over.
+    """
+
+    def __init__(self, size=10, outlier_distance=None, max_rejections=3):
+        self.size = size
+        self.outlier_distance = outlier_distance
+        self.max_rejections = max_rejections
+        self.clear()
+
+    def clear(self):
+        self.points = [(0.0, 0.0, 0.0)] * self.size
+        self.next = 0
+        self.count = 0
+        self.sum_x = 0.0
+        self.sum_y = 0.0
+        self.sum_w = 0.0
+        self.rejections = 0
+
+    def add(self, point, confidence=1.0):
+        """
+        Adds a point to the window. Returns False if it was rejected as an outlier.
+        """
+        if self.outlier_distance is not None and self.sum_w > 0:
+            mean = self.mean()
+            if math.dist(point, mean) > self.outlier_distance:
+                self.rejections += 1
+                if self.rejections < self.max_rejections:
+                    return False
+                self.clear()
+        self.rejections = 0
+
+        old_x, old_y, old_w = self.points[self.next]
+        self.sum_x += point[0] * confidence - old_x * old_w
+        self.sum_y += point[1] * confidence - old_y * old_w
+        self.sum_w += confidence - old_w
+        self.points[self.next] = (point[0], point[1], confidence)
+
+        self.next = (self.next + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+        if self.next == 0:
+            # Once per lap, get rid of the rounding errors of the running sums
+            self.sum_x = sum(x * w for x, _, w in self.points)
+            self.sum_y = sum(y * w for _, y, w in self.points)
+            self.sum_w = sum(w for _, _, w in self.points)
+        return True
+
+    def mean(self):
+        """
+        The weighted average of the window, or None if it is empty.
+        """
+        if self.sum_w <= 0:
+            return None
+        return (self.sum_x / self.sum_w, self.sum_y / self.sum_w)
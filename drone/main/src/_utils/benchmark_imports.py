@@ -0,0 +1,63 @@
+#type: ignore
+
+"""
+Benchmarks how long the modules of Venus take to import, every one in a
+fresh interpreter, and which heavy dependencies they pull in. core, compute,
+predict and landing are meant to stay light (see core.py), so tools and tests
+built on them start fast.
+
+Run from the main directory, like:
+    python src/_utils/benchmark_imports.py
+    python src/_utils/benchmark_imports.py --modules core optics --runs 10
+"""
+
+from pathlib import Path
+import argparse
+import statistics
+import subprocess
+import sys
+
+SRC = Path(__file__).resolve().parents[1]
+
+# The dependencies which take the most to import
+HEAVY = ["depthai", "dronekit", "pymavlink", "cv2", "numpy", "openvino"]
+
+# main isn't measured, importing it runs Venus
+# Measured in the fresh interpreter, printed as the import time in ms and then the heavy modules loaded
+MEASURE = """
+import collections, collections.abc, sys, time
+# dronekit still looks for MutableMapping in collections
+collections.MutableMapping = collections.abc.MutableMapping
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(elapsed * 1000, *[m for m in {heavy} if m in sys.modules])
+"""
+
+def measure(module):
+    """
+    The import time of `module` in ms, and the heavy modules it loaded.
+    """
+    output = subprocess.run(
+        [sys.executable, "-c", MEASURE.format(module=module, heavy=HEAVY)],
+        cwd=SRC, capture_output=True, text=True, check=True
+    ).stdout.splitlines()[-1].split()
+    # Some modules log while importing, the measurement is the last line
+    return (float(output[0]), output[1:])
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("--modules", nargs="+", default=["core", "compute", "predict", "landing", "control", "vehicle", "telemetry", "optics"], help="The modules to import")
+parser.add_argument("--runs", type=int, default=5, help="Imports of every module, the median is printed")
+args = parser.parse_args()
+
+for module in args.modules:
+    try:
+        runs = [measure(module) for _ in range(args.runs)]
+    except subprocess.CalledProcessError as e:
+        print("{:10} failed to import: {}".format(module, e.stderr.strip().splitlines()[-1]))
+        continue
+    print("{:10} {:7.1f} ms | loads {}".format(
+        module,
+        statistics.median(ms for (ms, _) in runs),
+        ", ".join(runs[0][1]) if len(runs[0][1]) > 0 else "nothing heavy"
+    ))
@@ -0,0 +1,181 @@
+#type: ignore
+
+"""
+Benchmarks the vehicle backends (see vehicle.py) against each other: the CPU
+they take to keep up with the telemetry, and how long an attitude takes to
+show up on the vehicle once it was sent.
+
+By default, a fake autopilot in a process of its own streams what ArduPilot
+streams (rates below, times --flood), with the time it sent every ATTITUDE at
+in its roll. Give --connection to measure the CPU with a real autopilot or
+SITL instead, latencies can't be measured then.
+
+Run from the main directory, like:
+    python src/_utils/benchmark_vehicle.py --seconds 20
+    python src/_utils/benchmark_vehicle.py --connection 127.0.0.1:14550
+"""
+
+from pathlib import Path
+from multiprocessing import Event, Process
+import argparse
+import socket
+import statistics
+import sys
+import time
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+# Messages per second of the fake autopilot, the read ones and then the rest
+STREAM_RATES = {
+    "HEARTBEAT": 1,
+    "ATTITUDE": 50,
+    "GLOBAL_POSITION_INT": 10,
+    "VFR_HUD": 10,
+    "RANGEFINDER": 10,
+    "RAW_IMU": 50,
+    "SCALED_IMU2": 50,
+    "SERVO_OUTPUT_RAW": 50,
+    "RC_CHANNELS": 10,
+    "LOCAL_POSITION_NED": 10,
+    "NAV_CONTROLLER_OUTPUT": 10,
+    "VIBRATION": 10,
+    "SYS_STATUS": 5,
+    "POWER_STATUS": 5,
+    "MEMINFO": 5
+}
+
+# ATTITUDE roll is a float32, so the send time wraps around to keep its precision
+TIME_WRAP = 100.0
+
+def sendMessage(mav, msgType, mavlink):
+    if msgType == "HEARTBEAT":
+        mav.heartbeat_send(
+            mavlink.MAV_TYPE_QUADROTOR, mavlink.MAV_AUTOPILOT_ARDUPILOTMEGA,
+            mavlink.MAV_MODE_FLAG_CUSTOM_MODE_ENABLED, 3, mavlink.MAV_STATE_ACTIVE
+        )
+    elif msgType == "ATTITUDE":
+        mav.attitude_send(0, time.monotonic() % TIME_WRAP, 0.0, 1.0, 0, 0, 0)
+    elif msgType == "GLOBAL_POSITION_INT":
+        mav.global_position_int_send(0, 200000000, -300000000, 25000, 15000, 0, 0, 0, 0)
+    elif msgType == "VFR_HUD":
+        mav.vfr_hud_send(5.0, 5.0, 90, 50, 15.0, 0.0)
+    elif msgType == "RANGEFINDER":
+        mav.rangefinder_send(8.0, 0.0)
+    elif msgType == "RAW_IMU":
+        mav.raw_imu_send(0, 1, 2, 3, 4, 5, 6, 7, 8, 9)
+    elif msgType == "SCALED_IMU2":
+        mav.scaled_imu2_send(0, 1, 2, 3, 4, 5, 6, 7, 8, 9)
+    elif msgType == "SERVO_OUTPUT_RAW":
+        mav.servo_output_raw_send(0, 0, 1500, 1500, 1500, 1500, 1000, 1000, 1000, 1000)
+    elif msgType == "RC_CHANNELS":
+        mav.rc_channels_send(0, 8, *([1500] * 18), 255)
+    elif msgType == "LOCAL_POSITION_NED":
+        mav.local_position_ned_send(0, 1.0, 2.0, -15.0, 0.0, 0.0, 0.0)
+    elif msgType == "NAV_CONTROLLER_OUTPUT":
+        mav.nav_controller_output_send(0.0, 0.0, 90, 90, 10, 0.0, 0.0, 0.0)
+    elif msgType == "VIBRATION":
+        mav.vibration_send(0, 1.0, 1.0, 1.0, 0, 0, 0)
+    elif msgType == "SYS_STATUS":
+        mav.sys_status_send(0, 0, 0, 500, 16000, 1000, 90, 0, 0, 0, 0, 0, 0)
+    elif msgType == "POWER_STATUS":
+        mav.power_status_send(5000, 5000, 0)
+    elif msgType == "MEMINFO":
+        mav.meminfo_send(1000, 65000)
+
+def fakeAutopilot(port, flood, stopped):
+    from pymavlink import mavutil
+    autopilot = mavutil.mavlink_connection("udpout:127.0.0.1:" + str(port), source_system=1, source_component=1)
+    rates = {
+        msgType: rate * (flood if msgType not in ("HEARTBEAT", "ATTITUDE") else 1)
+        for (msgType, rate) in STREAM_RATES.items()
+    }
+    due = { msgType: time.monotonic() for msgType in rates }
+    while not stopped.is_set():
+        now = time.monotonic()
+        for (msgType, rate) in rates.items():
+            if now >= due[msgType]:
+                sendMessage(autopilot.mav, msgType, mavutil.mavlink)
+                due[msgType] += 1.0 / rate
+        time.sleep(max(0.0, min(due.values()) - time.monotonic()))
+        # dronekit won't connect before it got a parameter, nothing else is answered
+        msg = autopilot.recv_match(blocking=False)
+        while msg is not None:
+            if msg.get_type() == "PARAM_REQUEST_LIST":
+                autopilot.mav.param_value_send(b"SYSID_THISMAV", 1, mavutil.mavlink.MAV_PARAM_TYPE_REAL32, 1, 0)
+            msg = autopilot.recv_match(blocking=False)
+
+def connectVehicle(backend, connectionString):
+    if backend == "dronekit":
+        from dronekit import connect
+        return connect(connectionString, wait_ready=False, heartbeat_timeout=30)
+    from vehicle import MavVehicle
+    return MavVehicle.connect(connectionString, wait_ready=False, timeout=30).unwrap()
+
+def measureCpu(seconds):
+    """
+    The CPU this process takes while the main thread does nothing.
+    """
+    startWall = time.monotonic()
+    startCpu = time.process_time()
+    time.sleep(seconds)
+    return 100.0 * (time.process_time() - startCpu) / (time.monotonic() - startWall)
+
+def measureLatency(vehicle, seconds):
+    """
+    Polls the attitude at 1 kHz, the polling adds 0.5 ms on average.
+    """
+    latencies = []
+    lastRoll = None
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        attitude = vehicle.attitude
+        if attitude is not None and attitude.roll is not None and attitude.roll != lastRoll:
+            lastRoll = attitude.roll
+            latencies.append((time.monotonic() - attitude.roll) % TIME_WRAP)
+        time.sleep(0.001)
+    # The first one may have been sitting there since before
+    return latencies[1:]
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("--backends", nargs="+", default=["dronekit", "pymavlink"], help="The backends to benchmark")
+parser.add_argument("--seconds", type=float, default=10, help="Seconds of every measurement")
+parser.add_argument("--flood", type=float, default=1, help="Multiplies the rates of the messages the vehicle doesn't read")
+parser.add_argument("--connection", default=None, help="A real autopilot or SITL to connect to, instead of the fake one")
+args = parser.parse_args()
+
+for backend in args.backends:
+    stopped = Event()
+    autopilot = None
+    if args.connection is None:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        connectionString = "udpin:127.0.0.1:" + str(port)
+        autopilot = Process(target=fakeAutopilot, args=(port, args.flood, stopped), daemon=True)
+        autopilot.start()
+    else:
+        connectionString = args.connection
+
+    vehicle = connectVehicle(backend, connectionString)
+    # Let the streams and the backend settle
+    time.sleep(2.0)
+    cpu = measureCpu(args.seconds)
+    line = "{:10} cpu {:5.1f}%".format(backend, cpu)
+    if autopilot is not None:
+        latencies = measureLatency(vehicle, args.seconds)
+        if len(latencies) > 0:
+            line += " | attitude latency mean {:.2f} ms, p95 {:.2f} ms, max {:.2f} ms, {:.0f} Hz".format(
+                statistics.mean(latencies) * 1000,
+                float(np.percentile(latencies, 95)) * 1000,
+                max(latencies) * 1000,
+                len(latencies) / args.seconds
+            )
+        else:
+            line += " | no attitudes received"
+    print(line)
+
+    vehicle.close()
+    stopped.set()
+    if autopilot is not None:
+        autopilot.join()
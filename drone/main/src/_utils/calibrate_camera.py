@@ -0,0 +1,127 @@
+#type: ignore
+
+"""
+Calibrates the intrinsics and lens distortion of the OAK color camera from
+views of a printed chessboard, and saves the undistortion map the Eye applies
+to detection centres (see undistort.py). See wiki/INSTRUMENT_CALIBRATION.MD.
+
+Calibration runs on the full 1080p frames, since the preview the NN sees is
+the whole sensor squashed. Use the same camera settings as in flight, hold
+the board at many angles and distances, and get it into the corners of the
+frame: that's where the distortion is.
+
+Controls:
+    space   capture a view, if the board was found in it
+    c       calibrate with the views so far, and save
+    q       quit
+
+Run from the main directory, like:
+    python src/_utils/calibrate_camera.py --board 9x6
+    python src/_utils/calibrate_camera.py --images calibration_views/
+"""
+
+from pathlib import Path
+from math import degrees, atan
+import argparse
+import sys
+import cv2
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from constants import UNDISTORTION_MAP_PATH
+from core import PixelCoords, WIDTH_FOV, HEIGHT_FOV
+from undistort import UndistortionMap
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("--board", default="9x6", help="Inner corners of the chessboard, columns x rows")
+parser.add_argument("--images", type=Path, default=None, help="Calibrate from the images in a directory instead of the camera")
+parser.add_argument("--save-views", type=Path, default=None, help="A directory to keep the captured views in")
+parser.add_argument("--grid", type=int, default=33, help="Points per side of the undistortion map")
+parser.add_argument("--out", type=Path, default=UNDISTORTION_MAP_PATH, help="Where the undistortion map is saved")
+args = parser.parse_args()
+
+boardSize = tuple(int(x) for x in args.board.split("x"))
+# The square size doesn't matter for the intrinsics
+boardPoints = np.zeros((boardSize[0] * boardSize[1], 3), np.float32)
+boardPoints[:, :2] = np.mgrid[0:boardSize[0], 0:boardSize[1]].T.reshape(-1, 2)
+
+def findBoard(gray):
+    found, corners = cv2.findChessboardCorners(
+        gray, boardSize, flags=cv2.CALIB_CB_ADAPTIVE_THRESH | cv2.CALIB_CB_NORMALIZE_IMAGE | cv2.CALIB_CB_FAST_CHECK
+    )
+    if not found:
+        return None
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)
+    return cv2.cornerSubPix(gray, corners, (11, 11), (-1, -1), criteria)
+
+def calibrate(views, sensorSize):
+    if len(views) < 10:
+        print("Only " + str(len(views)) + " views, get at least 10.")
+        return
+    rms, cameraMatrix, distortion, _, _ = cv2.calibrateCamera(
+        [boardPoints] * len(views), views, sensorSize, None, None
+    )
+    fovX = 2 * degrees(atan(sensorSize[0] / (2 * cameraMatrix[0, 0])))
+    fovY = 2 * degrees(atan(sensorSize[1] / (2 * cameraMatrix[1, 1])))
+    print("Reprojection error: {:.3f} px over {} views (under 0.5 is good)".format(rms, len(views)))
+    print("Camera matrix:\n" + str(cameraMatrix))
+    print("Distortion: " + str(distortion.ravel()))
+    print("Calibrated FOV {:.1f} x {:.1f} deg, optics assumes {} x {}".format(fovX, fovY, WIDTH_FOV, HEIGHT_FOV))
+
+    undistortion = UndistortionMap.build(cameraMatrix, distortion, sensorSize, args.grid)
+    corner = undistortion.correct(PixelCoords(1.0, 1.0))
+    print("The frame corner moves to ({:.3f}, {:.3f})".format(corner.x, corner.y))
+    undistortion.save(args.out)
+    print("Saved to " + str(args.out))
+
+views = []
+if args.images is not None:
+    sensorSize = None
+    for path in sorted(args.images.iterdir()):
+        image = cv2.imread(str(path), cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            continue
+        sensorSize = (image.shape[1], image.shape[0])
+        corners = findBoard(image)
+        print(path.name + (": found" if corners is not None else ": no board"))
+        if corners is not None:
+            views.append(corners)
+    calibrate(views, sensorSize)
+    sys.exit(0)
+
+import depthai as dai
+
+pipeline = dai.Pipeline()
+camRgb = pipeline.create(dai.node.ColorCamera)
+xoutVideo = pipeline.create(dai.node.XLinkOut)
+xoutVideo.setStreamName("video")
+camRgb.setResolution(dai.ColorCameraProperties.SensorResolution.THE_1080_P)
+camRgb.setFps(15)
+camRgb.video.link(xoutVideo.input)
+
+if args.save_views is not None:
+    args.save_views.mkdir(parents=True, exist_ok=True)
+
+with dai.Device(pipeline, usb2Mode=True) as device:
+    qVideo = device.getOutputQueue(name="video", maxSize=1, blocking=False)
+    while True:
+        frame = qVideo.get().getCvFrame()
+        sensorSize = (frame.shape[1], frame.shape[0])
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        corners = findBoard(gray)
+
+        shown = frame.copy()
+        if corners is not None:
+            cv2.drawChessboardCorners(shown, boardSize, corners, True)
+        cv2.putText(shown, "views: " + str(len(views)), (10, 40), cv2.FONT_HERSHEY_TRIPLEX, 1.2, (255, 255, 255))
+        cv2.imshow("calibration", cv2.resize(shown, None, fx=0.5, fy=0.5))
+
+        key = cv2.waitKey(1)
+        if key == ord(" ") and corners is not None:
+            views.append(corners)
+            if args.save_views is not None:
+                cv2.imwrite(str(args.save_views.joinpath("view_" + str(len(views)) + ".png")), frame)
+        elif key == ord("c"):
+            calibrate(views, sensorSize)
+        elif key == ord("q"):
+            break
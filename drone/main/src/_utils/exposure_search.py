@@ -0,0 +1,162 @@
+#type: ignore
+
+"""
+Searches the camera settings that detect pads best in the current light. Put
+the pads in view, and every combination of the given exposures, ISOs (and
+white balances) is set on the camera in turn and scored by the detections it
+gets (see `exposure.scoreFrames`). The best one is saved as the profile of the
+lighting condition the auto exposure metered, which the Eye loads at startup.
+
+Without a camera, a recording can stand in: its frames are brightened or
+darkened by how much more or less light each setting would let in than the
+one they were recorded with, and run on the CPU. White balance can't be
+simulated this way.
+
+Run from the main directory, like:
+    python src/_utils/exposure_search.py --exposure 250 500 1000 2000 --iso 100 200 400
+    python src/_utils/exposure_search.py --source tape.h265 --base-exposure 1000 --base-iso 200
+"""
+
+from pathlib import Path
+from itertools import product
+import argparse
+import sys
+import time
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from constants import MODEL_PATH, EXPOSURE_PROFILES_PATH
+from exposure import ExposureProfile, lightingCondition, loadProfiles, meterLighting, saveProfiles, scoreFrames
+from models import ModelSpec
+from optics import PixelCoords, PixelDetection, filterDetections, lowestConfidenceThreshold
+
+def intoDetections(model, inDet):
+    results = []
+    for d in inDet.detections:
+        padType = model.intoPadType(d.label)
+        if padType is not None:
+            results.append(PixelDetection(
+                padType,
+                PixelCoords((d.xmin + d.xmax) / 2, (d.ymin + d.ymax) / 2),
+                d.confidence,
+                bbox=(d.xmin, d.ymin, d.xmax, d.ymax)
+            ))
+    return filterDetections(results)
+
+def searchCamera(model, settings, frames, settle):
+    import depthai as dai
+
+    pipeline = dai.Pipeline()
+    camRgb = pipeline.create(dai.node.ColorCamera)
+    detectionNetwork = pipeline.create(dai.node.YoloDetectionNetwork)
+    nnOut = pipeline.create(dai.node.XLinkOut)
+    stillOut = pipeline.create(dai.node.XLinkOut)
+    controlIn = pipeline.create(dai.node.XLinkIn)
+    nnOut.setStreamName("nn")
+    stillOut.setStreamName("still")
+    controlIn.setStreamName("control")
+
+    # The same camera as the Eye runs
+    camRgb.setPreviewKeepAspectRatio(False)
+    camRgb.setFps(15)
+    camRgb.setPreviewSize(*model.inputSize)
+    camRgb.setResolution(dai.ColorCameraProperties.SensorResolution.THE_1080_P)
+    camRgb.setInterleaved(False)
+    camRgb.setColorOrder(dai.ColorCameraProperties.ColorOrder.BGR)
+    model.configure(detectionNetwork)
+    detectionNetwork.setConfidenceThreshold(lowestConfidenceThreshold())
+    detectionNetwork.setNumInferenceThreads(2)
+    detectionNetwork.input.setBlocking(False)
+
+    camRgb.preview.link(detectionNetwork.input)
+    detectionNetwork.out.link(nnOut.input)
+    camRgb.still.link(stillOut.input)
+    controlIn.out.link(camRgb.inputControl)
+
+    with dai.Device(pipeline, usb2Mode=True) as device:
+        qControl = device.getInputQueue(name="control")
+        qStill = device.getOutputQueue(name="still", maxSize=1, blocking=False)
+        qDet = device.getOutputQueue(name="nn", maxSize=4, blocking=False)
+
+        condition = meterLighting(qControl, qStill).unwrap()
+        print("Metered " + condition + " light.")
+
+        results = []
+        for (exposure, iso, whiteBalance) in settings:
+            profile = ExposureProfile(condition, exposure, iso, whiteBalance)
+            control = dai.CameraControl()
+            profile.apply(control)
+            qControl.send(control)
+
+            # Frames already in flight were taken with the old settings
+            settleEnd = time.monotonic() + settle
+            while time.monotonic() < settleEnd:
+                qDet.tryGetAll()
+                time.sleep(0.01)
+
+            detections = [intoDetections(model, qDet.get()) for _ in range(frames)]
+            profile.score = scoreFrames(detections)
+            print("exposure {} us, iso {}, wb {}: {:.3f}".format(exposure, iso, whiteBalance, profile.score))
+            results.append(profile)
+    return results
+
+def searchRecording(model, settings, source, baseExposure, baseIso, condition, frames):
+    import cv2
+    from cpu_optics import CpuDetector, readFrames
+
+    recorded = []
+    for frame in readFrames(source):
+        recorded.append(frame)
+        if len(recorded) == frames:
+            break
+    detector = CpuDetector(model)
+    # Gain is applied to linear light, the frames are gamma encoded
+    levels = (np.arange(256) / 255.0) ** 2.2
+
+    results = []
+    for (exposure, iso, whiteBalance) in settings:
+        gain = (exposure * iso) / (baseExposure * baseIso)
+        lut = (np.clip(levels * gain, 0, 1) ** (1 / 2.2) * 255).astype(np.uint8)
+        simulated = [cv2.LUT(frame, lut) for frame in recorded]
+
+        profile = ExposureProfile(condition, exposure, iso, whiteBalance)
+        profile.score = scoreFrames([filterDetections(d) for d in detector.detect(simulated)])
+        print("exposure {} us, iso {}: {:.3f}".format(exposure, iso, profile.score))
+        results.append(profile)
+    return results
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("--model", type=Path, default=MODEL_PATH, help="The model export to score with")
+parser.add_argument("--exposure", type=int, nargs="+", default=[250, 500, 1000, 2000, 4000], help="Exposure times, in us")
+parser.add_argument("--iso", type=int, nargs="+", default=[100, 200, 400, 800], help="ISO sensitivities")
+parser.add_argument("--white-balance", type=int, nargs="+", default=None, help="White balances in K, auto if not given")
+parser.add_argument("--frames", type=int, default=30, help="Frames scored per setting")
+parser.add_argument("--settle", type=float, default=0.5, help="Seconds for the camera to apply a setting")
+parser.add_argument("--source", type=Path, default=None, help="A recording to search on, instead of the camera")
+parser.add_argument("--base-exposure", type=int, default=500, help="The exposure the recording was taken with, in us")
+parser.add_argument("--base-iso", type=int, default=200, help="The ISO the recording was taken with")
+parser.add_argument("--condition", default=None, help="The lighting condition of the recording, metered from its settings if not given")
+parser.add_argument("--out", type=Path, default=EXPOSURE_PROFILES_PATH, help="The profiles file to save into")
+args = parser.parse_args()
+
+model = ModelSpec.load(args.model).unwrap()
+whiteBalances = args.white_balance if args.white_balance is not None else [None]
+
+if args.source is not None:
+    settings = list(product(args.exposure, args.iso, [None]))
+    condition = args.condition if args.condition is not None else lightingCondition(args.base_exposure, args.base_iso)
+    results = searchRecording(model, settings, args.source, args.base_exposure, args.base_iso, condition, args.frames)
+else:
+    settings = list(product(args.exposure, args.iso, whiteBalances))
+    results = searchCamera(model, settings, args.frames, args.settle)
+
+# Ties go to the shorter exposure, it blurs less while the AV moves
+best = max(results, key=lambda p: (p.score, -p.exposure))
+print("Best for {} light: exposure {} us, iso {}, wb {} ({:.3f})".format(
+    best.condition, best.exposure, best.iso, best.whiteBalance, best.score
+))
+
+profiles = loadProfiles(args.out).unwrap_or({})
+profiles[best.condition] = best
+saveProfiles(args.out, profiles)
+print("Saved to " + str(args.out))
@@ -0,0 +1,47 @@
+#type: ignore
+
+"""
+Shows the frames the guidance system publishes to its frame bus, from a
+separate process. Nothing here can slow down the guidance loop. The bus is
+only there when FRAME_BUS_NAME is set, or center refinement or the preview
+are on.
+Run from the main directory with `python src/_utils/view_bus.py`.
+"""
+
+from pathlib import Path
+import sys
+import time
+import cv2
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from framebus import FrameBus
+from constants import FRAME_BUS_NAME, DEFAULT_FRAME_BUS_NAME
+
+while True:
+    try:
+        bus = FrameBus.attach(FRAME_BUS_NAME or DEFAULT_FRAME_BUS_NAME)
+        break
+    except FileNotFoundError:
+        print("Waiting for the frame bus...")
+        time.sleep(1.0)
+
+lastSequence = -1
+while True:
+    latest = bus.latest()
+    if latest is not None and latest[0] != lastSequence:
+        (sequence, timestamp, frame) = latest
+        skipped = sequence - lastSequence - 1 if lastSequence >= 0 else 0
+        lastSequence = sequence
+
+        # The bus holds planar frames, OpenCV wants them interleaved
+        image = np.ascontiguousarray(frame.transpose(1, 2, 0))
+        if bus.isValid(sequence):
+            cv2.putText(image, "seq {} skipped {}".format(sequence, skipped),
+                        (2, image.shape[0] - 4), cv2.FONT_HERSHEY_TRIPLEX, 0.4, (255, 255, 255))
+            cv2.imshow("bus", image)
+
+    if cv2.waitKey(1) == ord('q'):
+        break
+
+bus.close()
@@ -7,17 +7,14 @@ import depthai as dai
 import numpy as np
 import time
 
-nnPath = "./assets/detection_model.blob"
-
-labelMap = [
-    "bottle_dropoff",
-    "bottle_pickup",
-    "medkit_dropoff",
-    "medkit_pickup",
-    "smores_dropoff",
-    "smores_pickup",
-    "pad_center"
-]
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from models import ModelSpec
+from constants import MODEL_PATH
+
+# Any model export, as a directory or its blob, can be run by passing it in
+model = ModelSpec.load(Path(sys.argv[1]) if len(sys.argv) > 1 else MODEL_PATH).unwrap()
+
+labelMap = [label.value for label in model.labels]
 
 syncNN = True
 
@@ -35,45 +32,14 @@ nnOut.setStreamName("nn")
 
 # Properties
 camRgb.setPreviewKeepAspectRatio(False)
-camRgb.setPreviewSize(416, 416)
+camRgb.setPreviewSize(*model.inputSize)
 camRgb.setResolution(dai.ColorCameraProperties.SensorResolution.THE_1080_P)
 camRgb.setInterleaved(False)
 camRgb.setColorOrder(dai.ColorCameraProperties.ColorOrder.BGR)
 camRgb.setFps(40)
 
 # Network specific settings
-detectionNetwork.setConfidenceThreshold(0.5)
-detectionNetwork.setNumClasses(7)
-detectionNetwork.setCoordinateSize(4)
-detectionNetwork.setAnchors([
-                10.0,
-                13.0,
-                16.0,
-                30.0,
-                33.0,
-                23.0,
-                30.0,
-                61.0,
-                62.0,
-                45.0,
-                59.0,
-                119.0,
-                116.0,
-                90.0,
-                156.0,
-                198.0,
-                373.0,
-                326.0
-])
-detectionNetwork.setAnchorMasks(
-    {
-        "side52": [0, 1, 2], 
-        "side26": [3, 4, 5], 
-        "side13": [6, 7, 8]
-    }
-)
-detectionNetwork.setIouThreshold(0.5)
-detectionNetwork.setBlobPath(nnPath)
+model.configure(detectionNetwork)
 detectionNetwork.setNumInferenceThreads(2)
 detectionNetwork.input.setBlocking(False)
 
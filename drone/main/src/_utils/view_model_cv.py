@@ -1,25 +1,91 @@
 #type: ignore
 
+"""
+Shows what the model sees, with the detections drawn on the frames. Frames
+and detections are pulled off the OAK by a capture thread and handed over
+through drop-oldest queues, so a slow display never holds back the device,
+and the FPS of every stage (camera, NN, render, recording) is what it really
+is. The rendering runs on the main thread, since OpenCV windows have to.
+
+With --record, the annotated frames are written to a video and the raw
+detections of every frame to a json lines file, on a thread of their own,
+fed by the capture thread, so frames the display skips are still recorded.
+
+Run from the main directory, like:
+    python src/_utils/view_model_cv.py [model] [--record recordings/]
+"""
+
 from pathlib import Path
+from collections import deque
+from datetime import datetime
+import argparse
+import json
 import sys
+import threading
+import time
 import cv2
 import depthai as dai
 import numpy as np
-import time
-
-nnPath = "./assets/detection_model.blob"
 
-labelMap = [
-    "bottle_dropoff",
-    "bottle_pickup",
-    "medkit_dropoff",
-    "medkit_pickup",
-    "smores_dropoff",
-    "smores_pickup",
-    "pad_center"
-]
-
-syncNN = True
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from models import ModelSpec
+from constants import MODEL_PATH
+
+class FpsCounter:
+    """
+    Events per second over the last `window` seconds.
+    """
+
+    def __init__(self, window=2.0):
+        self.window = window
+        self.times = deque()
+        self.lock = threading.Lock()
+
+    def tick(self):
+        now = time.monotonic()
+        with self.lock:
+            self.times.append(now)
+            while self.times[0] < now - self.window:
+                self.times.popleft()
+
+    def fps(self):
+        now = time.monotonic()
+        with self.lock:
+            while len(self.times) > 0 and self.times[0] < now - self.window:
+                self.times.popleft()
+            return len(self.times) / self.window
+
+class LatestQueue:
+    """
+    A bounded queue which drops its oldest item when full, counting the drops.
+    """
+
+    def __init__(self, size):
+        self.items = deque(maxlen=size)
+        self.ready = threading.Condition()
+        self.dropped = 0
+
+    def put(self, item):
+        with self.ready:
+            if len(self.items) == self.items.maxlen:
+                self.dropped += 1
+            self.items.append(item)
+            self.ready.notify()
+
+    def get(self, timeout):
+        with self.ready:
+            if len(self.items) == 0:
+                self.ready.wait(timeout)
+            return self.items.popleft() if len(self.items) > 0 else None
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("model", type=Path, nargs="?", default=MODEL_PATH, help="A model export, as a directory or its blob")
+parser.add_argument("--fps", type=float, default=15, help="Camera fps")
+parser.add_argument("--record", type=Path, default=None, help="A directory to record annotated frames and detections into")
+args = parser.parse_args()
+
+model = ModelSpec.load(args.model).unwrap()
+labelMap = [label.value for label in model.labels]
 
 # Create pipeline
 pipeline = dai.Pipeline()
@@ -35,129 +101,148 @@ nnOut.setStreamName("nn")
 
 # Properties
 camRgb.setPreviewKeepAspectRatio(False)
-camRgb.setPreviewSize(416, 416)
+camRgb.setPreviewSize(*model.inputSize)
 camRgb.setResolution(dai.ColorCameraProperties.SensorResolution.THE_1080_P)
 camRgb.setInterleaved(False)
 camRgb.setColorOrder(dai.ColorCameraProperties.ColorOrder.BGR)
-camRgb.setFps(15)
+camRgb.setFps(args.fps)
 
 # Network specific settings
-detectionNetwork.setConfidenceThreshold(0.5)
-detectionNetwork.setNumClasses(7)
-detectionNetwork.setCoordinateSize(4)
-detectionNetwork.setAnchors([
-                10.0,
-                13.0,
-                16.0,
-                30.0,
-                33.0,
-                23.0,
-                30.0,
-                61.0,
-                62.0,
-                45.0,
-                59.0,
-                119.0,
-                116.0,
-                90.0,
-                156.0,
-                198.0,
-                373.0,
-                326.0
-])
-detectionNetwork.setAnchorMasks(
-    {
-        "side52": [0, 1, 2], 
-        "side26": [3, 4, 5], 
-        "side13": [6, 7, 8]
-    }
-)
-detectionNetwork.setIouThreshold(0.5)
-detectionNetwork.setBlobPath(nnPath)
+model.configure(detectionNetwork)
 detectionNetwork.setNumInferenceThreads(2)
 detectionNetwork.input.setBlocking(False)
 
-# Linking
+# Linking, the passthrough frames are the ones the NN ran on
 camRgb.preview.link(detectionNetwork.input)
-if syncNN:
-    detectionNetwork.passthrough.link(xoutRgb.input)
-else:
-    camRgb.preview.link(xoutRgb.input)
-
+detectionNetwork.passthrough.link(xoutRgb.input)
 detectionNetwork.out.link(nnOut.input)
 
-# Camera control
-controlIn = pipeline.create(dai.node.XLinkIn)
-controlIn.setStreamName("control")
-controlIn.out.link(camRgb.inputControl)
-
-# Connect to device and start pipeline
-with dai.Device(pipeline, usb2Mode=False) as device:
-    qControl = device.getInputQueue(name="control")
-    cc = dai.CameraControl()
-    cc.setManualExposure(1500, 100)
-    # qControl.send(cc)
-
-    # Output queues will be used to get the rgb frames and nn data from the outputs defined above
-    qRgb = device.getOutputQueue(name="rgb", maxSize=1, blocking=False)
-    qDet = device.getOutputQueue(name="nn", maxSize=1, blocking=False)
-
-    frame = None
-    detections = []
-    startTime = time.monotonic()
-    counter = 0
-    color2 = (255, 255, 255)
-
-    # nn data, being the bounding box locations, are in <0..1> range - they need to be normalized with frame width/height
-    def frameNorm(frame, bbox):
-        normVals = np.full(len(bbox), frame.shape[0])
-        normVals[::2] = frame.shape[1]
-        return (np.clip(np.array(bbox), 0, 1) * normVals).astype(int)
-
-    def displayFrame(name, frame):
-        color = (255, 0, 0)
-        output = "Pads in frame: "
-        for detection in detections:
-            bbox = frameNorm(frame, (detection.xmin, detection.ymin, detection.xmax, detection.ymax))
-            cv2.putText(frame, labelMap[detection.label], (bbox[0] + 10, bbox[1] + 20), cv2.FONT_HERSHEY_TRIPLEX, 0.5, 255)
-            cv2.putText(frame, f"{int(detection.confidence * 100)}%", (bbox[0] + 10, bbox[1] + 40), cv2.FONT_HERSHEY_TRIPLEX, 0.5, 255)
-            cv2.rectangle(frame, (bbox[0], bbox[1]), (bbox[2], bbox[3]), color, 2)
-            cv2.circle(
-                frame, 
-                (
-                    int((bbox[0] + bbox[2]) / 2),
-                    int((bbox[1] + bbox[3]) / 2)
-                ), 
-                4, 
-                (0, 255, 0),
-                10
-            )
-
-            output += (labelMap[detection.label] + " ")
-            
-        # Show the frame
-        print(output)
-        cv2.imshow(name, frame)
-
-    while True:
-        if syncNN:
-            inRgb = qRgb.get()
-            inDet = qDet.get()
-        else:
-            inRgb = qRgb.tryGet()
-            inDet = qDet.tryGet()
-
+counters = {
+    "camera": FpsCounter(),
+    "nn": FpsCounter(),
+    "render": FpsCounter(),
+    "record": FpsCounter()
+}
+# Frames paired with their detections, for the display and the recorder
+toRender = LatestQueue(2)
+toRecord = LatestQueue(60)
+running = True
+
+def capture(qRgb, qDet):
+    """
+    Pairs every frame with the detections of the same sequence number.
+    Whichever arrives first waits for the other, for a few frames at most.
+    """
+    frames = {}
+    detections = {}
+    while running:
+        inRgb = qRgb.tryGet()
+        inDet = qDet.tryGet()
+        if inRgb is None and inDet is None:
+            time.sleep(0.002)
+            continue
         if inRgb is not None:
-            frame = inRgb.getCvFrame()
-            cv2.putText(frame, "NN fps: {:.2f}".format(counter / (time.monotonic() - startTime)),
-                        (2, frame.shape[0] - 4), cv2.FONT_HERSHEY_TRIPLEX, 0.4, color2)
-
+            counters["camera"].tick()
+            frames[inRgb.getSequenceNum()] = inRgb
         if inDet is not None:
-            detections = inDet.detections
-            counter += 1
-
-        if frame is not None:
-            displayFrame("rgb", frame)
+            counters["nn"].tick()
+            detections[inDet.getSequenceNum()] = inDet.detections
+
+        for sequence in sorted(set(frames) & set(detections)):
+            frame = frames.pop(sequence).getCvFrame()
+            paired = detections.pop(sequence)
+            toRender.put((sequence, frame, paired))
+            # Fed from here, so a slow display doesn't drop recorded frames.
+            # The render thread draws on its frame, the recorder gets its own.
+            if args.record is not None:
+                toRecord.put((sequence, time.time(), frame.copy(), paired))
+        # Anything a few frames older than the newest will never be paired
+        if len(frames) + len(detections) == 0:
+            continue
+        newest = max(list(frames) + list(detections))
+        for pending in (frames, detections):
+            for sequence in [s for s in pending if s < newest - 4]:
+                del pending[sequence]
+
+def record(directory):
+    directory.mkdir(parents=True, exist_ok=True)
+    stem = datetime.now().strftime("%Y%m%d_%H%M%S")
+    writer = None
+    with directory.joinpath(stem + "_detections.jsonl").open("w") as sidecar:
+        while running or len(toRecord.items) > 0:
+            item = toRecord.get(0.1)
+            if item is None:
+                continue
+            (sequence, timestamp, frame, detections) = item
+            annotate(frame, detections)
+            if writer is None:
+                writer = cv2.VideoWriter(
+                    str(directory.joinpath(stem + ".avi")),
+                    cv2.VideoWriter_fourcc(*"MJPG"),
+                    args.fps,
+                    (frame.shape[1], frame.shape[0])
+                )
+            writer.write(frame)
+            sidecar.write(json.dumps({
+                "sequence": sequence,
+                "time": timestamp,
+                "detections": [
+                    {
+                        "pad": labelMap[d.label] if d.label < len(labelMap) else d.label,
+                        "confidence": d.confidence,
+                        "bbox": [d.xmin, d.ymin, d.xmax, d.ymax]
+                    } for d in detections
+                ]
+            }) + "\n")
+            counters["record"].tick()
+    if writer is not None:
+        writer.release()
+
+# nn data, being the bounding box locations, are in <0..1> range - they need to be normalized with frame width/height
+def frameNorm(frame, bbox):
+    normVals = np.full(len(bbox), frame.shape[0])
+    normVals[::2] = frame.shape[1]
+    return (np.clip(np.array(bbox), 0, 1) * normVals).astype(int)
+
+def annotate(frame, detections):
+    color = (255, 0, 0)
+    for detection in detections:
+        bbox = frameNorm(frame, (detection.xmin, detection.ymin, detection.xmax, detection.ymax))
+        label = labelMap[detection.label] if detection.label < len(labelMap) else str(detection.label)
+        cv2.putText(frame, label, (bbox[0] + 10, bbox[1] + 20), cv2.FONT_HERSHEY_TRIPLEX, 0.5, 255)
+        cv2.putText(frame, f"{int(detection.confidence * 100)}%", (bbox[0] + 10, bbox[1] + 40), cv2.FONT_HERSHEY_TRIPLEX, 0.5, 255)
+        cv2.rectangle(frame, (bbox[0], bbox[1]), (bbox[2], bbox[3]), color, 2)
+        cv2.circle(frame, (int((bbox[0] + bbox[2]) / 2), int((bbox[1] + bbox[3]) / 2)), 4, (0, 255, 0), 10)
+
+    stats = "cam {:.1f} nn {:.1f} render {:.1f} dropped {}".format(
+        counters["camera"].fps(), counters["nn"].fps(), counters["render"].fps(), toRender.dropped
+    )
+    if args.record is not None:
+        stats += " rec {:.1f} dropped {}".format(counters["record"].fps(), toRecord.dropped)
+    cv2.putText(frame, stats, (2, frame.shape[0] - 4), cv2.FONT_HERSHEY_TRIPLEX, 0.4, (255, 255, 255))
 
-        if cv2.waitKey(1) == ord('q'):
-            break
\ No newline at end of file
+# Connect to device and start pipeline
+with dai.Device(pipeline, usb2Mode=False) as device:
+    qRgb = device.getOutputQueue(name="rgb", maxSize=4, blocking=False)
+    qDet = device.getOutputQueue(name="nn", maxSize=4, blocking=False)
+
+    threads = [threading.Thread(target=capture, args=(qRgb, qDet), daemon=True)]
+    if args.record is not None:
+        threads.append(threading.Thread(target=record, args=(args.record,)))
+    for thread in threads:
+        thread.start()
+
+    try:
+        while True:
+            item = toRender.get(0.05)
+            if item is not None:
+                (sequence, frame, detections) = item
+                annotate(frame, detections)
+                cv2.imshow("rgb", frame)
+                counters["render"].tick()
+            if cv2.waitKey(1) == ord('q'):
+                break
+    finally:
+        running = False
+        for thread in threads:
+            thread.join()
@@ -1,4 +1,5 @@
 from pathlib import Path
+from typing import Dict, List, Tuple
 
 # Dictates stuff like whether we should connect to sitl or UART,
 # should we print to stdout or the drone GCS console.
@@ -6,12 +7,120 @@ DEVELOPMENT_MODE = True
 
 LOGS_DIRECTORY = Path("/home/pi/flight_logs/")
 
+# The venus.log of a flight is rotated at this size, keeping this many of
+# the rotated ones (see flightlog.py)
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUPS = 5
+
+# Old flights are deleted, oldest first, past this many of them or once they
+# take up this much of the SD card
+LOGS_MAX_FLIGHTS = 200
+LOGS_MAX_BYTES = 8 * 1024 * 1024 * 1024
+
+# How often the size of the current flight, which grows with the video
+# tape, is checked against LOGS_MAX_BYTES
+LOGS_CHECK_INTERVAL = 60 # In seconds
+
 TPS = 15 # How many ticks per second
 
 MAX_FAILURES = 30
 
 PAD_BLOBBING_DIST = 8 # meters
 
+# Whether the Eye runs an object tracker on the camera,
+# giving every pad a track id that persists between frames.
+OBJECT_TRACKING = False
+
+# The model export the Eye runs. Its metadata json (anchors, labels...)
+# has to sit next to it, see models.py.
+MODEL_PATH = Path("assets/detection_model.blob")
+
+# When set, detection runs on the CPU with the IR of the model, on the frames
+# of CPU_DETECTION_SOURCE (a video file or a directory of images) instead of
+# the OAK. Only meant for development without a camera.
+CPU_DETECTION_SOURCE: Path | None = None
+
+# The confidence a detection of each pad type (by its name) needs to be
+# used, checked on the host. A wrong pickup/dropoff label sends us to the
+# wrong pad, while a missed pad center just waits for the next frame.
+CONFIDENCE_THRESHOLDS: Dict[str, float] = {
+    "bottle dropoff": 0.55,
+    "bottle pickup": 0.55,
+    "medkit dropoff": 0.55,
+    "medkit pickup": 0.55,
+    "smores dropoff": 0.55,
+    "smores pickup": 0.55,
+    "pad center": 0.4
+}
+
+# The threshold of pad types missing from CONFIDENCE_THRESHOLDS
+DEFAULT_CONFIDENCE_THRESHOLD = 0.5
+
+# Pads of different types overlapping by this IoU are the same pad,
+# and only the most confident detection of it is kept.
+CROSS_CLASS_IOU = 0.5
+
+# A pad covered this much by a more confident pad is a part of it
+# (like its printed label), and is dropped as well.
+NESTED_COVERAGE = 0.8
+
+# The lens distortion correction made by _utils/calibrate_camera.py,
+# applied to detection centres if it exists.
+UNDISTORTION_MAP_PATH = Path("assets/undistortion.npz")
+
+# The camera settings found by _utils/exposure_search.py for every
+# lighting condition, loaded by the Eye at startup.
+EXPOSURE_PROFILES_PATH = Path("assets/exposure_profiles.json")
+
+# The lighting conditions, darkest last, by the most light the auto exposure
+# sees in them: exposure (us) * ISO / 100. The last one catches the rest.
+LIGHTING_CONDITIONS: List[Tuple[str, float]] = [
+    ("sunny", 300),
+    ("bright", 1500),
+    ("overcast", 6000),
+    ("dim", 30000),
+    ("dark", float("inf"))
+]
+
+# How long the auto exposure gets to settle before metering the light
+METERING_TIME = 1.0 # In seconds
+
+# The manual exposure (us) and ISO used when there are no profiles
+DEFAULT_EXPOSURE = (500, 200)
+
+# The port of the live preview server (see preview.py), or None to not run
+# it. Open http://localhost:<port>/ from a laptop after
+# `ssh -L <port>:localhost:<port> <pi address>`.
+PREVIEW_PORT: int | None = None
+
+# The address the preview binds to. It has no authentication, so it's only
+# reachable from the Pi itself (over an ssh tunnel) unless this is set to
+# "0.0.0.0" on purpose.
+PREVIEW_HOST = "127.0.0.1"
+
+# The preview is downscaled by PREVIEW_SCALE, and sent at most PREVIEW_MAX_FPS
+# times per second, using at most PREVIEW_CPU_BUDGET of a core to encode and
+# PREVIEW_MAX_BANDWIDTH bytes per second over all viewers.
+PREVIEW_SCALE = 0.5
+PREVIEW_MAX_FPS = 5
+PREVIEW_CPU_BUDGET = 0.1
+PREVIEW_MAX_BANDWIDTH = 200_000
+
+# The name of the shared memory frame bus the Eye publishes preview frames
+# to, for other processes like _utils/view_bus.py. When None, frames are
+# only published if center refinement or the preview need them, under
+# DEFAULT_FRAME_BUS_NAME.
+FRAME_BUS_NAME: str | None = None
+DEFAULT_FRAME_BUS_NAME = "venus-frames"
+
+# Whether the pad center is refined on the camera frames during
+# touchdown. Needs the frame bus, which is only published to during
+# touchdown (or while the preview is watched).
+CENTER_REFINEMENT = True
+
+# How many camera frames old a refinement can be and still be used
+REFINEMENT_MAX_AGE = 5
+
 # This should be smaller than WPNAV_SPEED_DN
 DESCENT_SPEED = 1.0 # m/s
 
@@ -42,4 +151,92 @@ MAX_ANGLE_DIFF = 25 # In degrees
 
 # The distance the rangefinder will read when the drone
 # is landed ( + upward tolerance).
-LANDED_ALT_LIDAR = 0.5 # In meters
\ No newline at end of file
+LANDED_ALT_LIDAR = 0.5 # In meters
+
+# Which vehicle talks to the autopilot: "pymavlink" for the lightweight
+# MavVehicle (see vehicle.py), which only decodes the messages we read, or
+# "dronekit" for the dronekit Vehicle. MavVehicle hasn't flown yet.
+VEHICLE_BACKEND = "dronekit"
+
+# The telemetry rates (in Hz) asked of the autopilot while guiding, by message
+# type. 0 stops a stream, these take up the serial link and nothing reads them.
+GUIDANCE_TELEMETRY: Dict[str, float] = {
+    "ATTITUDE": 50,
+    "GLOBAL_POSITION_INT": 20,
+    "DISTANCE_SENSOR": 20,
+    "RANGEFINDER": 20,
+    "RAW_IMU": 0,
+    "SCALED_IMU2": 0,
+    "SCALED_IMU3": 0,
+    "SCALED_PRESSURE": 0,
+    "SERVO_OUTPUT_RAW": 0,
+    "RC_CHANNELS": 0,
+    "NAV_CONTROLLER_OUTPUT": 0,
+    "LOCAL_POSITION_NED": 0,
+    "VIBRATION": 0,
+    "AHRS": 0,
+    "AHRS2": 0,
+    "POWER_STATUS": 0,
+    "MEMINFO": 0
+}
+
+# The telemetry profile of every state (by its name), see telemetry.py.
+# States without one, like Idle, get the default rates of the autopilot.
+TELEMETRY_PROFILES: Dict[str, Dict[str, float]] = {
+    "Descending": GUIDANCE_TELEMETRY,
+    "Aligning": GUIDANCE_TELEMETRY,
+    "Touching down": GUIDANCE_TELEMETRY
+}
+
+# How often the measured telemetry rates are logged while in a profile
+TELEMETRY_LOG_INTERVAL = 5 # In seconds
+
+# How many times per second the control loop (see control.py) steers Align
+# and Touchdown to their pad, or None to send a velocity per tick instead.
+CONTROL_RATE: float | None = 50
+
+# The kp, ki and kd of the control loop, on metres off the pad, in m/s
+CONTROL_GAINS = (0.8, 0.05, 0.3)
+
+# The most speed the integral of the control loop may add (anti-windup)
+CONTROL_INTEGRAL_LIMIT = 0.2 # m/s
+
+# A pad estimate older than this isn't steered to anymore
+CONTROL_TARGET_TIMEOUT = 1.0 # In seconds
+
+# Velocity setpoints are sent when they change by this much, at most
+# CONTROL_MAX_SEND_RATE times a second, and CONTROL_KEEPALIVE_RATE times
+# otherwise (ArduPilot stops the AV 3 seconds after the last one).
+CONTROL_SEND_DEADBAND = 0.05 # m/s
+CONTROL_MAX_SEND_RATE = 20
+CONTROL_KEEPALIVE_RATE = 2
+
+# The alpha-beta filter predicting the pad between NN results (see predict.py):
+# how much of a detection is trusted over the prediction, and how much of the
+# difference goes into the velocity of the pad
+PREDICT_ALPHA = 0.6
+PREDICT_BETA = 0.1
+
+# How long a detection took from the camera to the state machine
+PREDICT_LATENCY = 0.1 # In seconds
+
+# The pad isn't predicted anymore when it wasn't seen for this long
+PREDICT_TIMEOUT = 1.0 # In seconds
+
+# How long the vehicle may take to disarm in LAND after touchdown
+LAND_TIMEOUT = 60 # In seconds
+
+# How long the vehicle may take to become armable after it disarmed, and how
+# long to wait after it did before arming (arming right away fails)
+ARMABLE_TIMEOUT = 30 # In seconds
+ARMABLE_SETTLE_TIME = 1.5 # In seconds
+
+# How long the vehicle may take to arm, asking again every interval
+ARM_TIMEOUT = 10 # In seconds
+ARM_RETRY_INTERVAL = 2 # In seconds
+
+# How long the vehicle may take to go back into AUTO
+RESUME_TIMEOUT = 5 # In seconds
+
+# A mode change the vehicle hasn't reported yet is asked for again this often
+MODE_RETRY_INTERVAL = 1 # In seconds
\ No newline at end of file
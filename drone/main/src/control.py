@@ -0,0 +1,215 @@
+"""
+Velocity control at a rate of its own. Align and Touchdown only see the pad
+when a NN result comes in, at 15 FPS at best, and sending a velocity per
+result made the AV stop and start between frames. Instead, the states hand
+their latest estimate of the pad location to a ControlLoop, which steers
+towards it from the current position of the vehicle at CONTROL_RATE, with a
+PID per axis.
+
+The setpoints aren't all sent: only when they changed by more than
+CONTROL_SEND_DEADBAND (at most CONTROL_MAX_SEND_RATE per second), and at
+CONTROL_KEEPALIVE_RATE otherwise, so the serial link isn't flooded.
+"""
+
+from __future__ import annotations
+from math import cos, radians, sqrt
+from typing import Any, Callable, Tuple, TYPE_CHECKING
+import logging
+import threading
+import time
+
+from constants import *
+if TYPE_CHECKING:
+    from dronekit import LocationGlobal
+
+# Metres per degree of latitude, the same approximation as compute.dist
+METRES_PER_DEGREE = 1.113195e5
+
+def clamp(value: float, limit: float) -> float:
+    return max(-limit, min(limit, value))
+
+class PID:
+    """
+    A PID on a setpoint and a measurement. The derivative is taken of the
+    measurement, so a new setpoint doesn't kick it. Pass `rate`, the measured
+    derivative, when the measurement updates slower than the PID: a finite
+    difference would be zero between samples and spike on them. The integral is clamped to
+    `integralLimit` of output, and frozen while the output saturates away from
+    the setpoint (anti-windup).
+    """
+
+    kp: float
+    ki: float
+    kd: float
+    integralLimit: float
+    outputLimit: float
+    integral: float
+    lastMeasurement: float | None
+
+    def __init__(self, kp: float, ki: float, kd: float, integralLimit: float, outputLimit: float) -> None:
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.integralLimit = integralLimit
+        self.outputLimit = outputLimit
+        self.reset()
+
+    def reset(self) -> None:
+        self.integral = 0.0
+        self.lastMeasurement = None
+
+    def update(self, setpoint: float, measurement: float, dt: float, rate: float | None = None) -> float:
+        error = setpoint - measurement
+        derivative = 0.0
+        if rate is not None:
+            derivative = -rate
+        elif self.lastMeasurement is not None and dt > 0:
+            derivative = -(measurement - self.lastMeasurement) / dt
+        self.lastMeasurement = measurement
+
+        unsaturated = self.kp * error + self.ki * self.integral + self.kd * derivative
+        if abs(unsaturated) < self.outputLimit or (error > 0) != (unsaturated > 0):
+            self.integral += error * dt
+            if self.ki > 0:
+                self.integral = clamp(self.integral, self.integralLimit / self.ki)
+        output = self.kp * error + self.ki * self.integral + self.kd * derivative
+        return clamp(output, self.outputLimit)
+
+class ControlLoop:
+    vehicle: Any
+    # Sends a NED velocity, positive z is down
+    send: Callable[[float, float, float], None]
+    rate: float
+    pidNorth: PID
+    pidEast: PID
+    # The pad location, the vertical speed and the most horizontal speed, and
+    # when the location was estimated. Swapped in whole by `command`.
+    target: Tuple[LocationGlobal | None, float, float, float]
+    # The local frame the PIDs run in, centred on the first target
+    origin: LocationGlobal | None
+    engaged: bool
+    lastSent: Tuple[float, float, float] | None
+    lastSendTime: float
+    sent: int
+    stopped: threading.Event
+    thread: threading.Thread
+
+    def __init__(self, vehicle: Any, send: Callable[[float, float, float], None], rate: float) -> None:
+        self.vehicle = vehicle
+        self.send = send
+        self.rate = rate
+        (kp, ki, kd) = CONTROL_GAINS
+        self.pidNorth = PID(kp, ki, kd, CONTROL_INTEGRAL_LIMIT, AIRSPEED)
+        self.pidEast = PID(kp, ki, kd, CONTROL_INTEGRAL_LIMIT, AIRSPEED)
+        self.target = (None, 0.0, 0.0, 0.0)
+        self.origin = None
+        self.engaged = False
+        self.lastSent = None
+        self.lastSendTime = 0.0
+        self.sent = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def engage(self) -> None:
+        """
+        Starts sending setpoints, for a new target.
+        """
+        self.target = (None, 0.0, 0.0, 0.0)
+        self.origin = None
+        self.pidNorth.reset()
+        self.pidEast.reset()
+        self.lastSent = None
+        self.engaged = True
+
+    def disengage(self) -> None:
+        self.engaged = False
+
+    def command(self, location: LocationGlobal | None, verticalSpeed: float, maxSpeed: float) -> None:
+        """
+        Called every tick by the state. A None location means there was no
+        new estimate, so the last one is steered to until it's too old.
+        """
+        (lastLocation, lastVerticalSpeed, lastMaxSpeed, estimated) = self.target
+        if location is None:
+            # Most ticks, so the target is only swapped when it changed
+            if verticalSpeed != lastVerticalSpeed or maxSpeed != lastMaxSpeed:
+                self.target = (lastLocation, verticalSpeed, maxSpeed, estimated)
+        else:
+            self.target = (location, verticalSpeed, maxSpeed, time.monotonic())
+
+    def toLocal(self, location: LocationGlobal) -> Tuple[float, float]:
+        origin: LocationGlobal = self.origin # type: ignore
+        north = (location.lat - origin.lat) * METRES_PER_DEGREE
+        east = (location.lon - origin.lon) * METRES_PER_DEGREE * cos(radians(origin.lat))
+        return (north, east)
+
+    def step(self, now: float, dt: float) -> Tuple[float, float, float]:
+        """
+        The velocity to fly at now, from the target and the vehicle position.
+        """
+        (location, verticalSpeed, maxSpeed, estimated) = self.target
+        position = self.vehicle.location.global_frame
+        if location is None or now - estimated > CONTROL_TARGET_TIMEOUT or position.lat is None:
+            # Nothing to steer to, hover over where we are
+            self.pidNorth.reset()
+            self.pidEast.reset()
+            return (0.0, 0.0, verticalSpeed)
+
+        if self.origin is None:
+            self.origin = location
+        (targetNorth, targetEast) = self.toLocal(location)
+        (north, east) = self.toLocal(position)
+        self.pidNorth.outputLimit = maxSpeed
+        self.pidEast.outputLimit = maxSpeed
+        # The position only updates at the GLOBAL_POSITION_INT rate, its
+        # velocity is the derivative the PIDs damp with
+        velocity = self.vehicle.velocity
+        if velocity is None or velocity[0] is None or velocity[1] is None:
+            velocity = (None, None)
+        vNorth = self.pidNorth.update(targetNorth, north, dt, velocity[0])
+        vEast = self.pidEast.update(targetEast, east, dt, velocity[1])
+
+        # The PIDs limit every axis, this limits the diagonal
+        speed = sqrt(vNorth * vNorth + vEast * vEast)
+        if speed > maxSpeed:
+            (vNorth, vEast) = (vNorth * maxSpeed / speed, vEast * maxSpeed / speed)
+        return (vNorth, vEast, verticalSpeed)
+
+    def maybeSend(self, velocity: Tuple[float, float, float], now: float) -> bool:
+        """
+        Sends `velocity` if it changed enough, or the last one is getting old.
+        """
+        sinceSend = now - self.lastSendTime
+        changed = self.lastSent is None or max(abs(a - b) for (a, b) in zip(velocity, self.lastSent)) >= CONTROL_SEND_DEADBAND
+        if (changed and sinceSend >= 1.0 / CONTROL_MAX_SEND_RATE) or sinceSend >= 1.0 / CONTROL_KEEPALIVE_RATE:
+            self.send(*velocity)
+            self.lastSent = velocity
+            self.lastSendTime = now
+            self.sent += 1
+            return True
+        return False
+
+    def run(self) -> None:
+        period = 1.0 / self.rate
+        last = time.monotonic()
+        nextTime = last
+        while not self.stopped.is_set():
+            nextTime += period
+            now = time.monotonic()
+            if self.engaged:
+                try:
+                    self.maybeSend(self.step(now, now - last), now)
+                except Exception as e:
+                    logging.info("A control step failed: " + str(e.args))
+            last = now
+            # Keeps the rate, without catching up on missed steps
+            nextTime = max(nextTime, time.monotonic())
+            self.stopped.wait(nextTime - time.monotonic())
+
+    def stop(self) -> None:
+        self.stopped.set()
+        if self.thread.is_alive():
+            self.thread.join()
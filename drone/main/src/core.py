@@ -0,0 +1,247 @@
+"""
+The pure Python core of Venus: the types detections are made of, and the
+geometry the landing machine runs on. Importing it doesn't load depthai,
+dronekit or pymavlink, so tools and tests which only need the math start in
+a fraction of the time. Locations and vehicles are duck typed, anything with
+a `lat` and a `lon` works, like dronekit's LocationGlobal.
+"""
+
+from __future__ import annotations
+from enum import Enum
+from math import tan, radians, sqrt, atan2, sin, cos, degrees
+from typing import Any, Tuple, List, Dict
+
+from constants import PAD_BLOBBING_DIST
+
+HEIGHT_FOV = 55
+WIDTH_FOV = 69
+
+class PadType(Enum):
+    bottleDropoff = 'bottle dropoff'
+    bottlePickup = 'bottle pickup'
+    medkitDropoff = 'medkit dropoff'
+    medkitPickup = 'medkit pickup'
+    smoresDropoff = 'smores dropoff'
+    smoresPickup = 'smores pickup'
+    padCenter = 'pad center'
+
+def intoPadType(input: int) -> PadType | None:
+    """
+    The pad type of a numerical pad id, like the ones on GUIDED_ENABLE
+    commands. Labels of a model are mapped by its `ModelSpec` instead.
+    """
+    if input == 0:
+        return PadType.bottleDropoff
+    elif input == 1:
+        return PadType.bottlePickup
+    elif input == 2:
+        return PadType.medkitDropoff
+    elif input == 3:
+        return PadType.medkitPickup
+    elif input == 4:
+        return PadType.smoresDropoff
+    elif input == 5:
+        return PadType.smoresPickup
+    elif input == 6:
+        return PadType.padCenter
+    else:
+        return None
+
+class TrackStatus(Enum):
+    new = 'new'
+    tracked = 'tracked'
+    lost = 'lost'
+
+class PixelCoords:
+    """
+    Pixel coordinates ranging from 0.0 - 1.0, with the origin
+    at the top left.
+    """
+
+    x: float
+    y: float
+
+    def __init__(self, x: float, y: float) -> None:
+        self.x = x
+        self.y = y
+
+class PixelDetection:
+    """
+    A single pad seen by the camera. When the object tracker is enabled,
+    `trackId` stays the same for a pad across frames, and `velocity` is
+    the movement of the pad in normalized pixel coords per second.
+    `bbox` is the normalized (xmin, ymin, xmax, ymax) box of the pad, and
+    `sequence` the sequence number of the camera frame it was seen on.
+    """
+
+    padType: PadType
+    normalizedCoords: PixelCoords
+    confidence: float
+    trackId: int | None
+    trackStatus: TrackStatus | None
+    velocity: PixelCoords | None
+    bbox: Tuple[float, float, float, float] | None
+    sequence: int | None
+
+    def __init__(
+            self, 
+            padType: PadType, 
+            normalizedCoords: PixelCoords, 
+            confidence: float,
+            trackId: int | None = None,
+            trackStatus: TrackStatus | None = None,
+            velocity: PixelCoords | None = None,
+            bbox: Tuple[float, float, float, float] | None = None,
+            sequence: int | None = None
+        ) -> None:
+        self.padType = padType
+        self.normalizedCoords = normalizedCoords
+        self.confidence = confidence
+        self.trackId = trackId
+        self.trackStatus = trackStatus
+        self.velocity = velocity
+        self.bbox = bbox
+        self.sequence = sequence
+
+def dist(aLocation1: Any, aLocation2: Any) -> float:
+    """
+    Returns the ground distance in metres between two `LocationGlobal` objects.
+
+    This method is an approximation, and will not be accurate over large distances and close to the
+    earth's poles. It comes from the ArduPilot test code.
+    """
+    dlat = aLocation2.lat - aLocation1.lat
+    dlong = aLocation2.lon - aLocation1.lon
+    return sqrt((dlat*dlat) + (dlong*dlong)) * 1.113195e5
+
+def individualDist(loc1: Any, loc2: Any) -> Tuple[float, float]:
+    # `dist` of the latitudes and the longitudes alone
+    return (abs(loc2.lat - loc1.lat) * 1.113195e5, abs(loc2.lon - loc1.lon) * 1.113195e5)
+
+class LocationDetection:
+    padType: PadType
+    # A dronekit LocationGlobal, blobbing changes it in place
+    location: Any
+    confidence: float
+    trackId: int | None
+
+    def __init__(self, padType, location, confidence, trackId = None) -> None:
+        self.padType = padType
+        self.location = location
+        self.confidence = confidence
+        self.trackId = trackId
+
+    def __str__(self) -> str:
+        return "{" + str(self.confidence) + "; lat " + str(self.location.lat) + "; lon " + str(self.location.lon) + "}"
+
+class Conductor:
+    detections: List[LocationDetection]
+    optimistic: bool
+    # Which blob each track id from the object tracker belongs to
+    tracks: Dict[int, LocationDetection]
+
+    def __init__(self):
+        self.detections = []
+        self.optimistic = False
+        self.tracks = {}
+
+    def add_detections(self, new: List[LocationDetection]) -> None:
+        """
+        Adds a list of detections to this conductor, and blobs some
+        if they are too similar. Detections with a known track id are
+        blobbed straight into the blob of their track.
+        """
+
+        for detNew in new:
+            blob: LocationDetection | None = None
+            if detNew.trackId is not None:
+                tracked = self.tracks.get(detNew.trackId)
+                if tracked is not None and tracked.padType == detNew.padType:
+                    blob = tracked
+
+            if blob is None:
+                for det in self.detections:
+                    if detNew.padType == det.padType and dist(detNew.location, det.location) <= PAD_BLOBBING_DIST:
+                        blob = det
+                        break
+
+            if blob is not None:
+                # Average out the positions
+                blob.location.lat += detNew.location.lat
+                blob.location.lat /= 2
+                blob.location.lon += detNew.location.lon
+                blob.location.lon /= 2
+
+                # Add to the confidence
+                blob.confidence += detNew.confidence
+            else:
+                blob = detNew
+                self.detections.append(detNew)
+
+            if detNew.trackId is not None:
+                self.tracks[detNew.trackId] = blob
+
+    def get_best_guess(self, type: PadType) -> LocationDetection | None:
+        """
+        Gets the best guess for a pad location, based on a pad type
+        """
+
+        best: LocationDetection | None = None
+
+        for det in self.detections:
+            if (self.optimistic or det.padType == type) and (best is None or det.confidence > best.confidence):
+                best = det
+
+        return best
+
+
+def relativeDistance(altitude: int, coords: PixelCoords, yaw: int) -> Tuple[float, float]:
+    """
+    Given the vehicle altitude, and some normalized pixel coords (0.0 - 1.0),
+    output the relative horizontal distance from the AV, to the coords. Essentially,
+    convert from viewport to relative world position.
+
+    This calculation does consider the AV's yaw (in degrees), but not orientation in 
+    general.
+    """
+    viewportWidth = 2.0 * ( tan(radians(WIDTH_FOV / 2.0)) * altitude )
+    viewportHeight = 2.0 * ( tan(radians(HEIGHT_FOV / 2.0)) * altitude )
+    coordsShifted = (coords.x - 0.5, (1.0 - coords.y) - 0.5)
+    vector = (coordsShifted[0] * viewportWidth, coordsShifted[1] * viewportHeight)
+
+    # The vector needs to be compensated for yaw
+    magnitude = sqrt((vector[0] * vector[0]) + (vector[1] * vector[1]))
+    angleRad = atan2(vector[1], vector[0])
+    angleRad += radians(yaw)
+    return (magnitude * cos(angleRad), magnitude * sin(angleRad))
+
+def angleDiff(
+    distances: Tuple[float, float], altDiff: float
+) -> Tuple[float, float]:
+    """
+    Returns the difference in degrees between two objects if they are
+    `distances` apart and `altDiff` apart.
+    """
+
+    x = degrees(atan2(distances[0], altDiff))
+    y = degrees(atan2(distances[1], altDiff))
+
+    return (y, x) # im not sure why flip these
+
+
+def changeMagnitude(vector: Tuple[float, float], mag: float) -> Tuple[float, float]:
+    if vector == (0, 0):
+        return (0, 0)
+    angle = atan2(vector[1], vector[0])
+    return (mag * cos(angle), mag * sin(angle))
+
+def getAGL(vehicle: Any) -> float:
+    """
+    Attempts to get a AGL altitude (rangefinders)
+    """
+    if (vehicle.rangefinder is not None 
+        and vehicle.rangefinder.distance is not None
+        and vehicle.rangefinder.distance != 0.0
+        and vehicle.location.global_relative_frame.alt <= 2.0):
+        return vehicle.rangefinder.distance
+    return vehicle.location.global_relative_frame.alt
@@ -0,0 +1,323 @@
+"""
+Runs the image recognition on the CPU through OpenVINO, using the IR exports
+of the detection model (best.xml + best.bin). This lets the guidance system and
+the tools run on machines without an OAK attached, with frames coming from a
+video file or a directory of images instead of a camera.
+"""
+
+from __future__ import annotations
+from pathlib import Path
+from poltergeist import Result, Ok, Err
+from typing import Any, Dict, Iterator, List, Tuple
+import queue
+import threading
+import time
+import cv2 # type: ignore
+import numpy as np
+import openvino as ov # type: ignore
+
+from optics import PixelCoords, PixelDetection, filterDetections, lowestConfidenceThreshold
+from models import ModelSpec
+
+IMAGE_SUFFIXES = [".png", ".jpg", ".jpeg", ".bmp"]
+
+def readFrames(source: Path) -> Iterator[np.ndarray]:
+    """
+    Yields BGR frames from a video file (anything OpenCV can decode,
+    including the raw .h265 tapes), or from every image in a directory.
+    """
+    if source.is_dir():
+        for path in sorted(source.iterdir()):
+            if path.suffix.lower() in IMAGE_SUFFIXES:
+                frame = cv2.imread(str(path), cv2.IMREAD_COLOR)
+                if frame is not None:
+                    yield frame
+        return
+
+    capture = cv2.VideoCapture(str(source))
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                return
+            yield frame
+    finally:
+        capture.release()
+
+def preprocess(frame: np.ndarray, inputSize: Tuple[int, int]) -> np.ndarray:
+    """
+    Squashes a BGR frame into the NN input, the same way the OAK preview does
+    (without keeping the aspect ratio), in planar layout. The model does the
+    scaling to 0.0 - 1.0 by itself.
+    """
+    resized = cv2.resize(frame, inputSize, interpolation=cv2.INTER_LINEAR)
+    return resized.transpose(2, 0, 1).astype(np.float32)
+
+def decodeYolo(
+        outputs: List[np.ndarray],
+        model: ModelSpec,
+        threshold: float | None = None
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Decodes the raw YOLOv5 heads of a single image. Every output has the shape
+    (anchors * (5 + classes), side, side) and already went through a sigmoid.
+    Returns the boxes (normalized xmin, ymin, xmax, ymax), the confidences and the
+    labels of every candidate above `threshold`, or the threshold of the model.
+    """
+    if threshold is None:
+        threshold = model.confidenceThreshold
+    (width, height) = model.inputSize
+    anchors = np.array(model.anchors, dtype=np.float32).reshape(-1, 2)
+
+    allBoxes = []
+    allScores = []
+    allLabels = []
+    for output in outputs:
+        side = output.shape[-1]
+        mask = model.anchorMasks["side" + str(side)]
+        grid = output.reshape(len(mask), 5 + model.numClasses, side, side)
+
+        objectness = grid[:, 4]
+        classes = grid[:, 5:]
+        labels = classes.argmax(axis=1)
+        scores = objectness * classes.max(axis=1)
+
+        (a, y, x) = np.nonzero(scores >= threshold)
+        if len(a) == 0:
+            continue
+        cell = grid[a, :, y, x]
+
+        strideX = width / side
+        strideY = height / side
+        centerX = (cell[:, 0] * 2.0 - 0.5 + x) * strideX
+        centerY = (cell[:, 1] * 2.0 - 0.5 + y) * strideY
+        boxAnchors = anchors[np.array(mask)[a]]
+        boxWidth = (cell[:, 2] * 2.0) ** 2 * boxAnchors[:, 0]
+        boxHeight = (cell[:, 3] * 2.0) ** 2 * boxAnchors[:, 1]
+
+        allBoxes.append(np.stack([
+            (centerX - boxWidth / 2) / width,
+            (centerY - boxHeight / 2) / height,
+            (centerX + boxWidth / 2) / width,
+            (centerY + boxHeight / 2) / height
+        ], axis=1))
+        allScores.append(scores[a, y, x])
+        allLabels.append(labels[a, y, x])
+
+    if len(allBoxes) == 0:
+        return (np.zeros((0, 4), np.float32), np.zeros(0, np.float32), np.zeros(0, np.int64))
+    return (np.concatenate(allBoxes), np.concatenate(allScores), np.concatenate(allLabels))
+
+def nms(boxes: np.ndarray, scores: np.ndarray, labels: np.ndarray, iouThreshold: float) -> np.ndarray:
+    """
+    Per-class non maximum suppression, like the OAK runs it. Returns the indices
+    of the boxes that were kept, best first.
+    """
+    # Offset the boxes of every class so they can never overlap each other
+    offsets = labels.astype(np.float32)[:, None] * 2.0
+    shifted = boxes + offsets
+    areas = (shifted[:, 2] - shifted[:, 0]) * (shifted[:, 3] - shifted[:, 1])
+
+    order = scores.argsort()[::-1]
+    keep = []
+    while len(order) > 0:
+        best = order[0]
+        keep.append(best)
+        rest = order[1:]
+
+        xmin = np.maximum(shifted[best, 0], shifted[rest, 0])
+        ymin = np.maximum(shifted[best, 1], shifted[rest, 1])
+        xmax = np.minimum(shifted[best, 2], shifted[rest, 2])
+        ymax = np.minimum(shifted[best, 3], shifted[rest, 3])
+        intersection = np.clip(xmax - xmin, 0, None) * np.clip(ymax - ymin, 0, None)
+        iou = intersection / (areas[best] + areas[rest] - intersection)
+
+        order = rest[iou <= iouThreshold]
+    return np.array(keep, dtype=np.int64)
+
+def intoPixelDetections(
+        boxes: np.ndarray,
+        scores: np.ndarray,
+        labels: np.ndarray,
+        model: ModelSpec
+    ) -> List[PixelDetection]:
+    results: List[PixelDetection] = []
+    for i in nms(boxes, scores, labels, model.iouThreshold):
+        padType = model.intoPadType(int(labels[i]))
+        if padType is None:
+            # Just skip it
+            continue
+        (xmin, ymin, xmax, ymax) = boxes[i]
+        results.append(PixelDetection(
+            padType,
+            PixelCoords(float(xmin + xmax) / 2, float(ymin + ymax) / 2),
+            float(scores[i]),
+            bbox=(float(xmin), float(ymin), float(xmax), float(ymax))
+        ))
+    return results
+
+class CpuDetector:
+    """
+    The compiled IR of a model, with an inference queue of `jobs` requests
+    running `batchSize` frames each on OpenVINO's worker threads.
+    """
+
+    model: ModelSpec
+    compiled: Any
+    inferQueue: Any
+    batchSize: int
+
+    def __init__(self, model: ModelSpec, batchSize: int = 1, jobs: int = 2, threads: int | None = None) -> None:
+        if model.xmlPath is None:
+            raise FileNotFoundError("Model " + model.name + " has no IR to run on the CPU")
+        self.model = model
+        self.batchSize = batchSize
+
+        core = ov.Core()
+        network = core.read_model(model.xmlPath)
+        # The IR already takes one frame, it's only reshaped to take batches
+        if batchSize != 1:
+            (width, height) = self.model.inputSize
+            network.reshape([batchSize, 3, height, width])
+
+        config: Dict[str, Any] = { "PERFORMANCE_HINT": "THROUGHPUT" }
+        if threads is not None:
+            config["INFERENCE_NUM_THREADS"] = threads
+        self.compiled = core.compile_model(network, "CPU", config)
+        self.inferQueue = ov.AsyncInferQueue(self.compiled, jobs)
+
+    def outputsOf(self, request: Any, count: int) -> List[List[np.ndarray]]:
+        """
+        Splits the outputs of a finished request into the outputs of each frame.
+        """
+        heads = [request.get_output_tensor(i).data for i in range(len(self.compiled.outputs))]
+        return [[head[b] for head in heads] for b in range(count)]
+
+    def makeBatch(self, frames: List[np.ndarray]) -> np.ndarray:
+        batch = np.zeros((self.batchSize, 3, self.model.inputSize[1], self.model.inputSize[0]), np.float32)
+        for (i, frame) in enumerate(frames):
+            batch[i] = preprocess(frame, self.model.inputSize)
+        return batch
+
+    def detect(self, frames: List[np.ndarray]) -> List[List[PixelDetection]]:
+        """
+        Synchronously runs detection on a list of frames, keeping the inference
+        queue full. Results are in the same order as the frames.
+        """
+        results: List[List[PixelDetection]] = [[] for _ in frames]
+
+        def done(request: Any, userdata: Tuple[int, int]) -> None:
+            (start, count) = userdata
+            for (i, outputs) in enumerate(self.outputsOf(request, count)):
+                results[start + i] = intoPixelDetections(*decodeYolo(outputs, self.model), self.model)
+
+        self.inferQueue.set_callback(done)
+        for start in range(0, len(frames), self.batchSize):
+            chunk = frames[start:start + self.batchSize]
+            self.inferQueue.start_async(self.makeBatch(chunk), (start, len(chunk)))
+        self.inferQueue.wait_all()
+        return results
+
+class CpuEye:
+    """
+    A drop-in replacement for the Eye, which reads frames from `source` on a
+    background thread and runs them through a `CpuDetector`. Ticking never
+    blocks, and returns the freshest detections just like the OAK queue does.
+    """
+
+    detector: CpuDetector
+    source: Path
+    fps: float | None
+    results: queue.Queue[List[PixelDetection]]
+    reader: threading.Thread
+    running: bool
+    error: Exception | None
+    latest: List[PixelDetection]
+
+    def __init__(self, detector: CpuDetector, source: Path, fps: float | None) -> None:
+        self.detector = detector
+        self.source = source
+        self.fps = fps
+        self.results = queue.Queue()
+        self.running = True
+        self.error = None
+        self.latest = []
+        self.reader = threading.Thread(target=self.readLoop, daemon=True)
+
+    @staticmethod
+    def new(model: ModelSpec, source: Path, fps: float | None = 15, batchSize: int = 1, jobs: int = 2) -> Result[CpuEye, Exception]:
+        """
+        Creates a CpuEye running the IR of `model` on the frames of `source`,
+        which is a video file or a directory of images. Frames are fed at `fps`,
+        or as fast as the CPU allows if it is None.
+        This constructor will not raise exceptions.
+        """
+        try:
+            if not source.exists():
+                return Err(FileNotFoundError(str(source)))
+            eye = CpuEye(CpuDetector(model, batchSize, jobs), source, fps)
+            eye.detector.inferQueue.set_callback(eye.done)
+            eye.reader.start()
+            return Ok(eye)
+        except Exception as e:
+            return Err(e)
+
+    def done(self, request: Any, count: int) -> None:
+        for outputs in self.detector.outputsOf(request, count):
+            # Like on the OAK, every pad type gets its own threshold afterwards
+            candidates = decodeYolo(outputs, self.detector.model, lowestConfidenceThreshold())
+            detections = intoPixelDetections(*candidates, self.detector.model)
+            self.results.put(filterDetections(detections))
+
+    def readLoop(self) -> None:
+        try:
+            batch: List[np.ndarray] = []
+            for frame in readFrames(self.source):
+                if not self.running:
+                    break
+                startTime = time.monotonic()
+
+                batch.append(frame)
+                if len(batch) == self.detector.batchSize:
+                    # Waits for an idle request when all of them are busy
+                    self.detector.inferQueue.start_async(self.detector.makeBatch(batch), len(batch))
+                    batch = []
+
+                if self.fps is not None:
+                    time.sleep(max(0.0, (1.0 / self.fps) - (time.monotonic() - startTime)))
+            if len(batch) > 0:
+                self.detector.inferQueue.start_async(self.detector.makeBatch(batch), len(batch))
+            self.detector.inferQueue.wait_all()
+        except Exception as e:
+            self.error = e
+
+    def close(self) -> None:
+        self.running = False
+        self.reader.join()
+
+    def tick(self) -> Result[List[PixelDetection] | None, Exception]:
+        """
+        If successful, returns the latest detections.
+        Returns None if no new data can be given.
+        This method will not raise any exceptions.
+        """
+        if self.error is not None:
+            return Err(self.error)
+
+        latest = None
+        try:
+            while True:
+                latest = self.results.get_nowait()
+        except queue.Empty:
+            pass
+        if latest is not None:
+            self.latest = latest
+        return Ok(latest)
+
+    def updateVideoTape(self) -> Result[None, Exception]:
+        # There is no camera to tape
+        return Ok(None)
+
+    def updateFrameBus(self) -> Result[None, Exception]:
+        # Frames aren't published from files
+        return Ok(None)
@@ -0,0 +1,138 @@
+"""
+Camera exposure profiles. The best manual exposure, ISO and white balance
+for detecting pads depends on the light, so `_utils/exposure_search.py`
+sweeps them per lighting condition and stores the winners here. At startup,
+the Eye meters the light with the auto exposure once, and loads the profile
+of the condition it falls in.
+"""
+
+from __future__ import annotations
+from pathlib import Path
+from poltergeist import Result, Ok, Err
+from typing import Any, Dict, List, TYPE_CHECKING
+import json
+import time
+
+from constants import LIGHTING_CONDITIONS, METERING_TIME
+
+if TYPE_CHECKING:
+    import depthai as dai # type: ignore
+    from optics import PixelDetection
+
+class ExposureProfile:
+    """
+    Manual camera settings. `exposure` is in microseconds, `whiteBalance` in
+    kelvin, or None to keep the auto white balance. `score` is what the
+    settings scored when they were searched (see `scoreFrames`).
+    """
+
+    condition: str
+    exposure: int
+    iso: int
+    whiteBalance: int | None
+    score: float
+
+    def __init__(self, condition: str, exposure: int, iso: int, whiteBalance: int | None = None, score: float = 0.0) -> None:
+        self.condition = condition
+        self.exposure = exposure
+        self.iso = iso
+        self.whiteBalance = whiteBalance
+        self.score = score
+
+    def apply(self, control: Any) -> None:
+        """
+        Sets these settings on a dai.CameraControl.
+        """
+        control.setManualExposure(self.exposure, self.iso)
+        if self.whiteBalance is not None:
+            control.setManualWhiteBalance(self.whiteBalance)
+
+    def intoJson(self) -> Dict[str, Any]:
+        return {
+            "exposure": self.exposure,
+            "iso": self.iso,
+            "white_balance": self.whiteBalance,
+            "score": self.score
+        }
+
+def lightingCondition(exposure: float, iso: float) -> str:
+    """
+    Buckets the light by what the auto exposure chose for it: the darker it
+    is, the longer the exposure and the higher the ISO.
+    """
+    brightness = exposure * iso / 100
+    for (condition, limit) in LIGHTING_CONDITIONS:
+        if brightness <= limit:
+            return condition
+    return LIGHTING_CONDITIONS[-1][0]
+
+def meterLighting(controlQueue: dai.DataInputQueue, stillQueue: dai.DataOutputQueue) -> Result[str, Exception]:
+    """
+    Lets the auto exposure settle, then captures a single still to read the
+    exposure and ISO it settled on, and returns the lighting condition.
+    Streaming frames just for this would eat into the USB bandwidth.
+    This function will not raise exceptions.
+    """
+    try:
+        # Only needed with a device open, loading the profiles doesn't need it
+        import depthai as dai # type: ignore
+        time.sleep(METERING_TIME)
+        control = dai.CameraControl()
+        control.setCaptureStill(True)
+        controlQueue.send(control)
+
+        deadline = time.monotonic() + METERING_TIME + 1.0
+        while time.monotonic() < deadline:
+            still: dai.ImgFrame | None = stillQueue.tryGet() # type: ignore
+            if still is not None:
+                exposure = still.getExposureTime().total_seconds() * 1e6
+                return Ok(lightingCondition(exposure, still.getSensitivity()))
+            time.sleep(0.05)
+        return Err(TimeoutError("The camera never sent a still to meter the light with"))
+    except Exception as e:
+        return Err(e)
+
+def loadProfiles(path: Path) -> Result[Dict[str, ExposureProfile], Exception]:
+    """
+    Loads the profiles saved by the exposure search, keyed by lighting condition.
+    This function will not raise exceptions.
+    """
+    try:
+        config = json.loads(path.read_text())
+        return Ok({
+            condition: ExposureProfile(condition, int(p["exposure"]), int(p["iso"]), p.get("white_balance"), float(p.get("score", 0.0)))
+            for (condition, p) in config.items()
+        })
+    except Exception as e:
+        return Err(e)
+
+def saveProfiles(path: Path, profiles: Dict[str, ExposureProfile]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({ c: p.intoJson() for (c, p) in profiles.items() }, indent=4))
+
+def selectProfile(profiles: Dict[str, ExposureProfile], condition: str) -> ExposureProfile | None:
+    """
+    The profile of a lighting condition. If there is none, the profile of
+    the closest condition that was searched, since it's still a better
+    guess than a fixed exposure.
+    """
+    if condition in profiles:
+        return profiles[condition]
+    order = [c for (c, _) in LIGHTING_CONDITIONS]
+    if condition not in order:
+        return None
+    searched = [c for c in order if c in profiles]
+    if len(searched) == 0:
+        return None
+    closest = min(searched, key=lambda c: abs(order.index(c) - order.index(condition)))
+    return profiles[closest]
+
+def scoreFrames(frames: List[List[PixelDetection]]) -> float:
+    """
+    Scores camera settings by the detections they got: the summed confidence
+    of the pads per frame, averaged over the frames. More pads and surer
+    detections both score higher.
+    """
+    if len(frames) == 0:
+        return 0.0
+    return sum(sum(d.confidence for d in detections) for detections in frames) / len(frames)
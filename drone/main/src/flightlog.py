@@ -0,0 +1,203 @@
+"""
+The logs of every flight, in a directory of its own under LOGS_DIRECTORY.
+Flight ids come from a counter kept next to the flights, so booting doesn't
+go over all of them, and a directory is claimed by creating it, so two
+flights never share one.
+
+Nothing is written on the thread that logs: records go through a queue to a
+listener thread, which writes them into venus.log, rotated at LOG_MAX_BYTES.
+Another thread compresses the logs of the old flights, and deletes the oldest
+flights past LOGS_MAX_FLIGHTS or LOGS_MAX_BYTES, so the SD card can't fill up.
+The current flight keeps growing with its video tape, so the thread checks
+its size again every LOGS_CHECK_INTERVAL for the rest of the flight.
+"""
+
+from __future__ import annotations
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from pathlib import Path
+from poltergeist import Err, catch
+from typing import List
+import gzip
+import logging
+import os
+import queue
+import shutil
+import threading
+
+from constants import LOG_MAX_BYTES, LOG_BACKUPS, LOGS_MAX_FLIGHTS, LOGS_MAX_BYTES, LOGS_CHECK_INTERVAL
+
+# The id of the next flight, in the logs directory
+COUNTER_FILE = "next_flight"
+
+LOG_FORMAT = "( %(asctime)s ) %(message)s"
+LOG_DATE_FORMAT = "%m/%d/%Y %I:%M:%S %p"
+
+def flightIds(directory: Path) -> List[int]:
+    """
+    The ids of the flights in `directory`, oldest first.
+    """
+    return sorted(int(entry.name) for entry in directory.iterdir() if entry.is_dir() and entry.name.isdigit())
+
+def claimFlight(directory: Path) -> Path:
+    """
+    Creates the directory of the next flight, and counts it.
+    """
+    counter = directory.joinpath(COUNTER_FILE)
+    try:
+        flightId = int(counter.read_text())
+    except (FileNotFoundError, ValueError):
+        # Logs from before the counter, or a broken one. Only happens once.
+        ids = flightIds(directory)
+        flightId = ids[-1] + 1 if len(ids) > 0 else 0
+
+    while True:
+        flightDir = directory.joinpath(str(flightId))
+        try:
+            # Whoever creates it first owns it
+            os.mkdir(flightDir)
+            break
+        except FileExistsError:
+            flightId += 1
+
+    # Replaced in whole, a power cut can't leave half a number behind
+    temporary = directory.joinpath(COUNTER_FILE + ".tmp")
+    temporary.write_text(str(flightId + 1))
+    os.replace(temporary, counter)
+    return flightDir
+
+def directorySize(directory: Path) -> int:
+    return sum(entry.stat().st_size for entry in directory.rglob("*") if entry.is_file())
+
+def compressFlight(flightDir: Path) -> None:
+    """
+    Compresses the logs of a flight, which are plain text. The video tape
+    is compressed already.
+    """
+    for log in flightDir.glob("*.log*"):
+        if log.suffix == ".gz":
+            continue
+        with open(log, "rb") as src, gzip.open(str(log) + ".gz", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(log)
+
+class Housekeeper:
+    """
+    Keeps the flights in `directory` within `maxFlights` and `maxBytes`. The
+    old flights don't change once compressed, so their sizes are only read
+    once, and only the current one is measured again.
+    """
+
+    directory: Path
+    current: Path
+    maxFlights: int
+    maxBytes: int
+    # The flights before `current`, oldest first, and their sizes
+    flights: List[Path]
+    sizes: List[int]
+
+    def __init__(self, directory: Path, current: Path, maxFlights: int, maxBytes: int) -> None:
+        self.directory = directory
+        self.current = current
+        self.maxFlights = maxFlights
+        self.maxBytes = maxBytes
+        self.flights = []
+        self.sizes = []
+
+    def scan(self) -> None:
+        """
+        Compresses the flights before `current`, and measures them.
+        """
+        flights = [self.directory.joinpath(str(flightId)) for flightId in flightIds(self.directory)]
+        self.flights = [flight for flight in flights if flight != self.current]
+        for flight in self.flights:
+            compressFlight(flight)
+        self.sizes = [directorySize(flight) for flight in self.flights]
+
+    def prune(self) -> None:
+        """
+        Deletes the oldest flights until at most `maxFlights` take up at most
+        `maxBytes`. The current one is never touched.
+        """
+        total = sum(self.sizes) + directorySize(self.current)
+        while len(self.flights) > 0 and (len(self.flights) + 1 > self.maxFlights or total > self.maxBytes):
+            logging.info("Deleting the logs of flight " + self.flights[0].name + " to free up space.")
+            shutil.rmtree(self.flights[0], ignore_errors=True)
+            total -= self.sizes[0]
+            self.flights = self.flights[1:]
+            self.sizes = self.sizes[1:]
+
+def housekeep(directory: Path, current: Path, maxFlights: int, maxBytes: int) -> None:
+    """
+    Compresses the flights before `current`, and deletes the oldest ones
+    until at most `maxFlights` take up at most `maxBytes`.
+    """
+    housekeeper = Housekeeper(directory, current, maxFlights, maxBytes)
+    housekeeper.scan()
+    housekeeper.prune()
+
+def housekeepInBackground(housekeeper: Housekeeper, stopped: threading.Event, interval: float) -> None:
+    match catch(Exception)(housekeeper.scan)():
+        case Err(e):
+            logging.info("Cleaning up the old flights failed: " + str(e.args))
+    while True:
+        match catch(Exception)(housekeeper.prune)():
+            case Err(e):
+                logging.info("Cleaning up the old flights failed: " + str(e.args))
+        if stopped.wait(interval):
+            return
+
+class FlightLog:
+    # The directory of this flight
+    directory: Path
+    handler: QueueHandler
+    listener: QueueListener
+    housekeeping: threading.Thread
+    # Set to end the housekeeping
+    stopped: threading.Event
+
+    def __init__(self, directory: Path, handler: QueueHandler, listener: QueueListener, housekeeping: threading.Thread, stopped: threading.Event) -> None:
+        self.directory = directory
+        self.handler = handler
+        self.listener = listener
+        self.housekeeping = housekeeping
+        self.stopped = stopped
+
+    @staticmethod
+    @catch(Exception)
+    def start(logsDirectory: Path, checkInterval: float = LOGS_CHECK_INTERVAL) -> FlightLog:
+        """
+        Claims the directory of a new flight, and sends the logs of the root
+        logger into it. This constructor will not raise exceptions.
+        """
+        logsDirectory.mkdir(parents=True, exist_ok=True)
+        directory = claimFlight(logsDirectory)
+
+        fileHandler = RotatingFileHandler(directory.joinpath("venus.log"), maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS)
+        fileHandler.setFormatter(logging.Formatter(LOG_FORMAT, LOG_DATE_FORMAT))
+        # Unbounded, so logging never waits for the file
+        records: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+        listener = QueueListener(records, fileHandler, respect_handler_level=True)
+        listener.start()
+        handler = QueueHandler(records)
+        root = logging.getLogger()
+        root.addHandler(handler)
+        root.setLevel(logging.INFO)
+
+        housekeeper = Housekeeper(logsDirectory, directory, LOGS_MAX_FLIGHTS, LOGS_MAX_BYTES)
+        stopped = threading.Event()
+        housekeeping = threading.Thread(target=housekeepInBackground, args=(housekeeper, stopped, checkInterval), daemon=True)
+        housekeeping.start()
+        return FlightLog(directory, handler, listener, housekeeping, stopped)
+
+    def stop(self) -> None:
+        """
+        Ends the housekeeping, and writes out the queued records. Logs after
+        this aren't written.
+        """
+        self.stopped.set()
+        # A daemon, compressing a backlog of old flights doesn't hold up exiting
+        self.housekeeping.join(1.0)
+        logging.getLogger().removeHandler(self.handler)
+        self.listener.stop()
+        for handler in self.listener.handlers:
+            handler.close()
@@ -0,0 +1,158 @@
+"""
+A ring of camera frames in shared memory. The Eye publishes every preview
+frame into it, and any number of processes (classical refinement, live preview,
+dataset capture) can attach by name and read the frames as NumPy views, without
+copying them and without ever slowing down the guidance process.
+"""
+
+from __future__ import annotations
+from multiprocessing import shared_memory, resource_tracker
+from typing import Tuple
+import numpy as np
+
+MAGIC = 0x56454E5553 # "VENUS"
+
+# Header fields, as int64s at the start of the segment
+HEADER_MAGIC = 0
+HEADER_SLOTS = 1
+HEADER_SHAPE = 2 # 3 fields
+HEADER_LATEST = 5
+HEADER_SIZE = 8
+
+class FrameBus:
+    """
+    The segment is laid out as a header, then the sequence number, timestamp
+    and device sequence number of every slot, then the frames themselves.
+    A slot's sequence number is -1 while it is being written, so a reader can
+    tell a torn or overwritten frame apart from a good one with `isValid`.
+    """
+
+    memory: shared_memory.SharedMemory
+    owner: bool
+    header: np.ndarray
+    sequences: np.ndarray
+    timestamps: np.ndarray
+    deviceSequences: np.ndarray
+    frames: np.ndarray
+
+    def __init__(self, memory: shared_memory.SharedMemory, owner: bool) -> None:
+        self.memory = memory
+        self.owner = owner
+
+        self.header = np.ndarray((HEADER_SIZE,), np.int64, memory.buf)
+        if self.header[HEADER_MAGIC] != MAGIC:
+            raise ValueError("Shared memory " + memory.name + " is not a frame bus")
+        slots = int(self.header[HEADER_SLOTS])
+        shape = tuple(int(x) for x in self.header[HEADER_SHAPE:HEADER_SHAPE + 3])
+
+        offset = HEADER_SIZE * 8
+        self.sequences = np.ndarray((slots,), np.int64, memory.buf, offset)
+        offset += slots * 8
+        self.timestamps = np.ndarray((slots,), np.float64, memory.buf, offset)
+        offset += slots * 8
+        self.deviceSequences = np.ndarray((slots,), np.int64, memory.buf, offset)
+        offset += slots * 8
+        self.frames = np.ndarray((slots, *shape), np.uint8, memory.buf, offset)
+
+    @staticmethod
+    def create(name: str, shape: Tuple[int, int, int], slots: int = 8) -> FrameBus:
+        """
+        Creates the bus for frames of `shape`. A stale bus of the same
+        name, left behind by a crashed process, is replaced.
+        """
+        size = (HEADER_SIZE + slots * 3) * 8 + slots * shape[0] * shape[1] * shape[2]
+        try:
+            memory = shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            stale = shared_memory.SharedMemory(name)
+            stale.close()
+            stale.unlink()
+            memory = shared_memory.SharedMemory(name, create=True, size=size)
+
+        header = np.ndarray((HEADER_SIZE,), np.int64, memory.buf)
+        header[HEADER_SLOTS] = slots
+        header[HEADER_SHAPE:HEADER_SHAPE + 3] = shape
+        header[HEADER_LATEST] = -1
+        header[HEADER_MAGIC] = MAGIC
+        del header
+
+        bus = FrameBus(memory, True)
+        bus.sequences[:] = -1
+        return bus
+
+    @staticmethod
+    def attach(name: str) -> FrameBus:
+        """
+        Attaches to a bus created by another process. Raises FileNotFoundError
+        if it doesn't exist (yet).
+        """
+        memory = shared_memory.SharedMemory(name)
+        # Otherwise the resource tracker unlinks the bus when this reader exits
+        resource_tracker.unregister(memory._name, "shared_memory") # type: ignore
+        return FrameBus(memory, False)
+
+    def publish(self, data: np.ndarray, timestamp: float, deviceSequence: int = -1) -> int:
+        """
+        Copies a frame into the next slot. `data` can be any array with as many
+        bytes as a frame, like the raw data of a dai.ImgFrame. Returns the
+        sequence number of the frame.
+        """
+        sequence = int(self.header[HEADER_LATEST]) + 1
+        slot = sequence % len(self.sequences)
+
+        self.sequences[slot] = -1
+        np.copyto(self.frames[slot].reshape(-1), data.reshape(-1))
+        self.timestamps[slot] = timestamp
+        self.deviceSequences[slot] = deviceSequence
+        self.sequences[slot] = sequence
+        self.header[HEADER_LATEST] = sequence
+        return sequence
+
+    def latestSequence(self) -> int:
+        """
+        The sequence number of the newest frame, or -1 if there are none.
+        """
+        return int(self.header[HEADER_LATEST])
+
+    def read(self, sequence: int) -> Tuple[float, np.ndarray] | None:
+        """
+        Returns the timestamp and a view of the frame with a sequence number,
+        or None if it was overwritten already. The view is only good while
+        `isValid(sequence)` is True.
+        """
+        if sequence < 0:
+            return None
+        slot = sequence % len(self.sequences)
+        if self.sequences[slot] != sequence:
+            return None
+        return (float(self.timestamps[slot]), self.frames[slot])
+
+    def latest(self) -> Tuple[int, float, np.ndarray] | None:
+        """
+        Returns the sequence number, timestamp and a view of the newest frame.
+        """
+        sequence = self.latestSequence()
+        frame = self.read(sequence)
+        if frame is None:
+            return None
+        return (sequence, frame[0], frame[1])
+
+    def findDeviceSequence(self, deviceSequence: int) -> int | None:
+        """
+        Returns the sequence number of the frame with a device sequence
+        number, if it is still on the bus.
+        """
+        for slot in range(len(self.sequences)):
+            if self.deviceSequences[slot] == deviceSequence and self.sequences[slot] >= 0:
+                return int(self.sequences[slot])
+        return None
+
+    def isValid(self, sequence: int) -> bool:
+        return self.sequences[sequence % len(self.sequences)] == sequence
+
+    def close(self) -> None:
+        # Views into the buffer have to be gone before it can be closed
+        del self.header, self.sequences, self.timestamps, self.deviceSequences, self.frames
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
@@ -1,14 +1,39 @@
-from dronekit import Vehicle, LocationGlobal, LocationGlobalRelative, VehicleMode, Command
-from pymavlink import mavutil
-from optics import Eye, PadType, intoPadType
+from __future__ import annotations
+from core import PadType, intoPadType
+from predict import TargetPredictor, vehicleVelocity
 from compute import *
-from poltergeist import Result, Ok, Err, catch
-from typing import List, Tuple
-from datetime import datetime
+from poltergeist import Result, Ok, Err
+from typing import Any, Callable, List, Tuple, TYPE_CHECKING
 from constants import *
+import functools
 import logging
+import queue
+import threading
 import time
 
+# The machine only needs these at the edges, dronekit and pymavlink are
+# loaded when it first talks to the vehicle (see core.py)
+if TYPE_CHECKING:
+    from dronekit import Vehicle, LocationGlobal
+    from optics import DetectionBackend
+    from refine import CentreRefiner
+    from control import ControlLoop
+
+def vehicleMode(name: str) -> Any:
+    from dronekit import VehicleMode
+    return VehicleMode(name)
+
+def requestMode(vehicle: Vehicle, wanted: str, mode: str | None, sinceMode: float | None) -> float | None:
+    """
+    Asks for the `wanted` mode every MODE_RETRY_INTERVAL until the vehicle
+    reports it, returning when it was last asked for.
+    """
+    now = time.monotonic()
+    if mode != wanted and (sinceMode is None or now - sinceMode >= MODE_RETRY_INTERVAL):
+        vehicle.mode = vehicleMode(wanted)
+        return now
+    return sinceMode
+
 # TODO: Remove the | None
 
 class Resolve:
@@ -22,6 +47,8 @@ class Resolve:
     velocity: Tuple[float, float, float] | None
     transitionAvailable: bool
     padType: PadType | None
+    # The Ok a tick returns this in, only kept by preallocated resolves
+    ok: Ok[Resolve] | None
 
     def __init__(
             self, 
@@ -35,78 +62,157 @@ class Resolve:
         self.transitionAvailable = transitionAvailable
         self.velocity = velocity
         self.padType = padType
+        self.ok = None
+
+    @staticmethod
+    def preallocated(
+            yaw: int | None, 
+            position: LocationGlobal | None, 
+            transitionAvailable: bool, 
+            velocity: Tuple[float, float, float] | None = None) -> Resolve:
+        """
+        A resolve which is returned tick after tick, in the same Ok. The main
+        loop is done with a resolve before the next tick, so a state may
+        change its own preallocated ones.
+        """
+        resolve = Resolve(yaw, position, transitionAvailable, velocity)
+        resolve.ok = Ok(resolve)
+        return resolve
+
+def catchTick(tick: Callable[[Any], Resolve]) -> Callable[[Any], Result[Resolve, Exception]]:
+    """
+    Like `catch(Exception)` on the tick of a state, without wrapping a
+    preallocated resolve in a new Ok every tick.
+    """
+    @functools.wraps(tick)
+    def wrapper(state: Any) -> Result[Resolve, Exception]:
+        try:
+            resolve = tick(state)
+        except Exception as e:
+            return Err(e)
+        if resolve.ok is not None:
+            return resolve.ok
+        return Ok(resolve)
+
+    return wrapper
+
+# What most ticks resolve to, nothing to do or a transition
+WAITING = Resolve.preallocated(None, None, False)
+TRANSITIONING = Resolve.preallocated(None, None, True)
+# Without a control loop, no pad makes Align hover and Touchdown sink
+HOVERING = Resolve.preallocated(None, None, False, (0.0, 0.0, 0.0))
+SINKING = Resolve.preallocated(None, None, False, (0, 0, TOUCHDOWN_SPEED))
+# Looking up an enum member allocates, Touchdown compares against it every result
+PAD_CENTER = PadType.padCenter
+
+class VehicleStatus:
+    """
+    What the machine triggers on, kept up to date by the listeners of
+    `Landing` as the messages come in, so nothing has to poll the vehicle.
+    """
+
+    armed: bool
+    mode: str | None
+    alt: float | None
+    commandNext: int
+    lock: threading.Lock
+
+    def __init__(self, vehicle: Vehicle) -> None:
+        self.armed = vehicle.armed
+        self.mode = vehicle.mode.name
+        self.alt = vehicle.location.global_relative_frame.alt
+        self.commandNext = vehicle.commands.next
+        self.lock = threading.Lock()
+
+    def snapshot(self) -> Tuple[bool, str | None, float | None, int]:
+        # Every tick, and `with` allocates the bound __exit__ of the lock
+        self.lock.acquire()
+        try:
+            return (self.armed, self.mode, self.alt, self.commandNext)
+        finally:
+            self.lock.release()
+
+    def killed(self) -> bool:
+        """
+        Whether the machine has to idle: disarmed, or a mode the pilot took
+        over in.
+        """
+        with self.lock:
+            return not self.armed or self.mode not in ("AUTO", "GUIDED")
 
 class Idle:
     name = "Idle"
-    sinceStatusUpdate: datetime
+    sinceStatusUpdate: float
     vehicle: Vehicle
+    status: VehicleStatus
 
-    def __init__(self, vehicle: Vehicle) -> None:
-        self.sinceStatusUpdate = datetime.now()
+    def __init__(self, vehicle: Vehicle, status: VehicleStatus) -> None:
+        self.sinceStatusUpdate = time.monotonic()
         self.vehicle = vehicle
+        self.status = status
 
-    @catch(Exception)
+    @catchTick
     def tick(self) -> Resolve:
         # Transition out of idle if 
         # - in the air and
         # - armed and
         # - in the AUTO flight mode and
         # - actively in a GUIDED_ENABLE waypoint
-        inAir = (self.vehicle.location.global_relative_frame.alt is not None) and self.vehicle.location.global_relative_frame.alt >= MIN_ALT_FOR_FLIGHT
-        armed = self.vehicle.armed
-        auto = self.vehicle.mode == VehicleMode("AUTO")
+        (armed, mode, alt, commandNext) = self.status.snapshot()
+        inAir = alt is not None and alt >= MIN_ALT_FOR_FLIGHT
+        auto = mode == "AUTO"
 
-        if self.vehicle.commands.next == 0:
-            currWayId: int = self.vehicle.commands[self.vehicle.commands.next].command # type: ignore
-            param: int = self.vehicle.commands[self.vehicle.commands.next].z
+        if commandNext == 0:
+            currWayId: int = self.vehicle.commands[commandNext].command # type: ignore
+            param: int = self.vehicle.commands[commandNext].z
         else:
             # When a GUIDED_ENABLE waypoint is reached, the `next` is silently
             # updated to the next waypoint after GUIDED_ENABLE. To see if we
             # are currently guided enable, see the last waypoint command.
-            currWayId: int = self.vehicle.commands[self.vehicle.commands.next - 1].command # type: ignore
-            param: int = self.vehicle.commands[self.vehicle.commands.next - 1].z
+            currWayId: int = self.vehicle.commands[commandNext - 1].command # type: ignore
+            param: int = self.vehicle.commands[commandNext - 1].z
 
         
-        validParam = intoPadType(param) is not None
         guided = currWayId == 92 # 92 = GUIDED_ENABLE
 
         # Status update
-        if (datetime.now() - self.sinceStatusUpdate).seconds >= STATUS_UPDATE_FREQ:
+        if time.monotonic() - self.sinceStatusUpdate >= STATUS_UPDATE_FREQ:
             logging.info("Vehicle is idling.")
             logging.info("inAir: %s, armed: %s, auto: %s, alt: %s, command: %s", 
                          inAir, 
                          armed, 
                          auto, 
-                         self.vehicle.location.global_relative_frame.alt,
+                         alt,
                          currWayId
                          )
-            self.sinceStatusUpdate = datetime.now()
+            self.sinceStatusUpdate = time.monotonic()
 
-        if inAir and armed and auto and guided and validParam:
+        # The pad type last, looking up an enum member allocates on every tick
+        if inAir and armed and auto and guided and intoPadType(param) is not None:
             return Resolve(None, None, True, padType=intoPadType(param))
-        return Resolve(None, None, False)
+        return WAITING
 
 class Descent:
     name = "Descending"
     vehicle: Vehicle
-    eye: Eye
+    eye: DetectionBackend
     conductor: Conductor
     padType: PadType | None
 
-    sinceStatusUpdate: datetime
-    sinceEnter: datetime
+    sinceStatusUpdate: float
+    sinceEnter: float
     commandId: int
 
-    def __init__(self, vehicle: Vehicle, eye: Eye, conductor: Conductor, padType: PadType | None):
+    def __init__(self, vehicle: Vehicle, eye: DetectionBackend, conductor: Conductor, padType: PadType | None):
         self.vehicle = vehicle
         self.eye = eye
         self.conductor = conductor
-        self.sinceStatusUpdate = datetime.now()
-        self.sinceEnter = datetime.now()
+        self.sinceStatusUpdate = time.monotonic()
+        self.sinceEnter = time.monotonic()
         self.commandId = vehicle.commands.next
         self.padType = padType
 
-    @catch(Exception)
+    @catchTick
     def tick(self) -> Resolve:
         altGuess = getAGL(self.vehicle)
         locationDetects: List[LocationDetection] = []
@@ -120,7 +226,7 @@ class Descent:
                 )
                 loc = distanceToLocation(self.vehicle.location.global_frame, dist)
 
-                locationDetects.append(LocationDetection(d.padType, loc, d.confidence))
+                locationDetects.append(LocationDetection(d.padType, loc, d.confidence, d.trackId))
         self.conductor.add_detections(locationDetects)
 
         if self.padType is None:
@@ -130,24 +236,25 @@ class Descent:
 
         # Status update
         # Uncomment this after testing
-        if (datetime.now() - self.sinceStatusUpdate).seconds >= STATUS_UPDATE_FREQ:
+        if time.monotonic() - self.sinceStatusUpdate >= STATUS_UPDATE_FREQ:
             logging.info("Vehicle is descending! cacheSize: %s, guess: %s, airspeed: %s, id: %s",
                             len(self.conductor.detections),
                             bestGuess,
                             self.vehicle.airspeed,
                             self.vehicle.commands.next
                             )
-            self.sinceStatusUpdate = datetime.now()
+            self.sinceStatusUpdate = time.monotonic()
 
         if altGuess <= ALIGN_ALT:
             # We can align
-            return Resolve(None, None, True)
+            return TRANSITIONING
 
         if bestGuess is not None:
             dists = individualDist(bestGuess.location, self.vehicle.location.global_frame)
             angle = angleDiff(dists, altGuess)
 
             if angle[0] <= MAX_ANGLE_DIFF and angle[1] <= MAX_ANGLE_DIFF:
+                from dronekit import LocationGlobal
                 downOffset = LocationGlobal(
                     bestGuess.location.lat, 
                     bestGuess.location.lon,
@@ -157,51 +264,77 @@ class Descent:
 
             return Resolve(0, bestGuess.location, False)
         # Become optimistic if haven't found the proper pad type
-        elif (datetime.now() - self.sinceEnter).seconds >= OPTIMISM_TIME and not self.conductor.optimistic:
+        elif time.monotonic() - self.sinceEnter >= OPTIMISM_TIME and not self.conductor.optimistic:
             self.conductor.optimistic = True
             logging.warn("Conductor became optimistic!")
 
-        return Resolve(None, None, False)
+        return WAITING
     
 class Align:
     name = "Aligning"
     vehicle: Vehicle
-    eye: Eye
+    eye: DetectionBackend
     conductor: Conductor
+    # Steers to the pad between detections, velocities are resolved per tick without it
+    control: ControlLoop | None
+    predictor: TargetPredictor
+    steering: Resolve
 
-    sinceEnter: datetime
+    sinceEnter: float
     commandId: int
 
-    def __init__(self, vehicle: Vehicle, eye: Eye, conductor: Conductor, commandId: int) -> None:
+    def __init__(
+            self,
+            vehicle: Vehicle,
+            eye: DetectionBackend,
+            conductor: Conductor,
+            commandId: int,
+            control: ControlLoop | None = None) -> None:
         self.vehicle = vehicle
         self.eye = eye
         self.conductor = conductor
-        self.sinceEnter = datetime.now()
+        self.sinceEnter = time.monotonic()
         self.commandId = commandId
+        self.control = control
+        self.predictor = TargetPredictor()
+        self.steering = Resolve.preallocated(None, None, False, (0.0, 0.0, 0.0))
 
-    @catch(Exception)
+    @catchTick
     def tick(self) -> Resolve:
-        if (datetime.now() - self.sinceEnter).seconds >= ALIGN_TIME:
-            return Resolve(None, None, True)
+        if time.monotonic() - self.sinceEnter >= ALIGN_TIME:
+            return TRANSITIONING
 
         altGuess = getAGL(self.vehicle)
+        now = time.monotonic()
+        velocity = vehicleVelocity(self.vehicle)
         locationDetects: List[LocationDetection] = []
         pixelDetects = self.eye.tick().unwrap()
-        if pixelDetects is not None:
-            for d in pixelDetects:
-                dist = relativeDistance(
-                    altGuess, # type: ignore
-                    d.normalizedCoords,
-                    self.vehicle.attitude.yaw # type: ignore
-                )
-                converted = changeMagnitude(dist, ALIGN_AIRSPEED)
-                return Resolve(None, None, False, (converted[0], converted[1], 0.0))
-
-                # loc = distanceToLocation(self.vehicle.location.global_frame, dist)
-
-                # locationDetects.append(LocationDetection(d.padType, loc, d.confidence))
+        # Only the first detection is used, indexed since iterating allocates
+        if pixelDetects is not None and len(pixelDetects) > 0:
+            d = pixelDetects[0]
+            dist = relativeDistance(
+                altGuess, # type: ignore
+                d.normalizedCoords,
+                self.vehicle.attitude.yaw # type: ignore
+            )
+            self.predictor.update(dist, now, velocity)
+
+            # loc = distanceToLocation(self.vehicle.location.global_frame, dist)
+
+            # locationDetects.append(LocationDetection(d.padType, loc, d.confidence))
         # self.conductor.add_detections(locationDetects)
 
+        # Where the pad is by now, the AV moved since it was seen
+        predicted = self.predictor.predict(now, velocity)
+        if predicted is not None:
+            if self.control is not None:
+                self.control.command(distanceToLocation(self.vehicle.location.global_frame, predicted), 0.0, ALIGN_AIRSPEED)
+                return WAITING
+            converted = changeMagnitude(predicted, ALIGN_AIRSPEED)
+            # The offset is (east, north), the velocity NED
+            self.steering.velocity = (converted[1], converted[0], 0.0)
+            return self.steering
+
         """
 
         bestGuess = self.conductor.get_best_guess(PadType.bottlePickup)
@@ -211,61 +344,336 @@ class Align:
 
         """
 
-        return Resolve(None, None, False, (0.0, 0.0, 0.0))
+        if self.control is not None:
+            self.control.command(None, 0.0, ALIGN_AIRSPEED)
+            return WAITING
+        return HOVERING
     
 class Touchdown:
     name = "Touching down"
     vehicle: Vehicle
-    eye: Eye
+    eye: DetectionBackend
+    refiner: CentreRefiner | None
+    control: ControlLoop | None
+    steering: Resolve
 
     commandId: int
 
-    def __init__(self, vehicle, eye, commandId) -> None:
+    def __init__(self, vehicle, eye, commandId, refiner = None, control = None) -> None:
         self.vehicle = vehicle
         self.eye = eye
         self.commandId = commandId
+        self.refiner = refiner
+        self.control = control
+        self.steering = Resolve.preallocated(None, None, False, (0.0, 0.0, TOUCHDOWN_SPEED))
     
-    @catch(Exception)
+    @catchTick
     def tick(self) -> Resolve:
         altGuess = getAGL(self.vehicle)
 
         if altGuess <= LANDED_ALT_LIDAR:
-            return Resolve(None, None, True)
+            return TRANSITIONING
 
         locationDetects: List[LocationDetection] = []
         pixelDetects = self.eye.tick().unwrap()
         if pixelDetects is not None:
             for d in pixelDetects:
-                if d.padType == PadType.padCenter:
+                if d.padType == PAD_CENTER:
+                    coords = d.normalizedCoords
+                    if self.refiner is not None:
+                        self.refiner.submit(d)
+                        # The refinement lags behind, its center is used while it's fresh
+                        refined = self.refiner.latest()
+                        if (refined is not None 
+                            and refined.sequence is not None 
+                            and d.sequence is not None
+                            and 0 <= d.sequence - refined.sequence <= REFINEMENT_MAX_AGE):
+                            coords = refined.center
+
                     dist = relativeDistance(
                         altGuess, # type: ignore
-                        d.normalizedCoords,
+                        coords,
                         self.vehicle.attitude.yaw # type: ignore
                     )
+                    if self.control is not None:
+                        self.control.command(distanceToLocation(self.vehicle.location.global_frame, dist), TOUCHDOWN_SPEED, AIRSPEED)
+                        return WAITING
                     converted = changeMagnitude(dist, AIRSPEED)
+                    # The offset is (east, north), the velocity NED
+                    self.steering.velocity = (converted[1], converted[0], TOUCHDOWN_SPEED)
+                    return self.steering
+
+        if self.control is not None:
+            self.control.command(None, TOUCHDOWN_SPEED, AIRSPEED)
+            return WAITING
+        return SINKING
+
+
+class Land:
+    """
+    Lets the autopilot descend the final stretch in LAND, until it disarmed
+    by itself. This and the states after it never block the main loop, and
+    give up with a TimeoutError when they take longer than they should.
+    """
+
+    name = "Landing"
+    vehicle: Vehicle
+    status: VehicleStatus
+    commandId: int
+    sinceEnter: float
+    # When the mode was last asked for
+    sinceMode: float | None
+
+    def __init__(self, vehicle: Vehicle, status: VehicleStatus, commandId: int) -> None:
+        self.vehicle = vehicle
+        self.status = status
+        self.commandId = commandId
+        self.sinceEnter = time.monotonic()
+        self.sinceMode = None
+
+    def takenOver(self, armed: bool, mode: str | None) -> bool:
+        # Disarming in LAND is what this waits for
+        return False
+
+    @catchTick
+    def tick(self) -> Resolve:
+        (armed, mode, _, _) = self.status.snapshot()
+        # Make the vehicle descend straight down the final strech, asking
+        # again in case the mode change was lost on the link
+        self.sinceMode = requestMode(self.vehicle, "LAND", mode, self.sinceMode)
 
-                    return Resolve(None, None, False, (converted[0], converted[1], TOUCHDOWN_SPEED))
+        if not armed:
+            logging.info("Vehicle disarmed!")
+            return TRANSITIONING
+        if time.monotonic() - self.sinceEnter >= LAND_TIMEOUT:
+            raise TimeoutError("The vehicle didn't disarm after landing")
+        return WAITING
+
+class Disarmed:
+    """
+    Waits for the vehicle to become armable again, and a little longer.
+    """
+
+    name = "Disarmed"
+    vehicle: Vehicle
+    status: VehicleStatus
+    commandId: int
+    sinceEnter: float
+    # When the vehicle was first seen armable
+    sinceArmable: float | None
+    sinceMode: float | None
+
+    def __init__(self, vehicle: Vehicle, status: VehicleStatus, commandId: int) -> None:
+        self.vehicle = vehicle
+        self.status = status
+        self.commandId = commandId
+        self.sinceEnter = time.monotonic()
+        self.sinceArmable = None
+        self.sinceMode = None
 
-        return Resolve(None, None, False, (0, 0, TOUCHDOWN_SPEED))
+    def takenOver(self, armed: bool, mode: str | None) -> bool:
+        # The mode is still on its way from LAND to LOITER
+        return False
+
+    @catchTick
+    def tick(self) -> Resolve:
+        (_, mode, _, _) = self.status.snapshot()
+        # Land mode isn't armable
+        self.sinceMode = requestMode(self.vehicle, "LOITER", mode, self.sinceMode)
+
+        now = time.monotonic()
+        if self.sinceArmable is None and self.vehicle.is_armable:
+            self.sinceArmable = now
+        # Arming right when it's armable fails
+        if mode == "LOITER" and self.sinceArmable is not None and now - self.sinceArmable >= ARMABLE_SETTLE_TIME:
+            return TRANSITIONING
+        if now - self.sinceEnter >= ARMABLE_TIMEOUT:
+            raise TimeoutError("The vehicle didn't become armable")
+        return WAITING
+
+class Rearm:
+    """
+    Arms the vehicle, asking again every ARM_RETRY_INTERVAL until it is.
+    """
 
+    name = "Rearming"
+    vehicle: Vehicle
+    status: VehicleStatus
+    commandId: int
+    sinceEnter: float
+    sinceArm: float | None
+
+    def __init__(self, vehicle: Vehicle, status: VehicleStatus, commandId: int) -> None:
+        self.vehicle = vehicle
+        self.status = status
+        self.commandId = commandId
+        self.sinceEnter = time.monotonic()
+        self.sinceArm = None
+
+    def takenOver(self, armed: bool, mode: str | None) -> bool:
+        # Disarmed is expected, any mode but the one Disarmed set is the pilot
+        return mode != "LOITER"
+
+    @catchTick
+    def tick(self) -> Resolve:
+        (armed, _, _, _) = self.status.snapshot()
+        if armed:
+            logging.info("Vehicle armed!")
+            return TRANSITIONING
+
+        now = time.monotonic()
+        if now - self.sinceEnter >= ARM_TIMEOUT:
+            raise TimeoutError("The vehicle didn't arm")
+        if self.sinceArm is None or now - self.sinceArm >= ARM_RETRY_INTERVAL:
+            self.vehicle.arm(wait=False)
+            self.sinceArm = now
+        return WAITING
+
+class Resume:
+    """
+    Restarts the mission after the waypoint which was landed on.
+    """
+
+    name = "Resuming"
+    vehicle: Vehicle
+    status: VehicleStatus
+    commandId: int
+    sinceEnter: float
+    resumed: bool
+    sinceMode: float | None
+
+    def __init__(self, vehicle: Vehicle, status: VehicleStatus, commandId: int) -> None:
+        self.vehicle = vehicle
+        self.status = status
+        self.commandId = commandId
+        self.sinceEnter = time.monotonic()
+        self.resumed = False
+        self.sinceMode = None
+
+    def takenOver(self, armed: bool, mode: str | None) -> bool:
+        # AUTO is on its way from LOITER, anything else is the pilot
+        return not armed or mode not in ("LOITER", "AUTO")
+
+    @catchTick
+    def tick(self) -> Resolve:
+        (_, mode, _, _) = self.status.snapshot()
+        self.sinceMode = requestMode(self.vehicle, "AUTO", mode, self.sinceMode)
+        if not self.resumed:
+            from pymavlink import mavutil
+            msg = self.vehicle.message_factory.command_long_encode(
+                0, 0,    # target system, target component
+                mavutil.mavlink.MAV_CMD_MISSION_START,  #command
+                0, 
+                0,   
+                0,          
+                0,          
+                0, 
+                0, 0, 0)    
+            # Send command to vehicle
+            self.vehicle.send_mavlink(msg)
+
+            self.vehicle.commands.next = self.commandId + 1
+            self.resumed = True
+
+        if mode == "AUTO":
+            return TRANSITIONING
+        if time.monotonic() - self.sinceEnter >= RESUME_TIMEOUT:
+            raise TimeoutError("The vehicle didn't resume the mission")
+        return WAITING
+
+# The states after touchdown, the vehicle is disarmed and out of AUTO on
+# purpose, so each decides what a pilot taking over looks like
+AFTER_TOUCHDOWN = (Land, Disarmed, Rearm, Resume)
 
 class Landing:
-    state: Idle | Descent | Align | Touchdown
+    state: Idle | Descent | Align | Touchdown | Land | Disarmed | Rearm | Resume
     vehicle: Vehicle
-    eye: Eye
+    eye: DetectionBackend
     padType: PadType | None
+    refiner: CentreRefiner | None
+    control: ControlLoop | None
+    status: VehicleStatus
+    # Names of the attributes that changed, posted by the listeners
+    events: queue.SimpleQueue[str]
+    # Set when an event was posted, to cut the wait for the next tick short
+    wake: threading.Event
     
-    def __init__(self, eye: Eye, vehicle: Vehicle) -> None:
+    def __init__(
+            self,
+            eye: DetectionBackend,
+            vehicle: Vehicle,
+            refiner: CentreRefiner | None = None,
+            control: ControlLoop | None = None) -> None:
         self.eye = eye
         self.vehicle = vehicle
-        self.state = Idle(vehicle)
+        self.refiner = refiner
+        self.control = control
+        self.status = VehicleStatus(vehicle)
+        self.events = queue.SimpleQueue()
+        self.wake = threading.Event()
+        self.state = Idle(vehicle, self.status)
         padType = None
 
+        vehicle.add_attribute_listener("armed", self.onAttribute)
+        vehicle.add_attribute_listener("mode", self.onAttribute)
+        vehicle.add_attribute_listener("location.global_relative_frame", self.onAttribute)
+        vehicle.add_message_listener("MISSION_CURRENT", self.onMissionCurrent)
+
+    def onAttribute(self, vehicle: Vehicle, name: str, value) -> None:
+        """
+        Called on the thread of the vehicle.
+        """
+        with self.status.lock:
+            if name == "armed":
+                self.status.armed = value
+            elif name == "mode":
+                self.status.mode = value.name
+            else:
+                # The altitude only feeds Idle, which reads it every tick
+                self.status.alt = value.alt
+                return
+        self.events.put(name)
+        self.wake.set()
+
+    def onMissionCurrent(self, vehicle: Vehicle, name: str, msg) -> None:
+        with self.status.lock:
+            self.status.commandNext = msg.seq
+
+    def wait(self, timeout: float) -> None:
+        """
+        Waits for the next tick, or until an event was posted.
+        """
+        self.wake.wait(timeout)
+        self.wake.clear()
+
+    def handleEvents(self) -> bool:
+        """
+        Idles the machine if the vehicle was taken out of its hands, returning
+        whether it did. The events only say something changed, the status
+        says what it is now.
+        """
+        while not self.events.empty():
+            self.events.get_nowait()
+        if isinstance(self.state, Idle):
+            return False
+        (armed, mode, _, _) = self.status.snapshot()
+        if isinstance(self.state, AFTER_TOUCHDOWN):
+            if not self.state.takenOver(armed, mode):
+                return False
+        elif not self.status.killed():
+            return False
+        logging.info("Current mode: " + str(mode) + ", armed: " + str(armed))
+        logging.info("Killing! Going back into Idle.")
+        self.idle()
+        return True
+
     def idle(self) -> None:
         """
         Enter the idle stage immediately.
         """
-        self.state = Idle(self.vehicle)
+        if self.control is not None:
+            self.control.disengage()
+        self.state = Idle(self.vehicle, self.status)
 
     def transition(self) -> None:
         """
@@ -279,53 +687,35 @@ class Landing:
             self.state = Descent(self.vehicle, self.eye, Conductor(), self.padType)
         elif isinstance(self.state, Descent):
             logging.info("Transition into Align. Alt: %s", getAGL(self.vehicle))
-            self.state = Align(self.vehicle, self.eye, self.state.conductor, self.state.commandId)
+            if self.control is not None:
+                self.control.engage()
+            self.state = Align(self.vehicle, self.eye, self.state.conductor, self.state.commandId, self.control)
         elif isinstance(self.state, Align):
             logging.info("Transition into Touchdown...")
-            self.state = Touchdown(self.vehicle, self.eye, self.state.commandId)
+            self.state = Touchdown(self.vehicle, self.eye, self.state.commandId, self.refiner, self.control)
         elif isinstance(self.state, Touchdown):
             logging.info("Touchdown finished!")
-
-            # Make the vehicle descend straight down the final strech
-            self.vehicle.mode = VehicleMode("LAND")
-            # Wait until we have disarmed 
-            while self.vehicle.armed == True:
-                time.sleep(0.1) # 10hz check
-
-            logging.info("Vehicle disarmed!")
-
-            # Land mode isn't armable
-            self.vehicle.mode = VehicleMode("LOITER")
-
-            # Vehicle needs to be armed to proceed with mission
-            while not self.vehicle.is_armable:
-                logging.info("Waiting for vehicle to become armable...")
-                time.sleep(0.5)
-            # This sleep is necessary 
-            time.sleep(1.5)
-
-            self.vehicle.arm(wait=True)
-
-            self.vehicle.mode = VehicleMode("AUTO")
-
-            msg = self.vehicle.message_factory.command_long_encode(
-                0, 0,    # target system, target component
-                mavutil.mavlink.MAV_CMD_MISSION_START,  #command
-                0, 
-                0,   
-                0,          
-                0,          
-                0, 
-                0, 0, 0)    
-            # Send command to vehicle
-            self.vehicle.send_mavlink(msg)
-
-            self.vehicle.commands.next = self.state.commandId + 1
-            
+            if self.control is not None:
+                self.control.disengage()
+            self.state = Land(self.vehicle, self.status, self.state.commandId)
+        elif isinstance(self.state, Land):
+            self.state = Disarmed(self.vehicle, self.status, self.state.commandId)
+        elif isinstance(self.state, Disarmed):
+            logging.info("Vehicle is armable, arming...")
+            self.state = Rearm(self.vehicle, self.status, self.state.commandId)
+        elif isinstance(self.state, Rearm):
+            logging.info("Resuming the mission...")
+            self.state = Resume(self.vehicle, self.status, self.state.commandId)
+        elif isinstance(self.state, Resume):
             logging.info("Transition back into Idle...")
-            self.state = Idle(self.vehicle)
-
+            self.state = Idle(self.vehicle, self.status)
 
     def tick(self) -> Result[Resolve, Exception]:
         # Special generic bs, this is allowed 
-        return self.state.tick() # type: ignore
\ No newline at end of file
+        result: Result[Resolve, Exception] = self.state.tick() # type: ignore
+        match result:
+            case Err(e) if isinstance(e, TimeoutError) and isinstance(self.state, AFTER_TOUCHDOWN):
+                # The pilot has to take it from here
+                logging.error("Giving up after touchdown, in " + self.state.name + ": " + str(e.args))
+                self.idle()
+        return result
\ No newline at end of file
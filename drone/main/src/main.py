@@ -3,37 +3,44 @@ from poltergeist import Ok, Err
 from pymavlink import mavutil
 from pathlib import Path
 from typing import Any
-from datetime import datetime
+import atexit
 import time
 import logging
-import os
 
-from optics import Eye
+from optics import Eye, DetectionBackend
+from models import ModelSpec
+from exposure import loadProfiles
+from undistort import UndistortionMap
 from constants import *
 from compute import relativeDistance
-from landing import Landing, Idle
+from landing import Landing, Idle, Touchdown
+from refine import CentreRefiner
+from vehicle import MavVehicle
+from telemetry import TelemetryRates
+from control import ControlLoop
+from flightlog import FlightLog, LOG_FORMAT, LOG_DATE_FORMAT
 
-# Set up logging
-logFile = None
-videoTapeFile = None
-if not DEVELOPMENT_MODE:
-    if not LOGS_DIRECTORY.exists():
-        os.mkdir(LOGS_DIRECTORY)
-
-    logId = 0
-    for _ in LOGS_DIRECTORY.iterdir():
-        logId += 1
-    logDir = LOGS_DIRECTORY.joinpath(str(logId))
-    os.mkdir(logDir)
-    logFile = logDir.joinpath("venus.log")
-
-    videoTapeFile = logDir.joinpath("camera.h265")
+# Set up logging, to the console until the flight log takes over
+console = logging.StreamHandler()
 logging.basicConfig(
     level=logging.INFO, 
-    filename=logFile, 
-    format='( %(asctime)s ) %(message)s', 
-    datefmt='%m/%d/%Y %I:%M:%S %p'
+    format=LOG_FORMAT, 
+    datefmt=LOG_DATE_FORMAT,
+    handlers=[console]
 )
+flightLog = None
+videoTapeFile = None
+if not DEVELOPMENT_MODE:
+    match FlightLog.start(LOGS_DIRECTORY):
+        case Ok(f):
+            flightLog = f
+            logging.getLogger().removeHandler(console)
+            # Writes out what's still queued when Venus exits
+            atexit.register(flightLog.stop)
+            videoTapeFile = flightLog.directory.joinpath("camera.h265")
+        case Err(e):
+            # Flying without logs beats not flying
+            logging.info("Unable to set up the flight log due to error: " + str(e.args))
 
 def condition_yaw(vehicle: Vehicle, heading: int, relative=False) -> None:
     if relative:
@@ -74,28 +81,107 @@ def send_ned_velocity(velocity_x: float, velocity_y: float, velocity_z: float) -
 # connection cannot be made.
 if DEVELOPMENT_MODE == True:
     connectionString = "127.0.0.1:14550"
-    vehicle = connect(connectionString, wait_ready=True)
 else:
     connectionString = "/dev/ttyAMA1"
+if VEHICLE_BACKEND == "pymavlink":
+    match MavVehicle.connect(connectionString, baud=115200):
+        case Ok(v):
+            vehicle = v
+        case Err(e):
+            logging.info("Unable to connect to the vehicle due to error: " + str(e.args))
+            logging.info("Venus will now exit due to a critical error. Power cycle the AV.")
+            exit(1)
+else:
     vehicle = connect(connectionString, wait_ready=True, baud=115200)
 
+# Load the model, refusing any that could mislabel pads
+match ModelSpec.load(MODEL_PATH):
+    case Ok(m):
+        logging.info("Loaded model " + m.name + " with labels " + str([l.value for l in m.labels]))
+        model = m
+    case Err(e):
+        logging.info("Unable to load the model due to error: " + str(e.args))
+        logging.info("Venus will now exit due to a critical error. Power cycle the AV.")
+        exit(1)
+
+# The camera settings for every lighting condition, if they were searched
+exposureProfiles = None
+match loadProfiles(EXPOSURE_PROFILES_PATH):
+    case Ok(p):
+        exposureProfiles = p
+    case Err(e):
+        logging.info("No exposure profiles, using the default exposure: " + str(e.args))
+
+# The lens distortion correction, if the camera was calibrated
+undistortion = None
+match UndistortionMap.load(UNDISTORTION_MAP_PATH):
+    case Ok(u):
+        undistortion = u
+    case Err(e):
+        logging.info("No undistortion map, detections won't be corrected: " + str(e.args))
+
 # Attempt to create an Eye
-match Eye.new(videoTapeFile):
+eye: DetectionBackend
+if CPU_DETECTION_SOURCE is not None:
+    from cpu_optics import CpuEye
+    eyeResult = CpuEye.new(model, CPU_DETECTION_SOURCE)
+else:
+    # Copying every frame out costs, so the bus is only there when it's read
+    frameBusName = FRAME_BUS_NAME
+    if frameBusName is None and (CENTER_REFINEMENT or PREVIEW_PORT is not None):
+        frameBusName = DEFAULT_FRAME_BUS_NAME
+    eyeResult = Eye.new(videoTapeFile, model, OBJECT_TRACKING, frameBusName, exposureProfiles, undistortion)
+match eyeResult:
     case Ok(e):
         logging.info("Initialized an eye.")
+        if isinstance(e, Eye) and e.exposure is not None:
+            logging.info("Using the exposure profile for " + e.exposure.condition + " light.")
         eye = e
     case Err(e):
         logging.info("Unable to initialize optics due to error: " + str(e.args))
         logging.info("Venus will now exit due to a critical error. Power cycle the AV.")
         exit(1)
 
+# Sub-pixel pad centers, refined from the frame bus
+refiner = None
+if CENTER_REFINEMENT and isinstance(eye, Eye) and eye.frameBus is not None:
+    refiner = CentreRefiner(eye.frameBus[0], undistortion)
+
+# Steers Align and Touchdown between detections, on a thread of its own
+control = None
+if CONTROL_RATE is not None:
+    control = ControlLoop(vehicle, send_ned_velocity, CONTROL_RATE)
+    control.start()
+
 # Landing sequence
-machine = Landing(eye, vehicle)
+machine = Landing(eye, vehicle, refiner, control)
+# Raises the rates of the telemetry the states guide with
+telemetry = TelemetryRates(vehicle)
+
+# Live preview for field debugging, it runs on threads of its own
+preview = None
+if PREVIEW_PORT is not None:
+    from preview import PreviewServer
+    match PreviewServer.start(
+        PREVIEW_PORT,
+        eye.frameBus[0] if isinstance(eye, Eye) and eye.frameBus is not None else None,
+        PREVIEW_MAX_FPS,
+        PREVIEW_CPU_BUDGET,
+        PREVIEW_MAX_BANDWIDTH,
+        PREVIEW_SCALE,
+        host=PREVIEW_HOST
+    ):
+        case Ok(p):
+            logging.info("Serving the preview on " + PREVIEW_HOST + ":" + str(p.port) + ".")
+            preview = p
+        case Err(e):
+            # Flying without a preview is fine
+            logging.info("Unable to start the preview due to error: " + str(e.args))
 
 # Download the current mission
 vehicle.commands.download()
 vehicle.commands.wait_ready()
-timeSinceDownload = datetime.now()
+timeSinceDownload = time.monotonic()
 
 # Notify we have connected!
 vehicle.mode = VehicleMode("LOITER")
@@ -104,7 +190,8 @@ vehicle.mode = VehicleMode("LOITER")
 failures = 0
 
 while True:
-    time.sleep(1.0 / TPS)
+    # Cut short when the vehicle posts an event, like the pilot taking over
+    machine.wait(1.0 / TPS)
 
     if failures >= MAX_FAILURES:
         vehicle.mode = VehicleMode("RTL")
@@ -113,7 +200,7 @@ while True:
         time.sleep(1.0)
         exit(1)
 
-    if (datetime.now() - timeSinceDownload).seconds >= 5.0 and isinstance(machine.state, Idle):
+    if time.monotonic() - timeSinceDownload >= 5.0 and isinstance(machine.state, Idle):
         # Download the current mission
         logging.info("Downloading mission...")
         vehicle.commands.download()
@@ -121,19 +208,17 @@ while True:
             vehicle.commands.wait_ready(timeout=5)
         except:
             logging.error("Failed downloading mission.")
-        timeSinceDownload = datetime.now()
+        timeSinceDownload = time.monotonic()
 
     # The machine needs needs to be idled if
     # - it's disarmed or
     # - it's flight mode isn't AUTO or GUIDED
-    if not vehicle.armed or (vehicle.mode != VehicleMode("AUTO") and vehicle.mode != VehicleMode("GUIDED")):
-        # Don't needlessy transition into idle
-        if not isinstance(machine.state, Idle):
-            logging.info("Current mode: " + vehicle.mode.name)
-            logging.info("Killing! Going back into Idle.")
-            machine.idle()
+    machine.handleEvents()
 
     match machine.tick():
+        case Ok(resolve) if machine.handleEvents():
+            # The pilot took over while this tick ran, so it isn't acted on
+            pass
         case Ok(resolve):
             resolve = resolve
             if resolve.padType is not None:
@@ -155,8 +240,25 @@ while True:
             logging.info("An error occured while in " + machine.state.name + " stage: " + str(e.args)) 
             failures += 1
 
+    # After the tick, so a state gets its rates the tick it was entered
+    telemetry.update(machine.state.name)
+
+    if preview is not None:
+        conductor = getattr(machine.state, "conductor", None)
+        preview.publish(machine.state.name, eye.latest, conductor.detections if conductor is not None else [])
+
     match eye.updateVideoTape():
         case Err(e):
             logging.info("Saving video file failed this tick: " + str(e.args))
             failures += 1
-            # We can semi-safely ignore this error
\ No newline at end of file
+            # We can semi-safely ignore this error
+
+    # Copying the frames out only pays off while something reads them. The
+    # preview queue drops frames on the device when it isn't read.
+    if (FRAME_BUS_NAME is not None
+        or (refiner is not None and isinstance(machine.state, Touchdown))
+        or (preview is not None and preview.clients > 0)):
+        match eye.updateFrameBus():
+            case Err(e):
+                logging.info("Publishing frames failed this tick: " + str(e.args))
+                failures += 1
@@ -0,0 +1,183 @@
+"""
+The model registry. Every model export comes with a json file holding the
+settings it was converted with (anchors, anchor masks, class count, labels),
+and everything that runs a model is configured from it, so switching models
+can't leave the anchors or labels of another model behind.
+"""
+
+from __future__ import annotations
+from pathlib import Path
+from poltergeist import Result, Ok, Err
+from typing import Any, Dict, List, Tuple
+import json
+
+from core import PadType
+
+class ModelSpec:
+    """
+    A model export: the metadata from its json, and the blob (for the OAK)
+    and IR (for the CPU) next to it, if they exist.
+    """
+
+    name: str
+    metadataPath: Path
+    blobPath: Path | None
+    xmlPath: Path | None
+    inputSize: Tuple[int, int]
+    numClasses: int
+    coordinates: int
+    anchors: List[float]
+    anchorMasks: Dict[str, List[int]]
+    iouThreshold: float
+    confidenceThreshold: float
+    labels: List[PadType]
+
+    def __init__(
+            self,
+            name: str,
+            metadataPath: Path,
+            blobPath: Path | None,
+            xmlPath: Path | None,
+            inputSize: Tuple[int, int],
+            numClasses: int,
+            coordinates: int,
+            anchors: List[float],
+            anchorMasks: Dict[str, List[int]],
+            iouThreshold: float,
+            confidenceThreshold: float,
+            labels: List[PadType]
+        ) -> None:
+        self.name = name
+        self.metadataPath = metadataPath
+        self.blobPath = blobPath
+        self.xmlPath = xmlPath
+        self.inputSize = inputSize
+        self.numClasses = numClasses
+        self.coordinates = coordinates
+        self.anchors = anchors
+        self.anchorMasks = anchorMasks
+        self.iouThreshold = iouThreshold
+        self.confidenceThreshold = confidenceThreshold
+        self.labels = labels
+
+    @staticmethod
+    def load(path: Path) -> Result[ModelSpec, Exception]:
+        """
+        Loads a model from an export directory (holding a best.json), a json
+        file, or a blob or IR file with a json of the same name or a best.json
+        next to it. Fails if the metadata is inconsistent, or has a label that
+        isn't a pad type.
+        This method will not raise exceptions.
+        """
+        try:
+            if path.is_dir():
+                directory = path
+                metadataPath = path.joinpath("best.json")
+            else:
+                directory = path.parent
+                metadataPath = path.with_suffix(".json")
+                if not metadataPath.exists():
+                    metadataPath = directory.joinpath("best.json")
+            if not metadataPath.exists():
+                return Err(FileNotFoundError("No model metadata for " + str(path)))
+
+            if path.suffix == ".blob":
+                blobPath: Path | None = path
+            else:
+                blobs = sorted(directory.glob("*.blob"))
+                blobPath = blobs[0] if len(blobs) > 0 else None
+            xmlPath: Path | None = path if path.suffix == ".xml" else metadataPath.with_suffix(".xml")
+            if not xmlPath.exists(): # type: ignore
+                xmlPath = None
+
+            return ModelSpec.parse(
+                directory.name if path.is_dir() or metadataPath.name == "best.json" else path.stem,
+                metadataPath,
+                json.loads(metadataPath.read_text()),
+                blobPath,
+                xmlPath
+            )
+        except Exception as e:
+            return Err(e)
+
+    @staticmethod
+    def parse(name: str, metadataPath: Path, config: Any, blobPath: Path | None, xmlPath: Path | None) -> Result[ModelSpec, Exception]:
+        try:
+            nnConfig = config["nn_config"]
+            meta = nnConfig["NN_specific_metadata"]
+            (width, height) = [int(x) for x in nnConfig["input_size"].split("x")]
+            numClasses: int = meta["classes"]
+            anchors: List[float] = meta["anchors"]
+            anchorMasks: Dict[str, List[int]] = meta["anchor_masks"]
+
+            labels: List[PadType] = []
+            for label in config["mappings"]["labels"]:
+                try:
+                    # The tools used to spell labels with underscores
+                    labels.append(PadType(label.replace("_", " ")))
+                except ValueError:
+                    return Err(ValueError("Label '" + label + "' of " + name + " is not a pad type"))
+        except (KeyError, ValueError, TypeError) as e:
+            return Err(ValueError("Malformed model metadata in " + str(metadataPath) + ": " + str(e)))
+
+        if len(labels) != numClasses:
+            return Err(ValueError(name + " has " + str(numClasses) + " classes, but " + str(len(labels)) + " labels"))
+        if len(set(labels)) != len(labels):
+            return Err(ValueError(name + " has duplicate labels"))
+        if len(anchors) % 2 != 0:
+            return Err(ValueError(name + " has an odd amount of anchor values"))
+        for (side, mask) in anchorMasks.items():
+            if any(i < 0 or i >= len(anchors) // 2 for i in mask):
+                return Err(ValueError(name + " has an anchor mask " + side + " pointing past its anchors"))
+
+        return Ok(ModelSpec(
+            name,
+            metadataPath,
+            blobPath,
+            xmlPath,
+            (width, height),
+            numClasses,
+            meta.get("coordinates", 4),
+            anchors,
+            anchorMasks,
+            meta.get("iou_threshold", 0.5),
+            meta.get("confidence_threshold", 0.5),
+            labels
+        ))
+
+    def intoPadType(self, label: int) -> PadType | None:
+        """
+        The pad type of a label the model outputs.
+        """
+        if 0 <= label < len(self.labels):
+            return self.labels[label]
+        return None
+
+    def hasPad(self, padType: PadType) -> bool:
+        return padType in self.labels
+
+    def configure(self, detectionNetwork: Any) -> None:
+        """
+        Configures a dai.node.YoloDetectionNetwork to run this model.
+        """
+        if self.blobPath is None:
+            raise FileNotFoundError("Model " + self.name + " has no blob to run on the OAK")
+        detectionNetwork.setConfidenceThreshold(self.confidenceThreshold)
+        detectionNetwork.setNumClasses(self.numClasses)
+        detectionNetwork.setCoordinateSize(self.coordinates)
+        detectionNetwork.setAnchors(self.anchors)
+        detectionNetwork.setAnchorMasks(self.anchorMasks)
+        detectionNetwork.setIouThreshold(self.iouThreshold)
+        detectionNetwork.setBlobPath(self.blobPath)
+
+def discover(root: Path) -> Dict[str, ModelSpec]:
+    """
+    Loads every valid model export in the directories under `root`, like
+    the conversion_result_* folders, keyed by their name.
+    """
+    models: Dict[str, ModelSpec] = {}
+    for metadataPath in sorted(root.glob("*/best.json")):
+        match ModelSpec.load(metadataPath.parent):
+            case Ok(model):
+                models[model.name] = model
+    return models
@@ -7,86 +7,138 @@ from pathlib import Path
 from poltergeist import catch, Result, Ok, Err
 from io import TextIOWrapper
 import depthai as dai # type: ignore
-from typing import Any, Tuple, List
-from constants import DEVELOPMENT_MODE
+from typing import Any, Tuple, List, Dict, Protocol, TYPE_CHECKING
+from constants import DEVELOPMENT_MODE, CONFIDENCE_THRESHOLDS, DEFAULT_CONFIDENCE_THRESHOLD, DEFAULT_EXPOSURE
+from framebus import FrameBus
+from postprocess import selectDetections
+from exposure import ExposureProfile, meterLighting, selectProfile
+# The pure types live in core, and are still imported from here
+from core import HEIGHT_FOV, WIDTH_FOV, PadType, intoPadType, TrackStatus, PixelCoords, PixelDetection
+import numpy as np
+if TYPE_CHECKING:
+    from models import ModelSpec
+    from undistort import UndistortionMap
 from enum import Enum
 
-HEIGHT_FOV = 55
-WIDTH_FOV = 69
-nnPath = Path("assets/detection_model.blob")
-
-class PadType(Enum):
-    bottleDropoff = 'bottle dropoff'
-    bottlePickup = 'bottle pickup'
-    medkitDropoff = 'medkit dropoff'
-    medkitPickup = 'medkit pickup'
-    smoresDropoff = 'smores dropoff'
-    smoresPickup = 'smores pickup'
-    padCenter = 'pad center'
-
-def intoPadType(input: int) -> PadType | None:
-    if input == 0:
-        return PadType.bottleDropoff
-    elif input == 1:
-        return PadType.bottlePickup
-    elif input == 2:
-        return PadType.medkitDropoff
-    elif input == 3:
-        return PadType.medkitPickup
-    elif input == 4:
-        return PadType.smoresDropoff
-    elif input == 5:
-        return PadType.smoresPickup
-    elif input == 6:
-        return PadType.padCenter
+def intoTrackStatus(status: dai.Tracklet.TrackingStatus) -> TrackStatus | None:
+    if status == dai.Tracklet.TrackingStatus.NEW:
+        return TrackStatus.new
+    elif status == dai.Tracklet.TrackingStatus.TRACKED:
+        return TrackStatus.tracked
+    elif status == dai.Tracklet.TrackingStatus.LOST:
+        return TrackStatus.lost
     else:
+        # Removed tracklets aren't worth reporting
         return None
     
-class PixelCoords:
+def confidenceThreshold(padType: PadType) -> float:
+    return CONFIDENCE_THRESHOLDS.get(padType.value, DEFAULT_CONFIDENCE_THRESHOLD)
+
+def lowestConfidenceThreshold() -> float:
+    """
+    The threshold the NN has to run with, so no pad type loses
+    detections before they reach the host.
+    """
+    return min([DEFAULT_CONFIDENCE_THRESHOLD] + list(CONFIDENCE_THRESHOLDS.values()))
+
+def filterDetections(detections: List[PixelDetection]) -> List[PixelDetection]:
+    """
+    Applies the confidence threshold of every pad type, and suppresses
+    duplicate pads across pad types (see `postprocess.selectDetections`).
+    Detections without a box only go through the threshold.
+    This function will not raise exceptions.
     """
-    Pixel coordinates ranging from 0.0 - 1.0, with the origin
-    at the top left.
+    boxed = [d for d in detections if d.bbox is not None]
+    unboxed = [d for d in detections if d.bbox is None and d.confidence >= confidenceThreshold(d.padType)]
+    if len(boxed) == 0:
+        return unboxed
+
+    keep = selectDetections(
+        np.array([d.bbox for d in boxed], dtype=np.float64),
+        np.array([d.confidence for d in boxed], dtype=np.float64),
+        np.array([confidenceThreshold(d.padType) for d in boxed], dtype=np.float64),
+        np.array([d.padType == PadType.padCenter for d in boxed])
+    )
+    return [d for (d, k) in zip(boxed, keep) if k] + unboxed
+
+class DetectionBackend(Protocol):
+    """
+    Anything that can feed detections into the state machine, like the
+    Eye running on the OAK, or a `cpu_optics.CpuEye`.
     """
 
-    x: float
-    y: float
+    # The detections of the last tick that had any data
+    latest: List[PixelDetection]
 
-    def __init__(self, x: float, y: float) -> None:
-        self.x = x
-        self.y = y
+    def tick(self) -> Result[List[PixelDetection] | None, Exception]:
+        ...
 
-class PixelDetection:
-    padType: PadType
-    normalizedCoords: PixelCoords
-    confidence: float
+    def updateVideoTape(self) -> Result[None, Exception]:
+        ...
 
-    def __init__(self, padType: PadType, normalizedCoords: PixelCoords, confidence: float) -> None:
-        self.padType = padType
-        self.normalizedCoords = normalizedCoords
-        self.confidence = confidence
+    def updateFrameBus(self) -> Result[None, Exception]:
+        ...
 
 class Eye:
     videoTape: Tuple[TextIOWrapper, dai.DataOutputQueue] | None
+    frameBus: Tuple[FrameBus, dai.DataOutputQueue] | None
     nnQueue: dai.DataOutputQueue
     device: dai.Device
+    model: ModelSpec
+    tracking: bool
+    # The last known center and timestamp (seconds) of every live track
+    trackHistory: Dict[int, Tuple[PixelCoords, float]]
+    # The camera settings in use, None if they are the defaults
+    exposure: ExposureProfile | None
+    # Corrects the lens distortion of detection centres, if calibrated
+    undistortion: UndistortionMap | None
+    latest: List[PixelDetection]
     
     def __init__(
             self, 
             videoTape: 
             Tuple[TextIOWrapper, dai.DataOutputQueue] | None, 
             nnQueue: dai.DataOutputQueue, 
-            device: dai.Device
+            device: dai.Device,
+            model: ModelSpec,
+            tracking: bool = False,
+            frameBus: Tuple[FrameBus, dai.DataOutputQueue] | None = None,
+            exposure: ExposureProfile | None = None,
+            undistortion: UndistortionMap | None = None
         ) -> None:
         self.videoTape = videoTape
+        self.frameBus = frameBus
         self.nnQueue = nnQueue
         self.device = device
+        self.model = model
+        self.tracking = tracking
+        self.trackHistory = {}
+        self.exposure = exposure
+        self.undistortion = undistortion
+        self.latest = []
 
     @staticmethod
-    def new(saveVideoPath: Path | None) -> Result[Eye, Exception]:
+    def new(
+            saveVideoPath: Path | None, 
+            model: ModelSpec, 
+            tracking: bool = False, 
+            frameBusName: str | None = None,
+            exposureProfiles: Dict[str, ExposureProfile] | None = None,
+            undistortion: UndistortionMap | None = None
+        ) -> Result[Eye, Exception]:
         """
-        Creates an Eye. If `save_video_path` is not None, 
+        Creates an Eye running `model`. If `save_video_path` is not None, 
         H265 data from the cam will be written to the file.
         If the filepath doesnt exist, this method will create one.
+        If `tracking` is True, detections are passed through an
+        on-device object tracker, which keeps tracking pads at the full
+        camera FPS in between NN frames.
+        If `frameBusName` is not None, every preview frame is published
+        to a shared memory `FrameBus` of that name for other processes.
+        If `exposureProfiles` is not None, the light is metered at startup
+        and the camera uses the profile of the lighting condition.
+        If `undistortion` is not None, the centres of detections are
+        corrected for lens distortion, their boxes are left as they are.
         This constructor will not raise exceptions.
         """
         # Create pipeline
@@ -101,44 +153,18 @@ class Eye:
         # Camera config
         camRgb.setPreviewKeepAspectRatio(False)
         camRgb.setFps(15)
-        camRgb.setPreviewSize(416, 416)
+        camRgb.setPreviewSize(model.inputSize[0], model.inputSize[1])
         camRgb.setResolution(dai.ColorCameraProperties.SensorResolution.THE_1080_P)
         camRgb.setInterleaved(False)
         camRgb.setColorOrder(dai.ColorCameraProperties.ColorOrder.BGR)
 
         # Image recognition config
-        detectionNetwork.setConfidenceThreshold(0.5)
-        detectionNetwork.setNumClasses(7)
-        detectionNetwork.setCoordinateSize(4)
-        detectionNetwork.setAnchors([
-                10.0,
-                13.0,
-                16.0,
-                30.0,
-                33.0,
-                23.0,
-                30.0,
-                61.0,
-                62.0,
-                45.0,
-                59.0,
-                119.0,
-                116.0,
-                90.0,
-                156.0,
-                198.0,
-                373.0,
-                326.0
-        ])
-        detectionNetwork.setAnchorMasks(
-            {
-                "side52": [0, 1, 2], 
-                "side26": [3, 4, 5], 
-                "side13": [6, 7, 8]
-            }
-        )
-        detectionNetwork.setIouThreshold(0.5)
-        detectionNetwork.setBlobPath(nnPath)
+        try:
+            model.configure(detectionNetwork)
+        except Exception as e:
+            return Err(e)
+        # Every pad type has its own threshold, applied on the host
+        detectionNetwork.setConfidenceThreshold(lowestConfidenceThreshold())
         detectionNetwork.setNumInferenceThreads(2) 
         detectionNetwork.input.setBlocking(False)
 
@@ -148,8 +174,25 @@ class Eye:
         # Link to image recognition
         camRgb.preview.link(detectionNetwork.input)
 
-        # Link to nnOut
-        detectionNetwork.out.link(nnOut.input)
+        if tracking:
+            objectTracker = pipeline.create(dai.node.ObjectTracker)
+            objectTracker.setDetectionLabelsToTrack(list(range(model.numClasses)))
+            # This tracker type can follow pads on frames the NN hasn't seen
+            objectTracker.setTrackerType(dai.TrackerType.ZERO_TERM_COLOR_HISTOGRAM)
+            objectTracker.setTrackerIdAssignmentPolicy(dai.TrackerIdAssignmentPolicy.UNIQUE_ID)
+
+            # Track on every camera frame, not just the ones that went through the NN
+            camRgb.preview.link(objectTracker.inputTrackerFrame)
+            objectTracker.inputTrackerFrame.setBlocking(False)
+            objectTracker.inputTrackerFrame.setQueueSize(2)
+            detectionNetwork.passthrough.link(objectTracker.inputDetectionFrame)
+            detectionNetwork.out.link(objectTracker.inputDetections)
+
+            # Link to nnOut
+            objectTracker.out.link(nnOut.input)
+        else:
+            # Link to nnOut
+            detectionNetwork.out.link(nnOut.input)
 
         # Video taping
         if isinstance(saveVideoPath, Path):
@@ -171,6 +214,19 @@ class Eye:
         else:
             videoTape = None
 
+        # Frame bus
+        if frameBusName is not None:
+            previewOut = pipeline.create(dai.node.XLinkOut)
+            previewOut.setStreamName("preview")
+            camRgb.preview.link(previewOut.input)
+
+        # Metering, with a single still
+        meter = exposureProfiles is not None and len(exposureProfiles) > 0 and DEVELOPMENT_MODE == False
+        if meter:
+            stillOut = pipeline.create(dai.node.XLinkOut)
+            stillOut.setStreamName("still")
+            camRgb.still.link(stillOut.input)
+
         # Camera control
         controlIn = pipeline.create(dai.node.XLinkIn)
         controlIn.setStreamName("control")
@@ -183,18 +239,36 @@ class Eye:
 
             # Set camera settings
             qControl = device.getInputQueue(name="control")
+            exposure = None
+            if meter:
+                stillQueue = device.getOutputQueue(name="still", maxSize=1, blocking=False)
+                match meterLighting(qControl, stillQueue):
+                    case Ok(condition):
+                        exposure = selectProfile(exposureProfiles, condition) # type: ignore
+                    case Err(_):
+                        # The default exposure still works, just not as well
+                        pass
             cc = dai.CameraControl()
-            cc.setManualExposure(500, 200)
+            if exposure is not None:
+                exposure.apply(cc)
+            else:
+                cc.setManualExposure(*DEFAULT_EXPOSURE)
             if DEVELOPMENT_MODE == False:
                 qControl.send(cc)
 
             # The queue should have the freshest data in it
             nnQueue = device.getOutputQueue(name="nn", maxSize=1, blocking=False)
+            frameBus = None
+            if frameBusName is not None:
+                # Planar BGR, like the NN input
+                bus = FrameBus.create(frameBusName, (3, model.inputSize[1], model.inputSize[0]))
+                previewQueue = device.getOutputQueue(name="preview", maxSize=4, blocking=False)
+                frameBus = (bus, previewQueue)
             if videoTape is not None:
                 rgbQueue = device.getOutputQueue(name="h265", maxSize=30, blocking=False)
-                return Ok(Eye((videoTape, rgbQueue), nnQueue, device)) 
+                return Ok(Eye((videoTape, rgbQueue), nnQueue, device, model, tracking, frameBus, exposure, undistortion)) 
             else:
-                return Ok(Eye(None, nnQueue, device)) 
+                return Ok(Eye(None, nnQueue, device, model, tracking, frameBus, exposure, undistortion)) 
         except Exception as e:
             return Err(e)
 
@@ -210,14 +284,23 @@ class Eye:
             _inDet = self.nnQueue.tryGet()
         except Exception as e:
             return Err(e)
+
+        if self.tracking:
+            # Remove the generic
+            inTrack: None | dai.Tracklets = _inDet # type: ignore
+            if inTrack is None or inTrack.tracklets is None:
+                return Ok(None)
+            self.latest = self.correct(filterDetections(self.trackletsToDetections(inTrack)))
+            return Ok(self.latest)
         
         # Remove the generic
         inDet: None | dai.ImgDetections = _inDet # type: ignore
 
         if inDet is not None and inDet.detections is not None:
+            sequence = inDet.getSequenceNum()
             results: List[PixelDetection] = []
             for detection in inDet.detections:
-                padType = intoPadType(detection.label)
+                padType = self.model.intoPadType(detection.label)
                 if padType is None:
                     # Just skip it
                     continue
@@ -228,12 +311,79 @@ class Eye:
                 centerX = (detection.xmin + detection.xmax) / 2
                 centerY = (detection.ymin + detection.ymax) / 2
                 
-                results.append(PixelDetection(padType, PixelCoords(centerX, centerY), detection.confidence))
-            return Ok(results)
+                results.append(PixelDetection(
+                    padType, 
+                    PixelCoords(centerX, centerY), 
+                    detection.confidence, 
+                    bbox=(detection.xmin, detection.ymin, detection.xmax, detection.ymax), 
+                    sequence=sequence
+                ))
+            self.latest = self.correct(filterDetections(results))
+            return Ok(self.latest)
         else:
             # No new data is available
             return Ok(None)
         
+    def correct(self, detections: List[PixelDetection]) -> List[PixelDetection]:
+        # Only the centres, the boxes stay raw like the frames they were found
+        # on. The CentreRefiner undistorts its centres with the same map.
+        if self.undistortion is not None:
+            for d in detections:
+                d.normalizedCoords = self.undistortion.correct(d.normalizedCoords)
+        return detections
+
+    def trackletsToDetections(self, inTrack: dai.Tracklets) -> List[PixelDetection]:
+        """
+        Converts the tracker output into detections, estimating the velocity
+        of every track from the last time it was seen. Lost tracks aren't
+        detections.
+        """
+        timestamp = inTrack.getTimestamp().total_seconds()
+        sequence = inTrack.getSequenceNum()
+        results: List[PixelDetection] = []
+        for tracklet in inTrack.tracklets:
+            status = intoTrackStatus(tracklet.status)
+            if status is None:
+                self.trackHistory.pop(tracklet.id, None)
+                continue
+            if status == TrackStatus.lost:
+                # The tracker only guesses where a lost track went, and the
+                # confidence is from the last detection. The history is kept,
+                # so the velocity picks up again if it's found.
+                continue
+
+            padType = self.model.intoPadType(tracklet.label)
+            if padType is None:
+                continue
+
+            roi = tracklet.roi
+            center = PixelCoords(
+                roi.topLeft().x + (roi.width() / 2), 
+                roi.topLeft().y + (roi.height() / 2)
+            )
+
+            velocity = None
+            last = self.trackHistory.get(tracklet.id)
+            if last is not None and timestamp > last[1]:
+                dt = timestamp - last[1]
+                velocity = PixelCoords(
+                    (center.x - last[0].x) / dt,
+                    (center.y - last[0].y) / dt
+                )
+            self.trackHistory[tracklet.id] = (center, timestamp)
+
+            results.append(PixelDetection(
+                padType, 
+                center, 
+                tracklet.srcImgDetection.confidence, 
+                tracklet.id, 
+                status, 
+                velocity,
+                (roi.topLeft().x, roi.topLeft().y, roi.bottomRight().x, roi.bottomRight().y),
+                sequence
+            ))
+        return results
+        
     def updateVideoTape(self) -> Result[None, Exception]:
         if self.videoTape is None:
             return Ok(None)
@@ -248,3 +398,23 @@ class Eye:
         except Exception as e:
             return Err(e)
 
+    def updateFrameBus(self) -> Result[None, Exception]:
+        """
+        Publishes every preview frame that arrived since the last call
+        to the frame bus. Readers never hold this up.
+        """
+        if self.frameBus is None:
+            return Ok(None)
+        (bus, qPreview) = self.frameBus
+        try:
+            res = qPreview.tryGetAll()
+            if res is not None:
+                for frame in res:
+                    bus.publish(
+                        frame.getData(), # type: ignore
+                        frame.getTimestamp().total_seconds(), # type: ignore
+                        frame.getSequenceNum() # type: ignore
+                    )
+            return Ok(None)
+        except Exception as e:
+            return Err(e)
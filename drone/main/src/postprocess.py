@@ -0,0 +1,72 @@
+"""
+Host side filtering of the detections of a frame, before they are projected
+and handed to the Conductor. The NN only suppresses boxes of the same class,
+so one pad can come out as several pad types, or with its printed label
+detected again as a smaller pad inside it. Both are reduced to the most
+confident detection here. Everything works on arrays of the whole frame at
+once, see `optics.filterDetections` for the PixelDetection side.
+"""
+
+from __future__ import annotations
+from typing import Tuple
+import numpy as np
+
+from constants import CROSS_CLASS_IOU, NESTED_COVERAGE
+
+def overlaps(boxes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    The IoU of every pair of (xmin, ymin, xmax, ymax) boxes, and how much of
+    the smaller box of every pair is covered by the other one.
+    """
+    xmin = np.maximum(boxes[:, None, 0], boxes[None, :, 0])
+    ymin = np.maximum(boxes[:, None, 1], boxes[None, :, 1])
+    xmax = np.minimum(boxes[:, None, 2], boxes[None, :, 2])
+    ymax = np.minimum(boxes[:, None, 3], boxes[None, :, 3])
+    intersection = np.clip(xmax - xmin, 0, None) * np.clip(ymax - ymin, 0, None)
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    union = areas[:, None] + areas[None, :] - intersection
+    smaller = np.minimum(areas[:, None], areas[None, :])
+    return (intersection / np.maximum(union, 1e-12), intersection / np.maximum(smaller, 1e-12))
+
+def suppress(scores: np.ndarray, conflicts: np.ndarray) -> np.ndarray:
+    """
+    Greedy suppression: going from the most confident detection down, drops
+    every detection conflicting with one that was kept. Returns a keep mask.
+    """
+    keep = np.ones(len(scores), bool)
+    for i in np.argsort(-scores, kind="stable"):
+        if keep[i]:
+            rivals = conflicts[i].copy()
+            rivals[i] = False
+            keep &= ~rivals | (scores > scores[i])
+    return keep
+
+def selectDetections(boxes: np.ndarray, scores: np.ndarray, thresholds: np.ndarray, isCenter: np.ndarray) -> np.ndarray:
+    """
+    Returns the keep mask of the detections of a frame. Detections under
+    their threshold are dropped, then pads overlapping or nested in a more
+    confident pad are suppressed, whatever their type. Pad centers only
+    compete with each other: one center per pad, and a center with no pad
+    around it (close to the ground, the pad fills the frame) is kept.
+    """
+    keep = scores >= thresholds
+    if not keep.any():
+        return keep
+    (iou, coverage) = overlaps(boxes)
+
+    # A pad has one type, so overlapping pads of any type are duplicates
+    samePad = ((iou >= CROSS_CLASS_IOU) | (coverage >= NESTED_COVERAGE)) & ~isCenter[:, None] & ~isCenter[None, :]
+    sameCenter = (iou >= CROSS_CLASS_IOU) & isCenter[:, None] & isCenter[None, :]
+    candidates = keep[:, None] & keep[None, :]
+    keep &= suppress(scores, (samePad | sameCenter) & candidates)
+
+    pads = np.nonzero(keep & ~isCenter)[0]
+    if len(pads) > 0:
+        centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+        inside = (
+            (centers[:, None, 0] >= boxes[None, pads, 0]) & (centers[:, None, 0] <= boxes[None, pads, 2]) &
+            (centers[:, None, 1] >= boxes[None, pads, 1]) & (centers[:, None, 1] <= boxes[None, pads, 3])
+        ) & (isCenter & keep)[:, None]
+        sharePad = (inside.astype(np.int32) @ inside.T.astype(np.int32)) > 0
+        keep &= suppress(scores, sharePad) | ~isCenter
+    return keep
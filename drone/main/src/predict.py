@@ -0,0 +1,90 @@
+"""
+Predicts where the pad is between NN results. A detection is already old
+when it comes in, and the AV keeps flying until the next one, so steering to
+where the pad was seen overshoots. `TargetPredictor` keeps the offset of the
+pad from the AV in metres (east, north, like `compute.relativeDistance`)
+with an alpha-beta filter, and moves it against the velocity of the AV every
+tick.
+"""
+
+from __future__ import annotations
+from typing import Any, Tuple
+
+from constants import PREDICT_ALPHA, PREDICT_BETA, PREDICT_LATENCY, PREDICT_TIMEOUT
+
+def vehicleVelocity(vehicle: Any) -> Tuple[float, float]:
+    """
+    The (east, north) velocity of `vehicle` in m/s, zero if it's unknown.
+    """
+    velocity = vehicle.velocity
+    if velocity is None or velocity[0] is None or velocity[1] is None:
+        return (0.0, 0.0)
+    # The vehicle velocity is NED
+    return (velocity[1], velocity[0])
+
+class TargetPredictor:
+    alpha: float
+    beta: float
+    # Metres from the AV to the pad, as of `time`, the last correction
+    offset: Tuple[float, float] | None
+    # The velocity of the pad itself, which soaks up a biased AV velocity
+    rate: Tuple[float, float]
+    # When `offset` is as of, from time.monotonic()
+    time: float
+    lastMeasured: float
+
+    def __init__(self, alpha: float = PREDICT_ALPHA, beta: float = PREDICT_BETA) -> None:
+        self.alpha = alpha
+        self.beta = beta
+        self.reset()
+
+    def reset(self) -> None:
+        self.offset = None
+        self.rate = (0.0, 0.0)
+        self.time = 0.0
+        self.lastMeasured = 0.0
+
+    def propagate(self, now: float, velocity: Tuple[float, float]) -> Tuple[float, float] | None:
+        """
+        The offset at `now`, if the AV flew at `velocity` since it was
+        corrected. The velocity only changes a little between detections.
+        """
+        if self.offset is None:
+            return None
+        dt = now - self.time
+        return (
+            self.offset[0] + (self.rate[0] - velocity[0]) * dt,
+            self.offset[1] + (self.rate[1] - velocity[1]) * dt
+        )
+
+    def update(self, measured: Tuple[float, float], now: float, velocity: Tuple[float, float]) -> None:
+        """
+        Corrects the prediction with a detection received at `now`, which was
+        seen PREDICT_LATENCY before.
+        """
+        seen = now - PREDICT_LATENCY
+        if self.offset is None or now - self.lastMeasured > PREDICT_TIMEOUT:
+            self.reset()
+            self.offset = measured
+            self.time = seen
+            self.lastMeasured = now
+            return
+
+        # Not max(), it allocates an iterator every detection
+        dt = now - self.lastMeasured
+        if dt < 1e-3:
+            dt = 1e-3
+        predicted: Tuple[float, float] = self.propagate(seen, velocity) # type: ignore
+        residual = (measured[0] - predicted[0], measured[1] - predicted[1])
+        self.offset = (predicted[0] + self.alpha * residual[0], predicted[1] + self.alpha * residual[1])
+        self.time = seen
+        self.rate = (self.rate[0] + self.beta * residual[0] / dt, self.rate[1] + self.beta * residual[1] / dt)
+        self.lastMeasured = now
+
+    def predict(self, now: float, velocity: Tuple[float, float]) -> Tuple[float, float] | None:
+        """
+        The offset of the pad now, or None if it wasn't seen for PREDICT_TIMEOUT.
+        """
+        if self.offset is None or now - self.lastMeasured > PREDICT_TIMEOUT:
+            return None
+        return self.propagate(now, velocity)
@@ -0,0 +1,305 @@
+"""
+A live preview of the guidance system for field debugging, over HTTP: the
+camera frames from the frame bus as an MJPEG stream on /stream, with the
+detections drawn on them, and the state of the machine and the Conductor's
+blobs as json on /state. Open the root page from a laptop, through an ssh
+tunnel or on the same network if PREVIEW_HOST is opened up.
+
+The control loop only hands over references with `publish`. Encoding happens
+on a low priority thread of its own, only while someone is watching, and never
+faster than the CPU and bandwidth budgets allow: frames that come in while the
+encoder waits are skipped.
+"""
+
+from __future__ import annotations
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from poltergeist import Result, Ok, Err
+from typing import List, Tuple, TYPE_CHECKING
+import json
+import os
+import threading
+import time
+import cv2 # type: ignore
+import numpy as np
+
+from framebus import FrameBus
+
+if TYPE_CHECKING:
+    from optics import PixelDetection
+    from compute import LocationDetection
+
+PAGE = b"""<!DOCTYPE html>
+<html><head><title>venus</title></head>
+<body style="background: #111; color: #eee; font-family: monospace">
+<img src="/stream" style="width: 640px; image-rendering: pixelated"><pre id="state"></pre>
+<script>
+setInterval(() => fetch("/state").then(r => r.json()).then(s => {
+    document.getElementById("state").textContent = JSON.stringify(s, null, 2);
+}), 1000);
+</script>
+</body></html>
+"""
+
+class PreviewServer:
+    """
+    Serves the preview on `port`. `bus` may be None, in which case only the
+    state is served. `cpuBudget` is the share of one core the encoder may use,
+    and `maxBandwidth` the bytes per second it may send over all clients.
+    """
+
+    bus: FrameBus | None
+    maxFps: float
+    cpuBudget: float
+    maxBandwidth: float
+    scale: float
+    quality: int
+    # The state name, detections and blobs, swapped in whole by `publish`
+    snapshot: Tuple[str, List[PixelDetection], List[LocationDetection]]
+    jpeg: bytes | None
+    jpegSequence: int
+    frameReady: threading.Condition
+    clients: int
+    skipped: int
+    encoded: int
+    # Seconds per encode, averaged, so a slow first frame doesn't stall the stream
+    encodeTime: float
+    stopped: threading.Event
+    httpServer: ThreadingHTTPServer
+    threads: List[threading.Thread]
+
+    def __init__(
+            self,
+            httpServer: ThreadingHTTPServer,
+            bus: FrameBus | None,
+            maxFps: float,
+            cpuBudget: float,
+            maxBandwidth: float,
+            scale: float,
+            quality: int
+        ) -> None:
+        self.httpServer = httpServer
+        self.bus = bus
+        self.maxFps = maxFps
+        self.cpuBudget = cpuBudget
+        self.maxBandwidth = maxBandwidth
+        self.scale = scale
+        self.quality = quality
+        self.snapshot = ("", [], [])
+        self.jpeg = None
+        self.jpegSequence = -1
+        self.frameReady = threading.Condition()
+        self.clients = 0
+        self.skipped = 0
+        self.encoded = 0
+        self.encodeTime = 0.0
+        self.stopped = threading.Event()
+        self.threads = []
+
+    @staticmethod
+    def start(
+            port: int,
+            bus: FrameBus | None,
+            maxFps: float = 5,
+            cpuBudget: float = 0.1,
+            maxBandwidth: float = 200_000,
+            scale: float = 0.5,
+            quality: int = 60,
+            host: str = "127.0.0.1"
+        ) -> Result[PreviewServer, Exception]:
+        """
+        Starts serving on `port`, 0 picks a free one (see `port`). Anyone who
+        can reach `host` can watch, there is no authentication.
+        This constructor will not raise exceptions.
+        """
+        try:
+            httpServer = ThreadingHTTPServer((host, port), PreviewHandler)
+            httpServer.daemon_threads = True
+            preview = PreviewServer(httpServer, bus, maxFps, cpuBudget, maxBandwidth, scale, quality)
+            httpServer.preview = preview # type: ignore
+            preview.threads = [
+                threading.Thread(target=httpServer.serve_forever, kwargs={ "poll_interval": 0.5 }, daemon=True),
+                threading.Thread(target=preview.encodeLoop, daemon=True)
+            ]
+            for thread in preview.threads:
+                thread.start()
+            return Ok(preview)
+        except Exception as e:
+            return Err(e)
+
+    @property
+    def port(self) -> int:
+        return self.httpServer.server_address[1]
+
+    def publish(self, state: str, detections: List[PixelDetection], blobs: List[LocationDetection]) -> None:
+        """
+        Called from the control loop, so it does nothing but swap references.
+        """
+        self.snapshot = (state, detections, list(blobs))
+
+    def stateJson(self) -> bytes:
+        (state, detections, blobs) = self.snapshot
+        return json.dumps({
+            "state": state,
+            "detections": [
+                {
+                    "pad": d.padType.value,
+                    "x": d.normalizedCoords.x,
+                    "y": d.normalizedCoords.y,
+                    "confidence": d.confidence,
+                    "track": d.trackId
+                } for d in detections
+            ],
+            "blobs": [
+                {
+                    "pad": b.padType.value,
+                    "lat": b.location.lat,
+                    "lon": b.location.lon,
+                    "confidence": b.confidence
+                } for b in blobs
+            ],
+            "preview": {
+                "clients": self.clients,
+                "encoded": self.encoded,
+                "skipped": self.skipped
+            }
+        }).encode()
+
+    def addClient(self, change: int) -> None:
+        with self.frameReady:
+            self.clients += change
+            self.frameReady.notify_all()
+
+    def waitFrame(self, after: int, timeout: float) -> Tuple[int, bytes | None]:
+        """
+        Blocks until a frame newer than the sequence number `after` was encoded.
+        """
+        with self.frameReady:
+            if self.jpegSequence <= after:
+                self.frameReady.wait(timeout)
+            if self.jpegSequence <= after:
+                return (after, None)
+            return (self.jpegSequence, self.jpeg)
+
+    def annotate(self, image: np.ndarray) -> None:
+        (state, detections, blobs) = self.snapshot
+        (height, width) = image.shape[:2]
+        for d in detections:
+            if d.bbox is not None:
+                (xmin, ymin, xmax, ymax) = d.bbox
+                cv2.rectangle(image, (int(xmin * width), int(ymin * height)), (int(xmax * width), int(ymax * height)), (255, 0, 0), 1)
+            center = (int(d.normalizedCoords.x * width), int(d.normalizedCoords.y * height))
+            cv2.circle(image, center, 2, (0, 255, 0), -1)
+            cv2.putText(image, "{} {:.0f}%".format(d.padType.value, d.confidence * 100), center, cv2.FONT_HERSHEY_PLAIN, 0.8, (255, 255, 255))
+        cv2.putText(image, "{} | {} blobs".format(state, len(blobs)), (2, height - 4), cv2.FONT_HERSHEY_PLAIN, 0.8, (255, 255, 255))
+
+    def encodeLoop(self) -> None:
+        try:
+            # Linux lets a single thread be niced, the control loop keeps its priority
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+        except (AttributeError, OSError):
+            pass
+
+        lastSequence = -1
+        while not self.stopped.is_set():
+            with self.frameReady:
+                if self.clients == 0 or self.bus is None:
+                    # Nobody is watching, so nothing is encoded
+                    self.frameReady.wait(0.5)
+                    continue
+                clients = self.clients
+
+            startTime = time.monotonic()
+            latest = self.bus.latest()
+            if latest is None or latest[0] == lastSequence:
+                time.sleep(0.01)
+                continue
+            (sequence, _, frame) = latest
+            # The bus holds planar frames, OpenCV wants them interleaved
+            image = np.ascontiguousarray(frame.transpose(1, 2, 0))
+            if not self.bus.isValid(sequence):
+                # Overwritten while copying, the next one will do
+                continue
+            if lastSequence >= 0:
+                self.skipped += max(0, sequence - lastSequence - 1)
+            lastSequence = sequence
+
+            if self.scale != 1.0:
+                image = cv2.resize(image, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+            self.annotate(image)
+            ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+            if not ok:
+                continue
+            jpeg = encoded.tobytes()
+            with self.frameReady:
+                self.jpeg = jpeg
+                self.jpegSequence = sequence
+                self.encoded += 1
+                self.frameReady.notify_all()
+
+            # Wait long enough to stay in every budget
+            spent = time.monotonic() - startTime
+            self.encodeTime += (spent - self.encodeTime) * 0.2
+            interval = max(
+                1.0 / self.maxFps,
+                self.encodeTime / self.cpuBudget,
+                len(jpeg) * clients / self.maxBandwidth
+            )
+            self.stopped.wait(max(0.0, interval - spent))
+
+    def close(self) -> None:
+        self.stopped.set()
+        self.addClient(0)
+        self.httpServer.shutdown()
+        self.httpServer.server_close()
+        for thread in self.threads:
+            thread.join()
+
+class PreviewHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        preview: PreviewServer = self.server.preview # type: ignore
+        if self.path == "/state":
+            body = preview.stateJson()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif self.path == "/stream":
+            if preview.bus is None:
+                self.send_error(404, "No frame bus to preview")
+                return
+            self.streamFrames(preview)
+        elif self.path == "/":
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html")
+            self.send_header("Content-Length", str(len(PAGE)))
+            self.end_headers()
+            self.wfile.write(PAGE)
+        else:
+            self.send_error(404)
+
+    def streamFrames(self, preview: PreviewServer) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "multipart/x-mixed-replace; boundary=frame")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        preview.addClient(1)
+        try:
+            last = -1
+            while not preview.stopped.is_set():
+                (last, jpeg) = preview.waitFrame(last, 1.0)
+                if jpeg is None:
+                    continue
+                self.wfile.write(b"--frame\r\nContent-Type: image/jpeg\r\nContent-Length: " + str(len(jpeg)).encode() + b"\r\n\r\n")
+                self.wfile.write(jpeg + b"\r\n")
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client went away
+            pass
+        finally:
+            preview.addClient(-1)
+
+    def log_message(self, format: str, *args) -> None:
+        # Requests would flood the flight log
+        pass
@@ -0,0 +1,169 @@
+"""
+Refines the pad center found by the NN to sub-pixel precision, by looking at the
+camera frame around the NN box. The refinement runs on its own thread, and the
+state machine only ever picks up the last finished result.
+"""
+
+from __future__ import annotations
+from typing import Tuple, TYPE_CHECKING
+import threading
+import numpy as np
+
+from framebus import FrameBus
+from core import PixelCoords, PixelDetection
+if TYPE_CHECKING:
+    from undistort import UndistortionMap
+
+# How much of the box size is added around the box on every side
+ROI_PADDING = 0.25
+
+# The smallest ROI worth refining, in pixels
+MIN_ROI_SIZE = 8
+
+def otsuThreshold(gray: np.ndarray) -> float:
+    """
+    The threshold that best splits a grayscale image into a dark and
+    bright class.
+    """
+    histogram = np.bincount(gray.reshape(-1), minlength=256).astype(np.float64)
+    levels = np.arange(256, dtype=np.float64)
+    weightDark = np.cumsum(histogram)
+    weightBright = weightDark[-1] - weightDark
+    sumDark = np.cumsum(histogram * levels)
+    meanDark = sumDark / np.maximum(weightDark, 1e-9)
+    meanBright = (sumDark[-1] - sumDark) / np.maximum(weightBright, 1e-9)
+    between = weightDark * weightBright * (meanDark - meanBright) ** 2
+    return float(between.argmax())
+
+def brightCentroid(gray: np.ndarray) -> Tuple[float, float] | None:
+    """
+    Returns the (x, y) centroid of the bright part of a grayscale ROI, from
+    its image moments, in pixels. Returns None if the ROI is featureless.
+    """
+    threshold = otsuThreshold(gray)
+    mask = gray > threshold
+    m00 = mask.sum()
+    if m00 == 0 or m00 == mask.size:
+        return None
+    (ys, xs) = np.nonzero(mask)
+    # The +0.5 puts coordinates on pixel centers
+    return (float(xs.mean()) + 0.5, float(ys.mean()) + 0.5)
+
+class Refinement:
+    """
+    The result of refining one detection. `center` is in the coords of the
+    detections, undistorted if the Eye undistorts them. `offset` is how far
+    the refined center is from the NN box center in the raw frame, in
+    normalized pixel coords.
+    """
+
+    sequence: int | None
+    center: PixelCoords
+    offset: PixelCoords
+
+    def __init__(self, sequence: int | None, center: PixelCoords, offset: PixelCoords) -> None:
+        self.sequence = sequence
+        self.center = center
+        self.offset = offset
+
+class CentreRefiner:
+    bus: FrameBus
+    # The boxes and frames are raw, the centers are corrected like the Eye's
+    undistortion: UndistortionMap | None
+    condition: threading.Condition
+    pending: PixelDetection | None
+    result: Refinement | None
+    running: bool
+    worker: threading.Thread
+
+    def __init__(self, bus: FrameBus, undistortion: UndistortionMap | None = None) -> None:
+        self.bus = bus
+        self.undistortion = undistortion
+        self.condition = threading.Condition()
+        self.pending = None
+        self.result = None
+        self.running = True
+        self.worker = threading.Thread(target=self.run, daemon=True)
+        self.worker.start()
+
+    def submit(self, detection: PixelDetection) -> None:
+        """
+        Queues a detection for refinement, replacing any that is still
+        waiting. This never blocks.
+        """
+        with self.condition:
+            self.pending = detection
+            self.condition.notify()
+
+    def latest(self) -> Refinement | None:
+        with self.condition:
+            return self.result
+
+    def refine(self, detection: PixelDetection) -> Refinement | None:
+        """
+        Refines a detection on the frame it was seen on. Returns None if that
+        frame isn't on the bus anymore, the box wouldn't match another one.
+        """
+        if detection.bbox is None or detection.sequence is None:
+            return None
+
+        sequence = self.bus.findDeviceSequence(detection.sequence)
+        if sequence is None:
+            return None
+        frame = self.bus.read(sequence)
+        if frame is None:
+            return None
+        (_, planar) = frame
+        (_, height, width) = planar.shape
+
+        (xmin, ymin, xmax, ymax) = detection.bbox
+        padX = (xmax - xmin) * ROI_PADDING
+        padY = (ymax - ymin) * ROI_PADDING
+        left = max(0, int((xmin - padX) * width))
+        top = max(0, int((ymin - padY) * height))
+        right = min(width, int((xmax + padX) * width) + 1)
+        bottom = min(height, int((ymax + padY) * height) + 1)
+        if right - left < MIN_ROI_SIZE or bottom - top < MIN_ROI_SIZE:
+            return None
+
+        # BGR planes to luma, this copies the ROI out of the bus
+        roi = planar[:, top:bottom, left:right].astype(np.float32)
+        gray = (0.114 * roi[0] + 0.587 * roi[1] + 0.299 * roi[2]).astype(np.uint8)
+        if not self.bus.isValid(sequence):
+            # The frame was overwritten while copying it
+            return None
+
+        centroid = brightCentroid(gray)
+        if centroid is None:
+            return None
+        center = PixelCoords((left + centroid[0]) / width, (top + centroid[1]) / height)
+
+        # The refinement has to agree with the NN about where the pad is
+        if not (xmin <= center.x <= xmax and ymin <= center.y <= ymax):
+            return None
+
+        offset = PixelCoords(center.x - (xmin + xmax) / 2, center.y - (ymin + ymax) / 2)
+        if self.undistortion is not None:
+            center = self.undistortion.correct(center)
+        return Refinement(detection.sequence, center, offset)
+
+    def run(self) -> None:
+        while True:
+            with self.condition:
+                while self.pending is None and self.running:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                detection = self.pending
+                self.pending = None
+
+            refinement = self.refine(detection) # type: ignore
+            if refinement is not None:
+                with self.condition:
+                    self.result = refinement
+
+    def stop(self) -> None:
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.worker.join()
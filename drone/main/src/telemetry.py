@@ -0,0 +1,118 @@
+"""
+Telemetry rates per state of the landing machine. The autopilot streams at
+its default rates over the serial link, which leaves the rangefinder lagging
+far behind the tick while guiding. When a state with a profile in
+TELEMETRY_PROFILES is entered, every message of the profile is asked for at
+its rate with MAV_CMD_SET_MESSAGE_INTERVAL. States without a profile, like
+Idle, get the defaults back. ArduPilot applies intervals to the link they came
+in on, so a GCS on the telemetry radio keeps its rates.
+
+The receive rates of the raised messages are measured, and logged.
+"""
+
+from __future__ import annotations
+from pymavlink import mavutil
+from typing import Any, Dict
+import logging
+import time
+
+from constants import TELEMETRY_PROFILES, TELEMETRY_LOG_INTERVAL
+
+mavlink = mavutil.mavlink
+
+def intervalOf(rate: float | None) -> float:
+    """
+    The SET_MESSAGE_INTERVAL interval of a rate in Hz: -1 stops the stream,
+    and 0 gives back the default rate.
+    """
+    if rate is None:
+        return 0
+    if rate <= 0:
+        return -1
+    return 1.0e6 / rate
+
+class TelemetryRates:
+    vehicle: Any
+    # The profile in effect, by message type
+    profile: Dict[str, float]
+    counts: Dict[str, int]
+    sinceMeasure: float
+    sinceLog: float
+
+    def __init__(self, vehicle: Any) -> None:
+        """
+        `vehicle` is a MavVehicle or a dronekit Vehicle.
+        """
+        self.vehicle = vehicle
+        self.profile = {}
+        self.counts = {}
+        self.sinceMeasure = time.monotonic()
+        self.sinceLog = time.monotonic()
+
+    def count(self, vehicle: Any, msgType: str, msg: Any) -> None:
+        # Called on the thread of the vehicle
+        self.counts[msgType] = self.counts.get(msgType, 0) + 1
+
+    def request(self, msgType: str, rate: float | None) -> None:
+        msg = self.vehicle.message_factory.command_long_encode(
+            0, 0,    # target system, target component
+            mavlink.MAV_CMD_SET_MESSAGE_INTERVAL,
+            0,
+            getattr(mavlink, "MAVLINK_MSG_ID_" + msgType), # param 1, the message id
+            intervalOf(rate), # param 2, the interval in us
+            0, 0, 0, 0, 0)
+        self.vehicle.send_mavlink(msg)
+
+    def apply(self, profile: Dict[str, float]) -> None:
+        """
+        Asks for the rates of `profile`, and the defaults of the messages of
+        the last profile which aren't in it.
+        """
+        for msgType in self.profile:
+            if msgType not in profile:
+                self.request(msgType, None)
+                if self.profile[msgType] > 0:
+                    self.vehicle.remove_message_listener(msgType, self.count)
+        for (msgType, rate) in profile.items():
+            self.request(msgType, rate)
+            if rate > 0 and self.profile.get(msgType, 0) <= 0:
+                self.vehicle.add_message_listener(msgType, self.count)
+        self.profile = dict(profile)
+        self.measure()
+
+    def measure(self) -> Dict[str, float]:
+        """
+        The receive rates of the raised messages since the last measurement.
+        """
+        now = time.monotonic()
+        elapsed = max(now - self.sinceMeasure, 1e-6)
+        (counts, self.counts) = (self.counts, {})
+        self.sinceMeasure = now
+        return {
+            msgType: counts.get(msgType, 0) / elapsed
+            for (msgType, rate) in self.profile.items() if rate > 0
+        }
+
+    def update(self, stateName: str) -> None:
+        """
+        Called every tick with the name of the current state.
+        """
+        profile = TELEMETRY_PROFILES.get(stateName, {})
+        if profile != self.profile:
+            logging.info("Telemetry profile for " + stateName + ": " + str(profile if len(profile) > 0 else "defaults"))
+            self.apply(profile)
+            self.sinceLog = time.monotonic()
+            return
+
+        if len(self.profile) == 0 or time.monotonic() - self.sinceLog < TELEMETRY_LOG_INTERVAL:
+            return
+        self.sinceLog = time.monotonic()
+        measured = self.measure()
+        logging.info("Telemetry rates: " + ", ".join(
+            "{} {:.1f}/{:.0f} Hz".format(msgType, rate, self.profile[msgType]) for (msgType, rate) in measured.items()
+        ))
+        for (msgType, rate) in measured.items():
+            # A command lost on the serial link, or a message this autopilot
+            # doesn't send. Asking again costs nothing.
+            if rate < self.profile[msgType] / 2:
+                self.request(msgType, self.profile[msgType])
@@ -1,8 +1,7 @@
 import compute
 from compute import LocationDetection
-from optics import PixelCoords
+from core import PadType, PixelCoords
 from dronekit import LocationGlobal
-from optics import PadType
 
 def test_relativeDistance():
     assert compute.relativeDistance(100, PixelCoords(0.5, 0.5), 0) == (0.0, 0.0)
@@ -38,4 +37,20 @@ def test_conductor():
 
     assert len(mock.detections) == 3
     assert mock.get_best_guess(PadType.smoresDropoff).confidence == 0.9
-    assert mock.get_best_guess(PadType.medkitDropoff).confidence == 0.6
\ No newline at end of file
+    assert mock.get_best_guess(PadType.medkitDropoff).confidence == 0.6
+
+def test_conductor_tracks():
+    mock = compute.Conductor()
+    mock.add_detections([
+        LocationDetection(PadType.bottlePickup, LocationGlobal(20, -30, 0), 0.5, 3)
+    ])
+    # The same track is blobbed, even if it drifted further than the blobbing distance
+    mock.add_detections([
+        LocationDetection(PadType.bottlePickup, LocationGlobal(21, -31, 0), 0.5, 3),
+        LocationDetection(PadType.bottlePickup, LocationGlobal(21, -31, 0), 0.5, 4)
+    ])
+
+    assert len(mock.detections) == 2
+    assert mock.tracks[3].confidence == 1.0
+    assert mock.tracks[3].location.lat == 20.5
+    assert mock.tracks[4] is not mock.tracks[3]
@@ -0,0 +1,100 @@
+from dronekit import LocationGlobal
+from control import ControlLoop, PID, METRES_PER_DEGREE
+from constants import CONTROL_KEEPALIVE_RATE, CONTROL_MAX_SEND_RATE, CONTROL_TARGET_TIMEOUT
+import time
+
+class FakeLocations:
+    def __init__(self) -> None:
+        self.global_frame = LocationGlobal(0.0, 0.0, 10.0)
+
+class FakeVehicle:
+    def __init__(self) -> None:
+        self.location = FakeLocations()
+        # NED, unknown until GLOBAL_POSITION_INT comes in
+        self.velocity = [None, None, None]
+
+def test_antiWindup():
+    pid = PID(1.0, 0.5, 0.0, 0.2, 1.0)
+    # Far off, the output saturates and the integral doesn't wind up
+    for _ in range(100):
+        assert pid.update(10.0, 0.0, 0.1) == 1.0
+    assert pid.integral == 0.0
+
+    # Close by, it integrates, up to its limit
+    for _ in range(1000):
+        pid.update(0.5, 0.0, 0.1)
+    assert abs(pid.ki * pid.integral - 0.2) < 1e-9
+
+def test_noDerivativeKick():
+    pid = PID(0.0, 0.0, 1.0, 0.0, 10.0)
+    pid.update(0.0, 0.0, 0.1)
+    # A new setpoint doesn't move the measurement
+    assert pid.update(5.0, 0.0, 0.1) == 0.0
+    assert pid.update(5.0, 0.1, 0.1) < 0.0
+
+def test_controlLoop():
+    vehicle = FakeVehicle()
+    sent = []
+    control = ControlLoop(vehicle, lambda n, e, d: sent.append((n, e, d)), 50)
+    control.engage()
+    target = LocationGlobal(3.0 / METRES_PER_DEGREE, 0.0, 10.0)
+    control.command(target, 0.3, 0.8)
+
+    # Fly the velocities at 50 Hz, the target keeps being estimated
+    north = 0.0
+    highest = 0.0
+    start = time.monotonic()
+    for i in range(1500):
+        now = start + i * 0.02
+        control.target = (target, 0.3, 0.8, now)
+        (vNorth, vEast, vDown) = control.step(now, 0.02)
+        assert abs(vNorth) <= 0.8 and vEast == 0.0 and vDown == 0.3
+        north += vNorth * 0.02
+        highest = max(highest, north)
+        vehicle.location.global_frame = LocationGlobal(north / METRES_PER_DEGREE, 0.0, 10.0)
+        control.maybeSend((vNorth, vEast, vDown), now)
+    assert abs(north - 3.0) < 0.05
+    assert highest < 3.15
+    # Not every step was sent
+    assert 0 < len(sent) < 300
+
+    # An old estimate isn't steered to
+    later = start + 30.0 + CONTROL_TARGET_TIMEOUT
+    assert control.step(later, 0.02) == (0.0, 0.0, 0.3)
+
+def test_controlLoopSlowPosition():
+    vehicle = FakeVehicle()
+    sent = []
+    control = ControlLoop(vehicle, lambda n, e, d: sent.append((n, e, d)), 50)
+    control.engage()
+    target = LocationGlobal(3.0 / METRES_PER_DEGREE, 0.0, 10.0)
+
+    # Steps at 50 Hz, but the position and velocity come in at 20 Hz
+    north = 0.0
+    vNorth = 0.0
+    start = time.monotonic()
+    lastSample = -1
+    setpoints = []
+    for i in range(1500):
+        now = start + i * 0.02
+        sample = int(i * 0.02 * 20)
+        if sample != lastSample:
+            vehicle.location.global_frame = LocationGlobal(north / METRES_PER_DEGREE, 0.0, 10.0)
+            vehicle.velocity = [vNorth, 0.0, 0.0]
+            lastSample = sample
+        control.target = (target, 0.0, 0.8, now)
+        (vNorth, _, _) = control.step(now, 0.02)
+        setpoints.append(vNorth)
+        north += vNorth * 0.02
+        control.maybeSend((vNorth, 0.0, 0.0), now)
+    assert abs(north - 3.0) < 0.05
+    # The setpoints don't jump around between position samples
+    assert max(abs(a - b) for (a, b) in zip(setpoints[200:], setpoints[201:])) < 0.05
+    assert len(sent) < CONTROL_MAX_SEND_RATE * 30 / 4
+
+def test_keepalive():
+    control = ControlLoop(FakeVehicle(), lambda n, e, d: None, 50)
+    start = 1000.0
+    sends = sum(control.maybeSend((0.5, 0.0, 0.0), start + i * 0.02) for i in range(50))
+    # A steady setpoint is only sent to keep it alive
+    assert sends == CONTROL_KEEPALIVE_RATE
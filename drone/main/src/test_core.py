@@ -0,0 +1,32 @@
+from pathlib import Path
+import subprocess
+import sys
+
+from core import PixelDetection, PixelCoords, PadType, individualDist
+from dronekit import LocationGlobal
+import compute
+
+# What the light modules must not load when imported
+HEAVY = ["depthai", "dronekit", "pymavlink", "cv2", "numpy", "openvino"]
+
+def test_importLight():
+    # A fresh interpreter, this one has imported everything already
+    code = "import sys, core, compute, predict, landing, exposure; print(*[m for m in {} if m in sys.modules])".format(HEAVY)
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=Path(__file__).resolve().parent, capture_output=True, text=True, check=True
+    )
+    assert output.stdout.split() == []
+
+def test_coreTypes():
+    # The types are shared, whether they came from core or from optics
+    detection = PixelDetection(PadType.padCenter, PixelCoords(0.5, 0.5), 0.9)
+    assert compute.PixelDetection is PixelDetection
+    assert detection.normalizedCoords.x == 0.5
+
+def test_individualDist():
+    a = LocationGlobal(20.0, -30.0, 0.0)
+    b = LocationGlobal(20.001, -30.002, 0.0)
+    (dLat, dLon) = individualDist(a, b)
+    assert abs(dLat - compute.dist(LocationGlobal(20.0, 0.0, 0.0), LocationGlobal(20.001, 0.0, 0.0))) < 1e-6
+    assert abs(dLon - compute.dist(LocationGlobal(0.0, -30.0, 0.0), LocationGlobal(0.0, -30.002, 0.0))) < 1e-6
@@ -0,0 +1,155 @@
+from pathlib import Path
+import shutil
+import time
+import cv2 # type: ignore
+import numpy as np
+import openvino as ov # type: ignore
+import openvino.opset13 as ops # type: ignore
+import pytest
+
+from cpu_optics import CpuDetector, CpuEye, decodeYolo, nms, preprocess, intoPixelDetections
+from models import ModelSpec
+from core import PadType
+
+RESULTS = Path(__file__).resolve().parents[2].joinpath("eye", "ML", "results")
+TRAINING_IMAGES = Path(__file__).resolve().parents[2].joinpath("eye", "edge_algorithms")
+SHIPPED = RESULTS.joinpath("conversion_result_27")
+
+def shippedModel() -> ModelSpec:
+    return ModelSpec.load(SHIPPED).unwrap()
+
+def heads(model: ModelSpec) -> list:
+    """
+    The sigmoided heads of one image, holding a pad center in the middle of the
+    frame, a weaker duplicate of it, and a bottle dropoff on top of them.
+    """
+    outputs = {}
+    for (name, mask) in model.anchorMasks.items():
+        side = int(name[len("side"):])
+        outputs[side] = np.zeros((len(mask), 5 + model.numClasses, side, side), np.float32)
+
+    grid = outputs[13]
+    center = 6
+    # A 116x90 box (the first side13 anchor) centred on 208, 208
+    for (anchor, objectness, label) in [(0, 0.9, 6), (1, 0.8, 6), (2, 0.7, 0)]:
+        grid[anchor, 0:4, center, center] = 0.5
+        grid[anchor, 4, center, center] = objectness
+        grid[anchor, 5 + label, center, center] = 1.0
+    # The second anchor is 156x198, shrunk to the same box as the first
+    grid[1, 2, center, center] = 0.5 * np.sqrt(116 / 156)
+    grid[1, 3, center, center] = 0.5 * np.sqrt(90 / 198)
+
+    return [outputs[side].reshape(-1, side, side) for side in sorted(outputs, reverse=True)]
+
+def syntheticIR(model: ModelSpec, directory: Path) -> ModelSpec:
+    """
+    Saves an IR with the inputs and outputs of the shipped model, which returns
+    `heads` scaled by the brightest pixel of the frame, so black frames hold
+    nothing. The shipped exports don't come with their weights.
+    """
+    images = ops.parameter([1, 3, model.inputSize[1], model.inputSize[0]], np.float32, name="images")
+    level = ops.divide(ops.reduce_max(images, [1, 2, 3], keep_dims=True), ops.constant(np.float32(255.0)))
+    results = [ops.multiply(ops.constant(head[None]), level) for head in heads(model)]
+    ov.save_model(ov.Model(results, [images], "best"), str(directory.joinpath("best.xml")), compress_to_fp16=False)
+    shutil.copy(SHIPPED.joinpath("best.json"), directory.joinpath("best.json"))
+    return ModelSpec.load(directory).unwrap()
+
+def test_preprocess():
+    frame = np.zeros((240, 320, 3), np.uint8)
+    # Blue on the left half, red on the right
+    frame[:, :160, 0] = 255
+    frame[:, 160:, 2] = 255
+
+    planar = preprocess(frame, (416, 208))
+    assert planar.shape == (3, 208, 416)
+    assert planar.dtype == np.float32
+    # Not scaled, the model does that
+    assert planar[0, 100, 10] == 255.0 and planar[2, 100, 10] == 0.0
+    assert planar[0, 100, 400] == 0.0 and planar[2, 100, 400] == 255.0
+
+def test_decodeYolo():
+    model = shippedModel()
+    (boxes, scores, labels) = decodeYolo(heads(model), model)
+    assert len(boxes) == 3
+    best = scores.argmax()
+    assert labels[best] == 6
+    assert scores[best] == pytest.approx(0.9)
+    assert boxes[best] == pytest.approx([(208 - 58) / 416, (208 - 45) / 416, (208 + 58) / 416, (208 + 45) / 416])
+
+    # Only the pad center clears a higher threshold
+    (boxes, scores, labels) = decodeYolo(heads(model), model, 0.85)
+    assert list(labels) == [6]
+
+    (boxes, scores, labels) = decodeYolo([np.zeros_like(head) for head in heads(model)], model)
+    assert boxes.shape == (0, 4) and len(scores) == 0 and len(labels) == 0
+
+def test_nms():
+    boxes = np.array([
+        [0.1, 0.1, 0.5, 0.5],
+        [0.12, 0.1, 0.52, 0.5],
+        [0.1, 0.1, 0.5, 0.5],
+        [0.6, 0.6, 0.9, 0.9]
+    ], np.float32)
+    scores = np.array([0.6, 0.9, 0.7, 0.5], np.float32)
+    labels = np.array([6, 6, 0, 6])
+
+    # The first box overlaps the best one of its class, the third has its own class
+    assert list(nms(boxes, scores, labels, 0.5)) == [1, 2, 3]
+    assert list(nms(boxes, scores, labels, 0.95)) == [1, 2, 0, 3]
+
+def test_intoPixelDetections():
+    model = shippedModel()
+    detections = intoPixelDetections(*decodeYolo(heads(model), model), model)
+    # The duplicate pad center is suppressed, the bottle dropoff is another class
+    assert [d.padType for d in detections] == [PadType.padCenter, PadType.bottleDropoff]
+    assert detections[0].confidence == pytest.approx(0.9)
+    assert detections[0].normalizedCoords.x == pytest.approx(0.5)
+    assert detections[0].normalizedCoords.y == pytest.approx(0.5)
+    assert detections[0].bbox == pytest.approx(((208 - 58) / 416, (208 - 45) / 416, (208 + 58) / 416, (208 + 45) / 416))
+
+def test_cpuDetector(tmp_path: Path):
+    model = syntheticIR(shippedModel(), tmp_path)
+    white = np.full((300, 400, 3), 255, np.uint8)
+    black = np.zeros((300, 400, 3), np.uint8)
+
+    for batchSize in [1, 2]:
+        detector = CpuDetector(model, batchSize)
+        results = detector.detect([white, black, white])
+        assert [len(detections) for detections in results] == [2, 0, 2]
+        assert results[2][0].padType == PadType.padCenter
+        assert results[2][0].normalizedCoords.x == pytest.approx(0.5)
+
+def test_cpuEye(tmp_path: Path):
+    directory = tmp_path.joinpath("model")
+    directory.mkdir()
+    model = syntheticIR(shippedModel(), directory)
+    frames = tmp_path.joinpath("frames")
+    frames.mkdir()
+    for i in range(3):
+        cv2.imwrite(str(frames.joinpath(str(i) + ".png")), np.full((300, 400, 3), 255, np.uint8))
+
+    eye = CpuEye.new(model, frames, fps=None).unwrap()
+    deadline = time.monotonic() + 10
+    latest = None
+    while latest is None and time.monotonic() < deadline:
+        latest = eye.tick().unwrap()
+        time.sleep(0.01)
+    eye.close()
+
+    assert latest is not None
+    assert PadType.padCenter in [d.padType for d in latest]
+    assert eye.latest is latest
+
+def test_missingSource(tmp_path: Path):
+    assert CpuEye.new(shippedModel(), tmp_path.joinpath("missing")).err() is not None
+
+@pytest.mark.skipif(not SHIPPED.joinpath("best.bin").exists(), reason="the weights of the shipped model aren't checked in")
+def test_shippedModel():
+    detector = CpuDetector(shippedModel())
+    frames = [cv2.imread(str(path), cv2.IMREAD_COLOR) for path in sorted(TRAINING_IMAGES.glob("train*.png"))]
+    for detections in detector.detect(frames):
+        for detection in detections:
+            assert detection.padType in detector.model.labels
+            assert 0.0 <= detection.normalizedCoords.x <= 1.0
+            assert 0.0 <= detection.normalizedCoords.y <= 1.0
+            assert detection.confidence >= detector.model.confidenceThreshold
@@ -0,0 +1,34 @@
+from pathlib import Path
+from exposure import ExposureProfile, lightingCondition, loadProfiles, saveProfiles, selectProfile, scoreFrames
+from optics import PadType, PixelCoords, PixelDetection
+
+def test_lightingCondition():
+    assert lightingCondition(100, 100) == "sunny"
+    assert lightingCondition(1000, 400) == "overcast"
+    assert lightingCondition(4000, 400) == "dim"
+    assert lightingCondition(33000, 1600) == "dark"
+
+def test_profiles(tmp_path: Path):
+    assert loadProfiles(tmp_path.joinpath("missing.json")).err() is not None
+
+    path = tmp_path.joinpath("profiles.json")
+    saveProfiles(path, {
+        "sunny": ExposureProfile("sunny", 250, 100, None, 1.5),
+        "dim": ExposureProfile("dim", 4000, 400, 5500, 0.8)
+    })
+    profiles = loadProfiles(path).unwrap()
+    assert profiles["dim"].exposure == 4000 and profiles["dim"].whiteBalance == 5500
+    assert profiles["sunny"].whiteBalance is None
+
+    assert selectProfile(profiles, "sunny") is profiles["sunny"]
+    # The closest searched condition stands in for the others
+    assert selectProfile(profiles, "bright") is profiles["sunny"]
+    assert selectProfile(profiles, "dark") is profiles["dim"]
+    assert selectProfile({}, "dark") is None
+
+def test_scoreFrames():
+    pad = PixelDetection(PadType.medkitPickup, PixelCoords(0.5, 0.5), 0.8)
+    center = PixelDetection(PadType.padCenter, PixelCoords(0.5, 0.5), 0.6)
+    assert scoreFrames([]) == 0.0
+    assert abs(scoreFrames([[pad, center], []]) - 0.7) < 1e-9
+    assert scoreFrames([[pad, center]]) > scoreFrames([[pad]])
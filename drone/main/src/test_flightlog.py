@@ -0,0 +1,85 @@
+from pathlib import Path
+import gzip
+import logging
+import time
+
+from flightlog import FlightLog, Housekeeper, claimFlight, housekeep, COUNTER_FILE
+
+def test_claimFlight(tmp_path: Path):
+    assert claimFlight(tmp_path).name == "0"
+    assert claimFlight(tmp_path).name == "1"
+    assert (tmp_path / COUNTER_FILE).read_text() == "2"
+
+    # A flight that made its directory but never counted it
+    (tmp_path / "2").mkdir()
+    assert claimFlight(tmp_path).name == "3"
+
+def test_claimFlightWithoutCounter(tmp_path: Path):
+    # Logs from before the counter
+    for flightId in (0, 1, 7):
+        (tmp_path / str(flightId)).mkdir()
+    assert claimFlight(tmp_path).name == "8"
+
+def test_housekeep(tmp_path: Path):
+    for flightId in range(5):
+        flight = tmp_path / str(flightId)
+        flight.mkdir()
+        (flight / "venus.log").write_text("takeoff\n" * 1000)
+        (flight / "camera.h265").write_bytes(bytes(10000))
+    current = tmp_path / "5"
+    current.mkdir()
+    (current / "venus.log").write_text("takeoff\n")
+
+    housekeep(tmp_path, current, 4, 1000000)
+    # The oldest go first, the current one is never touched
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["2", "3", "4", "5"]
+    assert (current / "venus.log").exists()
+    with gzip.open(tmp_path / "4" / "venus.log.gz", "rt") as log:
+        assert log.read() == "takeoff\n" * 1000
+    assert not (tmp_path / "4" / "venus.log").exists()
+
+    # Over the size, compressed logs are tiny but the tapes aren't
+    housekeep(tmp_path, current, 10, 25000)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["3", "4", "5"]
+
+def test_housekeepCurrent(tmp_path: Path):
+    for flightId in range(3):
+        flight = tmp_path / str(flightId)
+        flight.mkdir()
+        (flight / "camera.h265").write_bytes(bytes(10000))
+    current = tmp_path / "3"
+    current.mkdir()
+    housekeeper = Housekeeper(tmp_path, current, 10, 35000)
+    housekeeper.scan()
+    housekeeper.prune()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["0", "1", "2", "3"]
+
+    # The tape of the current flight grows past the budget mid flight
+    (current / "camera.h265").write_bytes(bytes(15000))
+    housekeeper.prune()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["1", "2", "3"]
+
+def test_flightLog(tmp_path: Path):
+    flightLog = FlightLog.start(tmp_path).unwrap()
+    try:
+        fileHandler = flightLog.listener.handlers[0]
+        # The file is stuck, logging still returns right away
+        fileHandler.acquire()
+        try:
+            start = time.monotonic()
+            for i in range(1000):
+                logging.info("Tick %s", i)
+            assert time.monotonic() - start < 1.0
+        finally:
+            fileHandler.release()
+    finally:
+        flightLog.stop()
+
+    log = (flightLog.directory / "venus.log").read_text()
+    assert "Tick 0" in log and "Tick 999" in log
+    nextFlight = FlightLog.start(tmp_path, checkInterval=0.01).unwrap()
+    time.sleep(0.1)
+    nextFlight.stop()
+    assert nextFlight.directory.name == "1"
+    # The housekeeping ends with the flight log
+    assert not nextFlight.housekeeping.is_alive()
@@ -0,0 +1,27 @@
+import numpy as np
+from multiprocessing import shared_memory
+from framebus import FrameBus
+
+def test_publish_and_read():
+    bus = FrameBus.create("venus-test-bus", (3, 4, 4), slots=2)
+    # `FrameBus.attach` is meant for other processes, it would untrack the bus for this one too
+    reader = FrameBus(shared_memory.SharedMemory("venus-test-bus"), False)
+    try:
+        assert reader.latest() is None
+
+        seq = bus.publish(np.full(48, 7, np.uint8), 1.5, 100)
+        latest = reader.latest()
+        assert latest is not None
+        assert latest[0] == seq and latest[1] == 1.5
+        assert latest[2].shape == (3, 4, 4) and (latest[2] == 7).all()
+
+        # The reader sees the writer's memory, not a copy
+        view = latest[2]
+        bus.publish(np.full(48, 8, np.uint8), 2.0)
+        bus.publish(np.full(48, 9, np.uint8), 2.5)
+        assert not reader.isValid(seq)
+        assert reader.read(seq) is None
+        assert (view == 9).all()
+    finally:
+        reader.close()
+        bus.close()
@@ -0,0 +1,313 @@
+from dronekit import LocationGlobal, LocationGlobalRelative, VehicleMode
+from dronekit import Attitude, Rangefinder
+from poltergeist import Ok
+from pymavlink import mavutil
+from landing import Landing, Idle, Align, Touchdown, Land, Disarmed, Rearm, Resume
+from control import ControlLoop
+from core import Conductor, PadType, PixelCoords, PixelDetection
+import gc
+import time
+import tracemalloc
+
+# The bytes a tick may allocate, freed or not. Ticks without a new NN result,
+# most of them, allocate nothing.
+TICK_CHURN_BUDGET = 0
+# Touchdown iterates over the detections to find the pad center
+DETECTION_CHURN_BUDGET = 64
+# A result steered to by the control loop is handed to its thread as a new
+# LocationGlobal, which the thread holds on to, so it can't be reused
+CONTROL_CHURN_BUDGET = DETECTION_CHURN_BUDGET + 128
+
+class FakeCommand:
+    def __init__(self, command: int, z: float) -> None:
+        self.command = command
+        self.z = z
+
+class FakeLocations:
+    def __init__(self) -> None:
+        self.global_relative_frame = LocationGlobalRelative(20, -30, 15)
+
+class FakeMission:
+    def __init__(self) -> None:
+        self.next = 2
+        self.items = [FakeCommand(16, 10), FakeCommand(92, 3)]
+
+    def __getitem__(self, index: int) -> FakeCommand:
+        return self.items[index]
+
+class FakeVehicle:
+    """
+    Every read of its state fails, the machine has to go by the listeners.
+    """
+
+    def __init__(self) -> None:
+        self.armed = True
+        self.mode = VehicleMode("AUTO")
+        self.location = FakeLocations()
+        self.commands = FakeMission()
+        self.attributeListeners = {}
+        self.messageListeners = {}
+        self.is_armable = False
+        self.armRequests = 0
+        self.message_factory = mavutil.mavlink.MAVLink(None)
+        self.sent = []
+
+    def arm(self, wait=True, timeout=None) -> None:
+        assert not wait
+        self.armRequests += 1
+
+    def send_mavlink(self, msg) -> None:
+        self.sent.append(msg)
+
+    def add_attribute_listener(self, name, listener) -> None:
+        self.attributeListeners[name] = listener
+
+    def add_message_listener(self, name, listener) -> None:
+        self.messageListeners[name] = listener
+
+    def notify(self, name, value) -> None:
+        self.attributeListeners[name](self, name, value)
+
+    def forget(self) -> None:
+        del self.armed, self.mode, self.location
+
+def test_idleFromListeners():
+    vehicle = FakeVehicle()
+    machine = Landing(None, vehicle) # type: ignore
+    vehicle.forget()
+
+    resolve = machine.tick().unwrap()
+    assert resolve.transitionAvailable
+    assert resolve.padType == PadType.medkitPickup
+
+    # Below the flight altitude, nothing happens
+    vehicle.notify("location.global_relative_frame", LocationGlobalRelative(20, -30, 0.1))
+    assert not machine.tick().unwrap().transitionAvailable
+    assert not machine.wake.is_set()
+
+def test_killFromListeners():
+    vehicle = FakeVehicle()
+    machine = Landing(None, vehicle) # type: ignore
+    machine.state = Touchdown(vehicle, None, 2)
+    assert not machine.handleEvents()
+
+    vehicle.notify("mode", VehicleMode("LOITER"))
+    # The main loop is woken right away
+    assert machine.wake.is_set()
+    assert machine.handleEvents()
+    assert isinstance(machine.state, Idle)
+
+    vehicle.notify("mode", VehicleMode("AUTO"))
+    machine.state = Touchdown(vehicle, None, 2)
+    vehicle.notify("armed", False)
+    assert machine.handleEvents()
+    assert isinstance(machine.state, Idle)
+
+def test_afterTouchdown():
+    vehicle = FakeVehicle()
+    machine = Landing(None, vehicle) # type: ignore
+    machine.state = Touchdown(vehicle, None, 2)
+    machine.transition()
+    assert isinstance(machine.state, Land)
+
+    # Nothing blocks, every state waits for its event over ticks
+    assert not machine.tick().unwrap().transitionAvailable
+    assert vehicle.mode.name == "LAND"
+    vehicle.notify("mode", VehicleMode("LAND"))
+    vehicle.notify("armed", False)
+    # Disarmed in LAND is expected here, it isn't a kill
+    assert not machine.handleEvents()
+    assert machine.tick().unwrap().transitionAvailable
+    machine.transition()
+    assert isinstance(machine.state, Disarmed)
+
+    assert not machine.tick().unwrap().transitionAvailable
+    assert vehicle.mode.name == "LOITER"
+    vehicle.is_armable = True
+    assert not machine.tick().unwrap().transitionAvailable
+    machine.state.sinceArmable -= 10
+    # Not until the vehicle reports LOITER
+    assert not machine.tick().unwrap().transitionAvailable
+    vehicle.notify("mode", VehicleMode("LOITER"))
+    assert not machine.handleEvents()
+    assert machine.tick().unwrap().transitionAvailable
+    machine.transition()
+    assert isinstance(machine.state, Rearm)
+
+    assert not machine.tick().unwrap().transitionAvailable
+    assert not machine.tick().unwrap().transitionAvailable
+    assert vehicle.armRequests == 1
+    vehicle.notify("armed", True)
+    assert machine.tick().unwrap().transitionAvailable
+    machine.transition()
+    assert isinstance(machine.state, Resume)
+
+    assert not machine.tick().unwrap().transitionAvailable
+    assert vehicle.mode.name == "AUTO"
+    assert vehicle.sent[0].command == mavutil.mavlink.MAV_CMD_MISSION_START
+    assert vehicle.commands.next == 3
+    vehicle.notify("mode", VehicleMode("AUTO"))
+    assert machine.tick().unwrap().transitionAvailable
+    machine.transition()
+    assert isinstance(machine.state, Idle)
+
+def test_afterTouchdownModeRetry():
+    vehicle = FakeVehicle()
+    machine = Landing(None, vehicle) # type: ignore
+    machine.state = Land(vehicle, machine.status, 2)
+    machine.tick().unwrap()
+    assert vehicle.mode.name == "LAND"
+    # The mode change was lost, it's asked for again after a while
+    vehicle.mode = VehicleMode("GUIDED")
+    machine.tick().unwrap()
+    assert vehicle.mode.name == "GUIDED"
+    machine.state.sinceMode -= 10
+    machine.tick().unwrap()
+    assert vehicle.mode.name == "LAND"
+
+def test_afterTouchdownTakeover():
+    vehicle = FakeVehicle()
+    machine = Landing(None, vehicle) # type: ignore
+    vehicle.notify("armed", False)
+    vehicle.notify("mode", VehicleMode("LOITER"))
+    machine.state = Rearm(vehicle, machine.status, 2)
+    assert not machine.handleEvents()
+    # The pilot switching modes on the ground stops the rearm
+    vehicle.notify("mode", VehicleMode("STABILIZE"))
+    assert machine.handleEvents()
+    assert isinstance(machine.state, Idle)
+
+    vehicle.notify("armed", True)
+    vehicle.notify("mode", VehicleMode("LOITER"))
+    machine.state = Resume(vehicle, machine.status, 2)
+    assert not machine.handleEvents()
+    vehicle.notify("mode", VehicleMode("AUTO"))
+    assert not machine.handleEvents()
+    vehicle.notify("mode", VehicleMode("GUIDED"))
+    assert machine.handleEvents()
+    assert isinstance(machine.state, Idle)
+
+def test_afterTouchdownTimeout():
+    vehicle = FakeVehicle()
+    machine = Landing(None, vehicle) # type: ignore
+    machine.state = Rearm(vehicle, machine.status, 2)
+    vehicle.notify("armed", False)
+    machine.tick().unwrap()
+    # A stuck arm gives up instead of hanging
+    machine.state.sinceEnter -= 60
+    assert isinstance(machine.tick().err(), TimeoutError)
+    assert isinstance(machine.state, Idle)
+
+class FakeEye:
+    """
+    Between NN results, which is most ticks.
+    """
+
+    # The Eye's own allocations aren't the landing code's
+    nothing = Ok(None)
+
+    def tick(self):
+        return self.nothing
+
+class FakeDetectingEye:
+    """
+    Sees the pad center at `coords` on every tick.
+    """
+
+    def __init__(self, coords: PixelCoords) -> None:
+        self.detections = Ok([PixelDetection(PadType.padCenter, coords, 0.9)])
+
+    def tick(self):
+        return self.detections
+
+def overPad(vehicle: FakeVehicle) -> None:
+    vehicle.rangefinder = Rangefinder(1.5, None)
+    vehicle.attitude = Attitude(0.0, 0.0, 0.0)
+    vehicle.velocity = [0.0, 0.0, 0.0]
+    vehicle.location.global_frame = LocationGlobal(20, -30, 101.5)
+    vehicle.location.global_relative_frame = LocationGlobalRelative(20, -30, 1.5)
+
+def steeredNorthEast(state, control: ControlLoop | None) -> tuple:
+    """
+    The (north, east) velocity a state steers at, through the control loop
+    or resolved straight from the tick.
+    """
+    resolve = state.tick().unwrap()
+    if control is None:
+        return (resolve.velocity[0], resolve.velocity[1])
+    (north, east, _) = control.step(time.monotonic(), 0.02)
+    return (north, east)
+
+def test_steeringAxes():
+    # The pad is seen to the right of the frame, which is east at yaw 0
+    for coords in (PixelCoords(0.9, 0.5), PixelCoords(0.5, 0.1)):
+        directions = []
+        for makeState in (
+                lambda vehicle, eye, control: Align(vehicle, eye, Conductor(), 2, control),
+                lambda vehicle, eye, control: Touchdown(vehicle, eye, 2, control=control)):
+            for useControl in (False, True):
+                vehicle = FakeVehicle()
+                overPad(vehicle)
+                control = None
+                if useControl:
+                    control = ControlLoop(vehicle, lambda n, e, d: None, 50)
+                    control.engage()
+                (north, east) = steeredNorthEast(makeState(vehicle, FakeDetectingEye(coords), control), control)
+                directions.append((round(north, 3) > 0, round(east, 3) > 0, round(north, 3) == 0, round(east, 3) == 0))
+        # Both paths of both states fly the same way
+        assert len(set(directions)) == 1
+        if coords.x > 0.5:
+            assert directions[0] == (False, True, True, False)
+        else:
+            # Up in the frame is north
+            assert directions[0] == (True, False, False, True)
+
+def tickChurn(tick, n: int) -> float:
+    """
+    The bytes a tick allocates, on average over `n` ticks. Every tick is
+    measured by the peak above what was allocated before it, so objects that
+    are freed before the tick returns count too. Small tuples and floats come
+    from Python's free lists and aren't allocated.
+    """
+    for _ in range(10):
+        tick()
+    gc.disable()
+    tracemalloc.start()
+    total = 0
+    try:
+        for _ in range(n):
+            (before, _) = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            tick()
+            total += tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+        gc.enable()
+    return total / n
+
+def test_tickAllocations():
+    vehicle = FakeVehicle()
+    machine = Landing(None, vehicle) # type: ignore
+    # On the ground, Idle resolves nothing
+    vehicle.notify("location.global_relative_frame", LocationGlobalRelative(20, -30, 0.1))
+    assert tickChurn(machine.tick, 1000) <= TICK_CHURN_BUDGET
+
+    overPad(vehicle)
+    seen = FakeDetectingEye(PixelCoords(0.9, 0.5))
+    for useControl in (False, True):
+        control = None
+        if useControl:
+            control = ControlLoop(vehicle, lambda n, e, d: None, 50)
+            control.engage()
+        # Between results Align hovers and Touchdown sinks
+        machine.state = Align(vehicle, FakeEye(), Conductor(), 2, control)
+        assert tickChurn(machine.tick, 1000) <= TICK_CHURN_BUDGET
+        machine.state = Touchdown(vehicle, FakeEye(), 2, control=control)
+        assert tickChurn(machine.tick, 1000) <= TICK_CHURN_BUDGET
+
+        # And steer to every result
+        budget = CONTROL_CHURN_BUDGET if useControl else DETECTION_CHURN_BUDGET
+        machine.state = Align(vehicle, seen, Conductor(), 2, control)
+        assert tickChurn(machine.tick, 1000) <= budget
+        machine.state = Touchdown(vehicle, seen, 2, control=control)
+        assert tickChurn(machine.tick, 1000) <= budget
@@ -0,0 +1,51 @@
+from pathlib import Path
+from poltergeist import Ok, Err
+from models import ModelSpec, discover
+from core import PadType
+
+RESULTS = Path(__file__).resolve().parents[2].joinpath("eye", "ML", "results")
+
+def test_discover():
+    models = discover(RESULTS)
+    assert "conversion_result_27" in models
+
+    model = models["conversion_result_27"]
+    assert model.numClasses == 7
+    assert model.intoPadType(6) == PadType.padCenter
+    assert model.intoPadType(7) is None
+    assert model.xmlPath is not None and model.xmlPath.name == "best.xml"
+
+    # 6 class models don't know about pad centers
+    assert not models["conversion_result_17"].hasPad(PadType.padCenter)
+    assert models["conversion_result_17"].anchors[0] == 4.3203125
+
+def test_validation():
+    config = {
+        "nn_config": {
+            "input_size": "416x416",
+            "NN_specific_metadata": {
+                "classes": 2,
+                "anchors": [10.0, 13.0, 16.0, 30.0],
+                "anchor_masks": { "side13": [0, 1] }
+            }
+        },
+        "mappings": { "labels": ["bottle_dropoff", "bottle pickup"] }
+    }
+    assert isinstance(ModelSpec.parse("test", Path("test.json"), config, None, None), Ok)
+
+    config["mappings"]["labels"] = ["bottle dropoff", "bottle"]
+    assert isinstance(ModelSpec.parse("test", Path("test.json"), config, None, None), Err)
+
+    config["mappings"]["labels"] = ["bottle dropoff"]
+    assert isinstance(ModelSpec.parse("test", Path("test.json"), config, None, None), Err)
+
+    config["mappings"]["labels"] = ["bottle dropoff", "bottle pickup"]
+    config["nn_config"]["NN_specific_metadata"]["anchor_masks"] = { "side13": [0, 2] }
+    assert isinstance(ModelSpec.parse("test", Path("test.json"), config, None, None), Err)
+
+def test_shippedModel():
+    # main refuses to start without the metadata of the blob it runs
+    model = ModelSpec.load(Path(__file__).resolve().parents[1].joinpath("assets", "detection_model.blob")).unwrap()
+    assert model.name == "detection_model"
+    assert model.numClasses == 7
+    assert model.hasPad(PadType.padCenter)
@@ -0,0 +1,39 @@
+from optics import PadType, PixelCoords, PixelDetection, filterDetections
+from postprocess import selectDetections
+import numpy as np
+
+def detection(padType: PadType, confidence: float, bbox) -> PixelDetection:
+    center = PixelCoords((bbox[0] + bbox[2]) / 2, (bbox[1] + bbox[3]) / 2)
+    return PixelDetection(padType, center, confidence, bbox=bbox)
+
+def test_selectDetections():
+    boxes = np.array([
+        [0.1, 0.1, 0.5, 0.5], # A pad
+        [0.12, 0.1, 0.5, 0.52], # The same pad, with another label
+        [0.2, 0.2, 0.3, 0.3], # Its printed label
+        [0.28, 0.28, 0.32, 0.32], # Its center
+        [0.29, 0.29, 0.33, 0.33], # Its center again, less confident
+        [0.7, 0.7, 0.9, 0.9], # Another pad, too unconfident
+        [0.78, 0.78, 0.82, 0.82] # A center with no pad around it
+    ])
+    scores = np.array([0.9, 0.7, 0.8, 0.6, 0.5, 0.3, 0.45])
+    thresholds = np.array([0.5, 0.5, 0.5, 0.4, 0.4, 0.5, 0.4])
+    isCenter = np.array([False, False, False, True, True, False, True])
+    keep = selectDetections(boxes, scores, thresholds, isCenter)
+    assert keep.tolist() == [True, False, False, True, False, False, True]
+
+    # Centers of two different pads are both kept
+    boxes = np.array([[0.0, 0.0, 0.4, 0.4], [0.6, 0.6, 1.0, 1.0], [0.18, 0.18, 0.22, 0.22], [0.78, 0.78, 0.82, 0.82]])
+    keep = selectDetections(boxes, np.array([0.9, 0.9, 0.5, 0.6]), np.full(4, 0.4), np.array([False, False, True, True]))
+    assert keep.all()
+
+def test_filterDetections():
+    assert filterDetections([]) == []
+
+    pad = detection(PadType.medkitPickup, 0.9, (0.1, 0.1, 0.5, 0.5))
+    mislabeled = detection(PadType.medkitDropoff, 0.6, (0.11, 0.1, 0.5, 0.5))
+    center = detection(PadType.padCenter, 0.45, (0.28, 0.28, 0.32, 0.32))
+    unsure = detection(PadType.smoresPickup, 0.5, (0.6, 0.6, 0.9, 0.9))
+    unboxed = PixelDetection(PadType.bottlePickup, PixelCoords(0.5, 0.5), 0.9)
+    result = filterDetections([pad, mislabeled, center, unsure, unboxed])
+    assert result == [pad, center, unboxed]
@@ -0,0 +1,51 @@
+from constants import PREDICT_LATENCY, PREDICT_TIMEOUT
+from predict import TargetPredictor, vehicleVelocity
+
+class FakeVehicle:
+    def __init__(self, velocity) -> None:
+        self.velocity = velocity
+
+def test_vehicleVelocity():
+    assert vehicleVelocity(FakeVehicle([1.0, 2.0, 0.5])) == (2.0, 1.0)
+    assert vehicleVelocity(FakeVehicle([None, None, None])) == (0.0, 0.0)
+    assert vehicleVelocity(FakeVehicle(None)) == (0.0, 0.0)
+
+def test_predictBetweenFrames():
+    predictor = TargetPredictor()
+    assert predictor.predict(0.0, (0.0, 0.0)) is None
+
+    # Flying north at 1 m/s towards a pad 3 m ahead, seen at 10 FPS and
+    # predicted at 50 Hz. Every detection is PREDICT_LATENCY old.
+    velocity = (0.0, 1.0)
+    errors = []
+    for i in range(100):
+        now = 100.0 + i * 0.02
+        truth = 3.0 - (now - 100.0)
+        if i % 5 == 0:
+            seen = truth + (velocity[1] * PREDICT_LATENCY)
+            predictor.update((0.0, seen), now, velocity)
+        predicted = predictor.predict(now, velocity)
+        assert predicted is not None
+        errors.append(abs(predicted[1] - truth))
+        # Steering to the last detection would be off by this
+        assert abs(seen - truth) >= abs(predicted[1] - truth) - 1e-9
+    assert max(errors) < 1e-6
+
+def test_predictCorrects():
+    predictor = TargetPredictor()
+    # The AV thinks it's hovering, but drifts south at 0.5 m/s
+    for i in range(200):
+        now = i * 0.1
+        truth = 2.0 + 0.5 * now
+        predictor.update((0.0, truth + 0.5 * -PREDICT_LATENCY), now, (0.0, 0.0))
+    predicted = predictor.predict(20.0, (0.0, 0.0))
+    assert predicted is not None and abs(predicted[1] - (2.0 + 0.5 * 20.0)) < 0.05
+
+def test_predictTimeout():
+    predictor = TargetPredictor()
+    predictor.update((1.0, 1.0), 10.0, (0.0, 0.0))
+    assert predictor.predict(10.0 + PREDICT_TIMEOUT / 2, (0.0, 0.0)) is not None
+    assert predictor.predict(10.0 + PREDICT_TIMEOUT * 2, (0.0, 0.0)) is None
+    # Seen again much later, it starts over from the detection
+    predictor.update((-1.0, 0.0), 20.0, (0.0, 0.0))
+    assert predictor.predict(20.0, (0.0, 0.0)) == (-1.0, 0.0)
@@ -0,0 +1,43 @@
+from http.client import HTTPConnection
+from dronekit import LocationGlobal
+from compute import LocationDetection
+from framebus import FrameBus
+from optics import PadType, PixelCoords, PixelDetection
+from preview import PreviewServer
+import json
+import os
+import numpy as np
+
+def test_preview():
+    bus = FrameBus.create("venus-test-preview-" + str(os.getpid()), (3, 64, 64), 4)
+    preview = PreviewServer.start(0, bus, maxFps=50, host="127.0.0.1").unwrap()
+    try:
+        bus.publish(np.full((3, 64, 64), 128, np.uint8), 0.0)
+        preview.publish(
+            "Descent",
+            [PixelDetection(PadType.medkitPickup, PixelCoords(0.5, 0.5), 0.9, bbox=(0.4, 0.4, 0.6, 0.6))],
+            [LocationDetection(PadType.medkitPickup, LocationGlobal(20, -30, 0), 0.9)]
+        )
+
+        client = HTTPConnection("127.0.0.1", preview.port, timeout=5)
+        client.request("GET", "/state")
+        state = json.loads(client.getresponse().read())
+        assert state["state"] == "Descent"
+        assert state["detections"][0]["pad"] == "medkit pickup"
+        assert state["blobs"][0]["lat"] == 20
+        # Nothing is encoded while nobody watches
+        assert state["preview"]["encoded"] == 0
+
+        stream = HTTPConnection("127.0.0.1", preview.port, timeout=5)
+        stream.request("GET", "/stream")
+        response = stream.getresponse()
+        assert response.getheader("Content-Type").startswith("multipart/x-mixed-replace")
+        assert response.readline() == b"--frame\r\n"
+        headers = [response.readline() for _ in range(3)]
+        length = int(headers[1].split(b":")[1])
+        jpeg = response.read(length)
+        assert jpeg[:2] == b"\xff\xd8"
+        stream.close()
+    finally:
+        preview.close()
+        bus.close()
@@ -0,0 +1,61 @@
+import numpy as np
+from framebus import FrameBus
+from core import PixelCoords, PixelDetection, PadType
+from refine import CentreRefiner, brightCentroid
+from undistort import UndistortionMap
+
+def test_brightCentroid():
+    gray = np.full((20, 20), 30, np.uint8)
+    gray[4:8, 10:14] = 220
+    assert brightCentroid(gray) == (12.0, 6.0)
+    assert brightCentroid(np.zeros((20, 20), np.uint8)) is None
+
+def test_refine():
+    bus = FrameBus.create("venus-test-refine", (3, 100, 100))
+    try:
+        frame = np.full((3, 100, 100), 20, np.uint8)
+        # A bright pad center, slightly off the NN box center
+        frame[:, 40:50, 44:54] = 240
+        bus.publish(frame, 0.0, 7)
+
+        refiner = CentreRefiner(bus)
+        detection = PixelDetection(
+            PadType.padCenter, PixelCoords(0.45, 0.45), 0.9, bbox=(0.35, 0.35, 0.55, 0.55), sequence=7
+        )
+        refinement = refiner.refine(detection)
+        # A frame which isn't on the bus isn't refined on another one
+        detection.sequence = 8
+        assert refiner.refine(detection) is None
+        refiner.stop()
+
+        assert refinement is not None
+        assert abs(refinement.center.x - 0.49) < 1e-9
+        assert abs(refinement.center.y - 0.45) < 1e-9
+        assert abs(refinement.offset.x - 0.04) < 1e-9
+    finally:
+        bus.close()
+
+def test_refineUndistorted():
+    bus = FrameBus.create("venus-test-refine-undistorted", (3, 100, 100))
+    try:
+        frame = np.full((3, 100, 100), 20, np.uint8)
+        frame[:, 40:50, 44:54] = 240
+        bus.publish(frame, 0.0, 7)
+
+        # A lens which moved everything by 0.02 to the right
+        (xs, ys) = np.meshgrid(np.linspace(0.0, 1.0, 5), np.linspace(0.0, 1.0, 5))
+        undistortion = UndistortionMap(np.stack([xs + 0.02, ys], axis=-1))
+        refiner = CentreRefiner(bus, undistortion)
+        # The Eye undistorted the centre, the box is raw
+        detection = PixelDetection(
+            PadType.padCenter, PixelCoords(0.47, 0.45), 0.9, bbox=(0.35, 0.35, 0.55, 0.55), sequence=7
+        )
+        refinement = refiner.refine(detection)
+        refiner.stop()
+
+        # The centre is in the detection coords, the offset in the raw frame
+        assert refinement is not None
+        assert abs(refinement.center.x - 0.51) < 1e-9
+        assert abs(refinement.offset.x - 0.04) < 1e-9
+    finally:
+        bus.close()
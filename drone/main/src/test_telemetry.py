@@ -0,0 +1,62 @@
+from pymavlink import mavutil
+from constants import GUIDANCE_TELEMETRY
+from telemetry import TelemetryRates, intervalOf
+
+mavlink = mavutil.mavlink
+
+class FakeVehicle:
+    def __init__(self) -> None:
+        self.message_factory = mavlink.MAVLink(None)
+        self.sent = []
+        self.listeners = {}
+
+    def send_mavlink(self, msg) -> None:
+        self.sent.append(msg)
+
+    def add_message_listener(self, msgType, listener) -> None:
+        self.listeners.setdefault(msgType, []).append(listener)
+
+    def remove_message_listener(self, msgType, listener) -> None:
+        self.listeners[msgType].remove(listener)
+
+    def intervals(self):
+        intervals = { int(m.param1): m.param2 for m in self.sent }
+        self.sent = []
+        return intervals
+
+def test_intervalOf():
+    assert intervalOf(50) == 20000
+    assert intervalOf(0) == -1
+    assert intervalOf(None) == 0
+
+def test_telemetry():
+    vehicle = FakeVehicle()
+    telemetry = TelemetryRates(vehicle)
+
+    # Idle keeps the defaults, nothing is asked for
+    telemetry.update("Idle")
+    assert vehicle.sent == []
+
+    telemetry.update("Descending")
+    assert all(m.command == mavlink.MAV_CMD_SET_MESSAGE_INTERVAL for m in vehicle.sent)
+    intervals = vehicle.intervals()
+    assert intervals[mavlink.MAVLINK_MSG_ID_ATTITUDE] == 1.0e6 / GUIDANCE_TELEMETRY["ATTITUDE"]
+    assert intervals[mavlink.MAVLINK_MSG_ID_RAW_IMU] == -1
+    assert len(vehicle.listeners["ATTITUDE"]) == 1
+    assert "RAW_IMU" not in vehicle.listeners
+
+    # The same profile isn't asked for again
+    telemetry.update("Aligning")
+    assert vehicle.sent == []
+
+    for _ in range(10):
+        telemetry.count(vehicle, "ATTITUDE", None)
+    measured = telemetry.measure()
+    assert measured["ATTITUDE"] > 0
+    assert measured["RANGEFINDER"] == 0
+
+    telemetry.update("Idle")
+    intervals = vehicle.intervals()
+    assert len(intervals) == len(GUIDANCE_TELEMETRY)
+    assert all(interval == 0 for interval in intervals.values())
+    assert vehicle.listeners["ATTITUDE"] == []
@@ -0,0 +1,47 @@
+from math import tan, radians
+from pathlib import Path
+from core import PixelCoords, WIDTH_FOV, HEIGHT_FOV
+from undistort import UndistortionMap
+import cv2
+import numpy as np
+
+SENSOR = (1920, 1080)
+
+def pinholeMatrix() -> np.ndarray:
+    # A camera with exactly the FOV relativeDistance assumes
+    fx = SENSOR[0] / (2 * tan(radians(WIDTH_FOV / 2)))
+    fy = SENSOR[1] / (2 * tan(radians(HEIGHT_FOV / 2)))
+    return np.array([[fx, 0, SENSOR[0] / 2], [0, fy, SENSOR[1] / 2], [0, 0, 1]])
+
+def test_identity():
+    undistortion = UndistortionMap.build(pinholeMatrix(), np.zeros(5), SENSOR, 9)
+    for (x, y) in [(0.5, 0.5), (0.0, 0.0), (0.13, 0.87), (1.0, 0.4)]:
+        corrected = undistortion.correct(PixelCoords(x, y))
+        assert abs(corrected.x - x) < 1e-9 and abs(corrected.y - y) < 1e-9
+
+def test_barrel(tmp_path: Path):
+    distortion = np.array([-0.3, 0.1, 0, 0, 0])
+    undistortion = UndistortionMap.build(pinholeMatrix(), distortion, SENSOR, 33)
+    path = tmp_path.joinpath("undistortion.npz")
+    undistortion.save(path)
+    undistortion = UndistortionMap.load(path).unwrap()
+
+    # The centre stays, barrel distortion pulled the edges in
+    center = undistortion.correct(PixelCoords(0.5, 0.5))
+    assert abs(center.x - 0.5) < 1e-9 and abs(center.y - 0.5) < 1e-9
+    edge = undistortion.correct(PixelCoords(0.95, 0.5))
+    assert edge.x > 0.95
+
+    # The lookup stays close to undistorting every point exactly
+    rng = np.random.default_rng(0)
+    for (x, y) in rng.uniform(0.05, 0.95, (50, 2)):
+        exact = cv2.undistortPoints(np.array([[[x * SENSOR[0], y * SENSOR[1]]]]), pinholeMatrix(), distortion).reshape(2)
+        exact = (0.5 + exact[0] / (2 * tan(radians(WIDTH_FOV / 2))), 0.5 + exact[1] / (2 * tan(radians(HEIGHT_FOV / 2))))
+        corrected = undistortion.correct(PixelCoords(x, y))
+        assert abs(corrected.x - exact[0]) < 2e-3 and abs(corrected.y - exact[1]) < 2e-3
+
+def test_malformed(tmp_path: Path):
+    path = tmp_path.joinpath("bad.npz")
+    np.savez(path, grid=np.zeros((4, 5, 2)))
+    assert UndistortionMap.load(path).err() is not None
+    assert UndistortionMap.load(tmp_path.joinpath("missing.npz")).err() is not None
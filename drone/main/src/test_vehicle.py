@@ -0,0 +1,122 @@
+from pymavlink import mavutil
+from dronekit import LocationGlobal
+from vehicle import MavVehicle, filterDecoding
+import socket
+import threading
+import time
+
+mavlink = mavutil.mavlink
+
+def freePort() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def fakeAutopilot(port: int, stopped: threading.Event, gotos: list) -> None:
+    """
+    Streams like an armed copter in GUIDED, and serves a mission of home
+    and one GUIDED_ENABLE for a medkit pickup pad. Guided gotos are kept
+    in `gotos`.
+    """
+    autopilot = mavutil.mavlink_connection("udpout:127.0.0.1:" + str(port), source_system=1, source_component=1)
+    mission = [
+        (mavlink.MAV_CMD_NAV_WAYPOINT, 200000000, -300000000, 10.0),
+        (92, 0, 0, 3.0)
+    ]
+    while not stopped.is_set():
+        autopilot.mav.heartbeat_send(
+            mavlink.MAV_TYPE_QUADROTOR,
+            mavlink.MAV_AUTOPILOT_ARDUPILOTMEGA,
+            mavlink.MAV_MODE_FLAG_CUSTOM_MODE_ENABLED | mavlink.MAV_MODE_FLAG_SAFETY_ARMED,
+            4, # GUIDED
+            mavlink.MAV_STATE_ACTIVE
+        )
+        autopilot.mav.attitude_send(0, 0.1, 0.2, 1.5, 0, 0, 0)
+        autopilot.mav.global_position_int_send(0, 200000000, -300000000, 25000, 15000, 0, 0, 0, 0)
+        autopilot.mav.mission_current_send(1)
+        # Nothing reads these
+        for _ in range(10):
+            autopilot.mav.raw_imu_send(0, 1, 2, 3, 4, 5, 6, 7, 8, 9)
+
+        msg = autopilot.recv_match(blocking=True, timeout=0.05)
+        while msg is not None:
+            if msg.get_type() == "MISSION_REQUEST_LIST":
+                autopilot.mav.mission_count_send(255, 0, len(mission))
+            elif msg.get_type() == "MISSION_REQUEST_INT":
+                (command, x, y, z) = mission[msg.seq]
+                autopilot.mav.mission_item_int_send(
+                    255, 0, msg.seq, mavlink.MAV_FRAME_GLOBAL_RELATIVE_ALT_INT, command, 0, 1, 0, 0, 0, 0, x, y, z
+                )
+            elif msg.get_type() == "MISSION_ITEM_INT" and msg.current == 2:
+                gotos.append(msg)
+            elif msg.get_type() == "COMMAND_LONG":
+                autopilot.mav.command_ack_send(msg.command, mavlink.MAV_RESULT_ACCEPTED)
+            msg = autopilot.recv_match(blocking=False)
+
+def test_filterDecoding():
+    sender = mavlink.MAVLink(None, srcSystem=1, srcComponent=1)
+    attitude = sender.attitude_encode(0, 0.1, 0.2, 0.3, 0, 0, 0).pack(sender)
+    sender.seq = 1
+    imu = sender.raw_imu_encode(0, 1, 2, 3, 4, 5, 6, 7, 8, 9).pack(sender)
+
+    receiver = mavlink.MAVLink(None)
+    filterDecoding(receiver, { mavlink.MAVLINK_MSG_ID_ATTITUDE })
+    decoded = receiver.parse_buffer(attitude + imu)
+    assert decoded is not None
+    assert decoded[0].get_type() == "ATTITUDE"
+    assert abs(decoded[0].pitch - 0.2) < 1e-6
+    assert decoded[1].get_type() == "UNKNOWN_" + str(mavlink.MAVLINK_MSG_ID_RAW_IMU)
+    # The header survives, packet loss is still counted
+    assert decoded[1].get_seq() == 1
+
+def test_vehicle():
+    port = freePort()
+    stopped = threading.Event()
+    gotos = []
+    autopilot = threading.Thread(target=fakeAutopilot, args=(port, stopped, gotos), daemon=True)
+    autopilot.start()
+    vehicle = MavVehicle.connect("udpin:127.0.0.1:" + str(port), timeout=5).unwrap()
+    try:
+        assert vehicle.armed
+        assert vehicle.mode.name == "GUIDED"
+        assert abs(vehicle.attitude.yaw - 1.5) < 1e-6
+        assert vehicle.location.global_frame.lat == 20
+        assert vehicle.location.global_relative_frame.alt == 15
+        assert vehicle.velocity == [0.0, 0.0, 0.0]
+
+        # Home isn't known yet, the goto is sent right away with the absolute altitude
+        start = time.monotonic()
+        vehicle.simple_goto(LocationGlobal(20.001, -30.001, 110.0))
+        assert time.monotonic() - start < 0.5
+        vehicle.waitFor(lambda: len(gotos) > 0, 5)
+        assert gotos[0].frame == mavlink.MAV_FRAME_GLOBAL_INT
+        assert gotos[0].z == 110.0
+        age = vehicle.age("ATTITUDE")
+        assert age is not None and age < 1.0
+
+        vehicle.commands.download()
+        vehicle.commands.wait_ready(timeout=5)
+        assert len(vehicle.commands) == 1
+        assert vehicle.commands[0].command == 92
+        assert vehicle.commands[0].z == 3.0
+        assert vehicle.home_location is not None and vehicle.home_location.lat == 20
+
+        altitudes = []
+        vehicle.add_attribute_listener("location.global_relative_frame", lambda v, name, value: altitudes.append(value.alt))
+        time.sleep(0.2)
+        assert altitudes[0] == 15
+        assert vehicle.discarded > 0
+        assert "RAW_IMU" not in vehicle.received
+
+        # Nothing handles acks, they still reach the listeners
+        acks = []
+        vehicle.add_message_listener("COMMAND_ACK", lambda v, name, msg: acks.append(msg.command))
+        vehicle.send_mavlink(vehicle.message_factory.command_long_encode(
+            1, 1, mavlink.MAV_CMD_MISSION_START, 0, 0, 0, 0, 0, 0, 0, 0
+        ))
+        vehicle.waitFor(lambda: len(acks) > 0, 5)
+        assert acks[0] == mavlink.MAV_CMD_MISSION_START
+    finally:
+        stopped.set()
+        vehicle.close()
+        autopilot.join()
@@ -0,0 +1,94 @@
+"""
+Lens distortion correction for detection centres. `relativeDistance` projects
+through an ideal pinhole camera with the WIDTH_FOV/HEIGHT_FOV of optics, but
+the real lens bends the image, the most towards the edges. The calibration
+(`_utils/calibrate_camera.py`) bakes the correction into a small grid over the
+preview, mapping every preview point to where the pinhole camera would have
+seen it, so correcting a detection is a bilinear lookup and no frame is ever
+remapped.
+"""
+
+from __future__ import annotations
+from math import tan, radians
+from pathlib import Path
+from poltergeist import Result, Ok, Err
+from typing import Tuple
+import numpy as np
+
+from core import PixelCoords, WIDTH_FOV, HEIGHT_FOV
+
+class UndistortionMap:
+    """
+    `grid[row, column]` holds the corrected normalized coords of the preview
+    point (column / (size - 1), row / (size - 1)).
+    """
+
+    grid: np.ndarray
+    size: int
+
+    def __init__(self, grid: np.ndarray) -> None:
+        self.grid = grid.astype(np.float64)
+        self.size = grid.shape[0]
+
+    @staticmethod
+    def build(
+            cameraMatrix: np.ndarray,
+            distortion: np.ndarray,
+            sensorSize: Tuple[int, int],
+            size: int = 33
+        ) -> UndistortionMap:
+        """
+        Builds the map from the intrinsics of the full sensor (`sensorSize` is
+        its width and height in pixels). The preview squashes the whole sensor
+        without keeping the aspect ratio, so a normalized preview point is the
+        same normalized point of the sensor.
+        """
+        import cv2 # type: ignore
+
+        steps = np.linspace(0.0, 1.0, size)
+        (u, v) = np.meshgrid(steps, steps)
+        points = np.stack([u * sensorSize[0], v * sensorSize[1]], axis=-1).reshape(-1, 1, 2)
+        # Ideal points, as tangents of the angle off the optical axis
+        ideal = cv2.undistortPoints(points.astype(np.float64), cameraMatrix, distortion).reshape(size, size, 2)
+
+        grid = np.empty((size, size, 2), np.float64)
+        grid[..., 0] = 0.5 + ideal[..., 0] / (2.0 * tan(radians(WIDTH_FOV / 2.0)))
+        grid[..., 1] = 0.5 + ideal[..., 1] / (2.0 * tan(radians(HEIGHT_FOV / 2.0)))
+        return UndistortionMap(grid)
+
+    @staticmethod
+    def load(path: Path) -> Result[UndistortionMap, Exception]:
+        """
+        This constructor will not raise exceptions.
+        """
+        try:
+            with np.load(path) as data:
+                grid = data["grid"]
+            if grid.ndim != 3 or grid.shape[0] != grid.shape[1] or grid.shape[2] != 2 or grid.shape[0] < 2:
+                return Err(ValueError("Malformed undistortion map in " + str(path)))
+            return Ok(UndistortionMap(grid))
+        except Exception as e:
+            return Err(e)
+
+    def save(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez(path, grid=self.grid)
+
+    def correct(self, coords: PixelCoords) -> PixelCoords:
+        """
+        Where the pinhole camera of `relativeDistance` would have seen a point.
+        Points outside the frame are clamped to its edge.
+        """
+        last = self.size - 1
+        gx = min(max(coords.x, 0.0), 1.0) * last
+        gy = min(max(coords.y, 0.0), 1.0) * last
+        column = min(int(gx), last - 1)
+        row = min(int(gy), last - 1)
+        fx = gx - column
+        fy = gy - row
+
+        cell = self.grid[row:row + 2, column:column + 2]
+        top = cell[0, 0] * (1.0 - fx) + cell[0, 1] * fx
+        bottom = cell[1, 0] * (1.0 - fx) + cell[1, 1] * fx
+        (x, y) = top * (1.0 - fy) + bottom * fy
+        return PixelCoords(float(x), float(y))
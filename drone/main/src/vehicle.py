@@ -0,0 +1,454 @@
+"""
+A lightweight vehicle on raw pymavlink, standing in for the dronekit Vehicle.
+dronekit decodes every message the autopilot streams and runs its listeners
+on them in Python, for attributes we never read, which competes with the
+guidance loop on the Pi.
+
+MavVehicle only has what landing.py and main.py use. Messages of the types in
+WANTED_MESSAGES are decoded by a single reader thread and kept as the latest
+value, with the (monotonic) time they were received. All other messages are
+dropped by their header, before their checksum or payload is ever looked at.
+
+The values are dronekit's own (LocationGlobal, Attitude, VehicleMode...),
+so the rest of the code can't tell the two vehicles apart.
+"""
+
+from __future__ import annotations
+from dronekit import Attitude, LocationGlobal, LocationGlobalRelative, Rangefinder, VehicleMode
+from pymavlink import mavutil
+from poltergeist import Result, Ok, Err
+from typing import Callable, Dict, List
+import threading
+import time
+
+mavlink = mavutil.mavlink
+
+# The messages MavVehicle reads, all others are dropped undecoded
+WANTED_MESSAGES = [
+    "HEARTBEAT",
+    "GLOBAL_POSITION_INT",
+    "ATTITUDE",
+    "RANGEFINDER",
+    "DISTANCE_SENSOR",
+    "VFR_HUD",
+    "GPS_RAW_INT",
+    "EKF_STATUS_REPORT",
+    "HOME_POSITION",
+    "MISSION_CURRENT",
+    "MISSION_COUNT",
+    "MISSION_ITEM_INT",
+    "COMMAND_ACK"
+]
+
+def filterDecoding(mav: mavlink.MAVLink, wanted: set[int]) -> None:
+    """
+    Makes `mav` skip decoding messages with ids not in `wanted`. They come out
+    as MAVLink_unknown, keeping their header so packet loss is still counted.
+    """
+    decode = mav.decode
+
+    def filtered(msgbuf: bytearray) -> mavlink.MAVLink_message:
+        if msgbuf[0] == mavlink.PROTOCOL_MARKER_V1:
+            (length, seq, srcSystem, srcComponent, msgId) = msgbuf[1:6]
+        else:
+            (length, seq, srcSystem, srcComponent) = (msgbuf[1], msgbuf[4], msgbuf[5], msgbuf[6])
+            msgId = msgbuf[7] | (msgbuf[8] << 8) | (msgbuf[9] << 16)
+        if msgId in wanted:
+            return decode(msgbuf)
+        m = mavlink.MAVLink_unknown(msgId, msgbuf)
+        m._header = mavlink.MAVLink_header(msgId, 0, 0, length, seq, srcSystem, srcComponent)
+        return m
+
+    mav.decode = filtered # type: ignore
+
+class MavLocations:
+    global_frame: LocationGlobal
+    global_relative_frame: LocationGlobalRelative
+
+    def __init__(self) -> None:
+        self.global_frame = LocationGlobal(None, None, None)
+        self.global_relative_frame = LocationGlobalRelative(None, None, None)
+
+class MavCommands:
+    """
+    The mission, indexed like dronekit's commands: item 0 is the first
+    waypoint after home, while `next` is the sequence number of the autopilot.
+    """
+
+    vehicle: MavVehicle
+    items: List[mavlink.MAVLink_mission_item_int_message]
+    # The mission being downloaded, None until its count arrives. It replaces
+    # `items` once complete, so a half downloaded mission is never read.
+    pending: List[mavlink.MAVLink_mission_item_int_message | None] | None
+    current: int
+    ready: threading.Event
+
+    def __init__(self, vehicle: MavVehicle) -> None:
+        self.vehicle = vehicle
+        self.items = []
+        self.pending = None
+        self.current = 0
+        self.ready = threading.Event()
+
+    @property
+    def next(self) -> int:
+        return self.current
+
+    @next.setter
+    def next(self, index: int) -> None:
+        with self.vehicle.sendLock:
+            self.vehicle.connection.waypoint_set_current_send(index)
+
+    def __len__(self) -> int:
+        return max(len(self.items) - 1, 0)
+
+    def __getitem__(self, index: int) -> mavlink.MAVLink_mission_item_int_message:
+        if index < 0 or index + 1 >= len(self.items):
+            raise IndexError("No mission item " + str(index))
+        return self.items[index + 1]
+
+    def download(self) -> None:
+        self.ready.clear()
+        self.pending = None
+        with self.vehicle.sendLock:
+            self.vehicle.connection.waypoint_request_list_send()
+
+    def wait_ready(self, timeout: float | None = None) -> None:
+        """
+        Waits for the download, asking again for any item that went missing.
+        Raises a TimeoutError like dronekit.
+        """
+        end = None if timeout is None else time.monotonic() + timeout
+        while not self.ready.wait(0.5):
+            if end is not None and time.monotonic() >= end:
+                raise TimeoutError("Timed out downloading the mission")
+            self.vehicle.requestMissing()
+
+class MavVehicle:
+    connection: mavutil.mavfile
+    sendLock: threading.Lock
+    # Notified whenever a message was handled
+    updated: threading.Condition
+    handlers: Dict[str, Callable]
+    # Called with (vehicle, type, message) after the handler, like dronekit's
+    listeners: Dict[str, List[Callable]]
+    # Called with (vehicle, name, value) when an attribute was updated
+    attributeListeners: Dict[str, List[Callable]]
+    # When every message type was last received, from time.monotonic()
+    received: Dict[str, float]
+    discarded: int
+    stopped: threading.Event
+    thread: threading.Thread
+
+    location: MavLocations
+    attitude: Attitude
+    rangefinder: Rangefinder
+    # NED in m/s, like dronekit's
+    velocity: List[float | None]
+    airspeed: float | None
+    groundspeed: float | None
+    armed: bool
+    modeName: str | None
+    home_location: LocationGlobal | None
+    commands: MavCommands
+    gpsFix: int
+    ekfPosition: bool
+
+    def __init__(self, connection: mavutil.mavfile) -> None:
+        self.connection = connection
+        self.sendLock = threading.Lock()
+        self.updated = threading.Condition()
+        self.received = {}
+        self.discarded = 0
+        self.stopped = threading.Event()
+
+        self.location = MavLocations()
+        self.attitude = Attitude(None, None, None)
+        self.rangefinder = Rangefinder(None, None)
+        self.velocity = [None, None, None]
+        self.airspeed = None
+        self.groundspeed = None
+        self.armed = False
+        self.modeName = None
+        self.home_location = None
+        self.commands = MavCommands(self)
+        self.gpsFix = 0
+        self.ekfPosition = False
+
+        self.listeners = {}
+        self.attributeListeners = {}
+        self.handlers = {
+            "HEARTBEAT": self.onHeartbeat,
+            "GLOBAL_POSITION_INT": self.onGlobalPosition,
+            "ATTITUDE": self.onAttitude,
+            "RANGEFINDER": self.onRangefinder,
+            "DISTANCE_SENSOR": self.onDistanceSensor,
+            "VFR_HUD": self.onVfrHud,
+            "GPS_RAW_INT": self.onGpsRaw,
+            "EKF_STATUS_REPORT": self.onEkfStatus,
+            "HOME_POSITION": self.onHomePosition,
+            "MISSION_CURRENT": self.onMissionCurrent,
+            "MISSION_COUNT": self.onMissionCount,
+            "MISSION_ITEM_INT": self.onMissionItem
+        }
+        filterDecoding(connection.mav, { getattr(mavlink, "MAVLINK_MSG_ID_" + name) for name in WANTED_MESSAGES })
+        self.thread = threading.Thread(target=self.readLoop, daemon=True)
+
+    @staticmethod
+    def connect(
+            connectionString: str,
+            baud: int = 115200,
+            wait_ready: bool = True,
+            rate: int = 4,
+            timeout: float | None = None
+        ) -> Result[MavVehicle, Exception]:
+        """
+        Connects like dronekit's `connect`. This waits for the first heartbeat,
+        and with `wait_ready` for the first position and attitude too, forever
+        if `timeout` is None. `rate` is what all the data streams are requested at.
+        This constructor will not raise exceptions.
+        """
+        try:
+            connection = mavutil.mavlink_connection(connectionString, baud=baud, source_system=255)
+            vehicle = MavVehicle(connection)
+            vehicle.thread.start()
+            # The autopilot only streams once asked to, and it is asked by
+            # its id, known from its first heartbeat
+            vehicle.waitFor(lambda: vehicle.modeName is not None, timeout)
+            with vehicle.sendLock:
+                connection.mav.request_data_stream_send(
+                    connection.target_system, connection.target_component, mavlink.MAV_DATA_STREAM_ALL, rate, 1
+                )
+            if wait_ready:
+                vehicle.waitFor(lambda: all(t in vehicle.received for t in ["GLOBAL_POSITION_INT", "ATTITUDE"]), timeout)
+            return Ok(vehicle)
+        except Exception as e:
+            return Err(e)
+
+    def readLoop(self) -> None:
+        while not self.stopped.is_set():
+            try:
+                msg = self.connection.recv_match(blocking=True, timeout=0.5)
+            except Exception:
+                # A garbled byte on the serial line, or a closed connection
+                continue
+            if msg is None:
+                continue
+            msgType = msg.get_type()
+            handler = self.handlers.get(msgType)
+            listeners = self.listeners.get(msgType, [])
+            # Some messages are only wanted for the listeners, like COMMAND_ACK
+            if handler is None and len(listeners) == 0:
+                self.discarded += 1
+                continue
+            if handler is not None:
+                handler(msg)
+            self.received[msgType] = time.monotonic()
+            for listener in listeners:
+                listener(self, msgType, msg)
+            with self.updated:
+                self.updated.notify_all()
+
+    def waitFor(self, condition: Callable[[], bool], timeout: float | None = None) -> None:
+        """
+        Blocks until `condition` holds, checking it after every message.
+        Raises a TimeoutError like dronekit.
+        """
+        end = None if timeout is None else time.monotonic() + timeout
+        with self.updated:
+            while not condition():
+                if end is not None and time.monotonic() >= end:
+                    raise TimeoutError("Timed out waiting for the vehicle")
+                self.updated.wait(0.5)
+
+    def age(self, msgType: str) -> float | None:
+        """
+        Seconds since a message of `msgType` was received, None if never.
+        """
+        received = self.received.get(msgType)
+        return None if received is None else time.monotonic() - received
+
+    def onHeartbeat(self, msg) -> None:
+        if not self.connection.probably_vehicle_heartbeat(msg) or msg.get_srcSystem() != self.connection.target_system:
+            return
+        armed = (msg.base_mode & mavlink.MAV_MODE_FLAG_SAFETY_ARMED) != 0
+        modeName = mavutil.mode_string_v10(msg)
+        (armedChanged, modeChanged) = (armed != self.armed, modeName != self.modeName)
+        self.armed = armed
+        self.modeName = modeName
+        # Like dronekit, these are only notified when they change
+        if armedChanged:
+            self.notifyAttribute("armed", armed)
+        if modeChanged:
+            self.notifyAttribute("mode", VehicleMode(modeName))
+
+    def onGlobalPosition(self, msg) -> None:
+        lat = msg.lat / 1.0e7
+        lon = msg.lon / 1.0e7
+        # Swapped in whole, so a reader never sees half an update
+        self.location.global_frame = LocationGlobal(lat, lon, msg.alt / 1000.0)
+        self.location.global_relative_frame = LocationGlobalRelative(lat, lon, msg.relative_alt / 1000.0)
+        self.velocity = [msg.vx / 100.0, msg.vy / 100.0, msg.vz / 100.0]
+        self.notifyAttribute("location.global_relative_frame", self.location.global_relative_frame)
+
+    def onAttitude(self, msg) -> None:
+        self.attitude = Attitude(msg.pitch, msg.yaw, msg.roll)
+
+    def onRangefinder(self, msg) -> None:
+        self.rangefinder = Rangefinder(msg.distance, msg.voltage)
+
+    def onDistanceSensor(self, msg) -> None:
+        if msg.orientation == mavlink.MAV_SENSOR_ROTATION_PITCH_270:
+            # Pointing down, in cm
+            self.rangefinder = Rangefinder(msg.current_distance / 100.0, None)
+
+    def onVfrHud(self, msg) -> None:
+        self.airspeed = msg.airspeed
+        self.groundspeed = msg.groundspeed
+
+    def onGpsRaw(self, msg) -> None:
+        self.gpsFix = msg.fix_type
+
+    def onEkfStatus(self, msg) -> None:
+        self.ekfPosition = (msg.flags & mavlink.EKF_PRED_POS_HORIZ_ABS) != 0
+
+    def onHomePosition(self, msg) -> None:
+        self.home_location = LocationGlobal(msg.latitude / 1.0e7, msg.longitude / 1.0e7, msg.altitude / 1000.0)
+
+    def onMissionCurrent(self, msg) -> None:
+        self.commands.current = msg.seq
+
+    def onMissionCount(self, msg) -> None:
+        if self.commands.ready.is_set() or self.commands.pending is not None:
+            return
+        self.commands.pending = [None] * msg.count
+        if self.requestMissing() is None:
+            self.finishMission()
+
+    def onMissionItem(self, msg) -> None:
+        pending = self.commands.pending
+        if self.commands.ready.is_set() or pending is None or msg.seq >= len(pending):
+            return
+        pending[msg.seq] = msg
+        if msg.seq == 0 and not (msg.x == 0 and msg.y == 0):
+            # The first item of an ArduPilot mission is home
+            self.home_location = LocationGlobal(msg.x / 1.0e7, msg.y / 1.0e7, msg.z)
+        if self.requestMissing() is None:
+            self.finishMission()
+
+    def finishMission(self) -> None:
+        with self.sendLock:
+            self.connection.mav.mission_ack_send(
+                self.connection.target_system, self.connection.target_component, mavlink.MAV_MISSION_ACCEPTED
+            )
+        self.commands.items = self.commands.pending # type: ignore
+        self.commands.ready.set()
+
+    def requestMissing(self) -> int | None:
+        """
+        Asks for the first mission item not yet downloaded, returning its
+        sequence number, or None if there are none.
+        """
+        pending = self.commands.pending
+        if pending is None:
+            # The count itself went missing
+            with self.sendLock:
+                self.connection.waypoint_request_list_send()
+            return -1
+        for seq in range(len(pending)):
+            if pending[seq] is None:
+                with self.sendLock:
+                    self.connection.mav.mission_request_int_send(
+                        self.connection.target_system, self.connection.target_component, seq
+                    )
+                return seq
+        return None
+
+    def add_message_listener(self, msgType: str, listener: Callable) -> None:
+        """
+        Only messages in WANTED_MESSAGES are ever decoded, and so listened to.
+        The lists are replaced rather than changed, the reader may be in one.
+        """
+        self.listeners[msgType] = self.listeners.get(msgType, []) + [listener]
+
+    def remove_message_listener(self, msgType: str, listener: Callable) -> None:
+        self.listeners[msgType] = [l for l in self.listeners.get(msgType, []) if l != listener]
+
+    def add_attribute_listener(self, name: str, listener: Callable) -> None:
+        """
+        Only "armed", "mode" and "location.global_relative_frame" are notified.
+        """
+        self.attributeListeners[name] = self.attributeListeners.get(name, []) + [listener]
+
+    def remove_attribute_listener(self, name: str, listener: Callable) -> None:
+        self.attributeListeners[name] = [l for l in self.attributeListeners.get(name, []) if l != listener]
+
+    def notifyAttribute(self, name: str, value) -> None:
+        for listener in self.attributeListeners.get(name, []):
+            listener(self, name, value)
+
+    @property
+    def message_factory(self) -> mavlink.MAVLink:
+        return self.connection.mav
+
+    def send_mavlink(self, message) -> None:
+        if hasattr(message, "target_system"):
+            # Messages are made with a target of 0, like for dronekit
+            message.target_system = self.connection.target_system
+        with self.sendLock:
+            self.connection.mav.send(message)
+
+    @property
+    def mode(self) -> VehicleMode:
+        return VehicleMode(self.modeName)
+
+    @mode.setter
+    def mode(self, mode: VehicleMode | str) -> None:
+        name = mode if isinstance(mode, str) else mode.name
+        with self.sendLock:
+            self.connection.set_mode(name)
+
+    @property
+    def is_armable(self) -> bool:
+        return self.modeName != "INITIALISING" and self.gpsFix > 1 and self.ekfPosition
+
+    def arm(self, wait: bool = True, timeout: float | None = None) -> None:
+        with self.sendLock:
+            self.connection.arducopter_arm()
+        if wait:
+            self.waitFor(lambda: self.armed, timeout)
+
+    def simple_goto(self, location: LocationGlobal | LocationGlobalRelative, airspeed: float | None = None) -> None:
+        """
+        Flies to `location` in GUIDED, like dronekit. A LocationGlobal is sent
+        with its absolute altitude, so this never waits for home. It's called
+        every tick of the main loop.
+        """
+        if isinstance(location, LocationGlobalRelative):
+            frame = mavlink.MAV_FRAME_GLOBAL_RELATIVE_ALT_INT
+        else:
+            frame = mavlink.MAV_FRAME_GLOBAL_INT
+        with self.sendLock:
+            self.connection.mav.mission_item_int_send(
+                self.connection.target_system, self.connection.target_component,
+                0,
+                frame,
+                mavlink.MAV_CMD_NAV_WAYPOINT,
+                2, # current = 2 is a guided mode goto
+                0, 0, 0, 0, 0,
+                int(location.lat * 1.0e7), int(location.lon * 1.0e7), location.alt
+            )
+            if airspeed is not None:
+                self.connection.mav.command_long_send(
+                    self.connection.target_system, self.connection.target_component,
+                    mavlink.MAV_CMD_DO_CHANGE_SPEED,
+                    0,
+                    0, # airspeed
+                    airspeed,
+                    -1, 0, 0, 0, 0
+                )
+
+    def close(self) -> None:
+        self.stopped.set()
+        self.thread.join()
+        self.connection.close()